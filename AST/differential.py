@@ -0,0 +1,139 @@
+"""Differential check of the parser backends.
+
+Random programs, and corrupted copies of them, are parsed by both backends;
+they must either produce the same tree or both reject the input.
+
+    python -m AST.differential [--count N] [--seed S] [file ...]
+"""
+import argparse
+import random
+import sys
+
+import AST.grammar as grammar
+
+BACKENDS = ('pyparsing', 'pratt')
+_OPS = ['+', '-', '*', '/', '>=', '<=', '>', '<', '==', '!=', '&&', '||']
+_COMPARES = {'>=', '<=', '>', '<', '==', '!='}
+_NAMES = ['a', 'b', 'x1', 'total', '_tmp', 'in', 'if']
+_PIECES = _OPS + ['(', ')', ',', ':', '}', '=', '\n', ' ', '-1', '"s"', 'if', 'while', 'x', '//', '/*']
+
+
+def signature(node):
+    """Comparable form of a tree: node class, text and children."""
+    done = []
+    for child in node.walk_post():
+        count = len(child.childs)
+        childs = tuple(done[len(done) - count:])
+        del done[len(done) - count:]
+        done.append((type(child).__name__, str(child), childs))
+    return done[0]
+
+
+def outcome(prog: str, backend: str):
+    try:
+        return signature(grammar.parse(prog, backend=backend))
+    except Exception:
+        return 'rejected'
+
+
+class Generator:
+    def __init__(self, rnd: random.Random):
+        self.rnd = rnd
+
+    def name(self) -> str:
+        return self.rnd.choice(_NAMES[:5])
+
+    def atom(self, depth: int) -> str:
+        choice = self.rnd.randrange(6 if depth < 3 else 4)
+        if choice == 0:
+            return self.rnd.choice(['0', '7', '-3', '+2', '1.5', '2.', '1e3', '-4.25E-2'])
+        if choice == 1:
+            return self.rnd.choice(['"abc"', '""', '"a\\"b"'])
+        if choice in (2, 3):
+            return self.name()
+        if choice == 4:
+            return '(' + self.expr(depth + 1) + ')'
+        return self.call(depth + 1)
+
+    def call(self, depth: int) -> str:
+        params = [self.expr(depth + 1) for i in range(self.rnd.randrange(3))]
+        return self.name() + self.rnd.choice(['(', ' (']) + ', '.join(params) + ')'
+
+    def expr(self, depth: int = 0) -> str:
+        parts = [self.atom(depth)]
+        ops = _OPS
+        for i in range(self.rnd.randrange(4 if depth < 3 else 1)):
+            parts.append(self.rnd.choice(ops))
+            parts.append(self.atom(depth))
+            # Mostly avoid chained comparisons, which neither backend accepts
+            if parts[-2] in _COMPARES and self.rnd.random() < 0.9:
+                ops = [op for op in _OPS if op not in _COMPARES]
+        return self.rnd.choice([' ', '']).join(parts)
+
+    def block(self, depth: int) -> str:
+        lines = [self.stmt(depth + 1) for i in range(self.rnd.randrange(1, 3))]
+        return ' : ' + '\n '.join(lines) + self.rnd.choice([' }', '\n }'])
+
+    def stmt(self, depth: int = 0) -> str:
+        choice = self.rnd.randrange(7 if depth < 2 else 2)
+        if choice == 0:
+            return self.name() + ' = ' + self.expr()
+        if choice == 1:
+            return self.call(0)
+        if choice == 2:
+            return 'if ' + self.expr() + self.block(depth)
+        if choice == 3:
+            return 'while ' + self.expr() + self.block(depth)
+        if choice == 4:
+            return 'for ' + self.name() + ' in range(' + self.expr() + ')' + self.block(depth)
+        if choice == 5:
+            params = ', '.join(self.rnd.sample(_NAMES[:5], self.rnd.randrange(3)))
+            return 'def ' + self.name() + '(' + params + ')' + self.block(depth)
+        return self.name() + ' = ' + self.expr() + self.rnd.choice([' // note', ' /* note */'])
+
+    def program(self) -> str:
+        stmts = [self.stmt() for i in range(self.rnd.randrange(1, 6))]
+        return '\n'.join(stmts) + self.rnd.choice(['', '\n', '\n\n'])
+
+    def corrupt(self, prog: str) -> str:
+        pos = self.rnd.randrange(len(prog) + 1)
+        if self.rnd.random() < 0.5:
+            return prog[:pos] + self.rnd.choice(_PIECES) + prog[pos:]
+        return prog[:pos] + prog[pos + self.rnd.randrange(1, 4):]
+
+
+def check(prog: str) -> bool:
+    results = [outcome(prog, backend) for backend in BACKENDS]
+    if results[0] != results[1]:
+        print('MISMATCH for %r' % prog)
+        for backend, result in zip(BACKENDS, results):
+            print('  %s: %s' % (backend, result))
+        return False
+    return True
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m AST.differential')
+    parser.add_argument('--count', type=int, default=500, help='random programs to generate')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('files', nargs='*', help='source files to check as well')
+    args = parser.parse_args(argv)
+
+    generator = Generator(random.Random(args.seed))
+    progs = []
+    for path in args.files:
+        with open(path, encoding='utf-8') as f:
+            progs.append(f.read())
+    for i in range(args.count):
+        prog = generator.program()
+        progs.append(prog)
+        progs.append(generator.corrupt(prog))
+
+    failures = sum(not check(prog) for prog in progs)
+    accepted = sum(outcome(prog, 'pratt') != 'rejected' for prog in progs)
+    print('%d programs, %d accepted, %d mismatches' % (len(progs), accepted, failures))
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,16 +1,46 @@
-from contextlib import suppress
-
-import pyparsing as pp
-from pyparsing import pyparsing_common as ppc
 from AST.nodes import *
+from AST.nodes import BinOp
+
+
+def _bin_op_parse_action(s, loc, tocs):
+    node = tocs[0]
+    if not isinstance(node, AstNode):
+        node = _bin_op_parse_action(s, loc, node)
+    for i in range(1, len(tocs) - 1, 2):
+        secondNode = tocs[i + 1]
+        if not isinstance(secondNode, AstNode):
+            secondNode = _bin_op_parse_action(s, loc, secondNode)
+        node = BinOpNode(BinOp(tocs[i]), node, secondNode)
+    return node
+
+
+class _NodeParseAction:
+    # A class rather than a closure so that the parser can be pickled
+    def __init__(self, cls):
+        self.cls = cls
+
+    def __call__(self, s, loc, tocs):
+        return self.cls(*tocs)
 
 
 def _make_parser():
+    import pyparsing as pp
+    default_whitespace = ''.join(pp.ParserElement.DEFAULT_WHITE_CHARS)
+    # Newlines end statements. The default is put back once the grammar is
+    # built, so other pyparsing users are not affected.
     pp.ParserElement.setDefaultWhitespaceChars(' \t')
+    try:
+        return _build_parser(pp)
+    finally:
+        pp.ParserElement.setDefaultWhitespaceChars(default_whitespace)
+
+
+def _build_parser(pp):
+    ppc = pp.pyparsing_common
     num = pp.Regex('[+-]?\\d+\\.?\\d*([eE][+-]?\\d+)?')
     str_ = pp.QuotedString('"', escChar='\\', unquoteResults=False, convertWhitespaceEscapes=False)
     literal = num | str_
-    ident = ppc.identifier.setName('ident')
+    ident = ppc.identifier.copy().setName('ident')
 
     LPAR, RPAR = pp.Literal('(').suppress(), pp.Literal(')').suppress()
     LBRACK, RBRACK = pp.Literal("[").suppress(), pp.Literal("]").suppress()
@@ -62,7 +92,8 @@ def _make_parser():
     if_ = pp.Keyword("if").suppress() + expr + pp.Keyword(":").suppress() + stmt_list + RBRACE
     for_ = pp.Keyword("for").suppress() + for_cond + pp.Keyword(":").suppress() + stmt_list + RBRACE
     while_ = pp.Keyword("while").suppress() + expr + pp.Keyword(":").suppress() + stmt_list + RBRACE
-    def_ = pp.Keyword("def").suppress() + ident + LPAR + pp.Optional(ident + pp.ZeroOrMore(COMMA.suppress() + ident))\
+    list_body = pp.Optional(ident + pp.ZeroOrMore(COMMA + ident))
+    def_ = pp.Keyword("def").suppress() + ident + LPAR + list_body\
            + RPAR + pp.Keyword(":").suppress() + stmt_list + RBRACE
 
     stmt << (
@@ -85,25 +116,11 @@ def _make_parser():
         if getattr(parser, 'name', None) and parser.name.isidentifier():
             rule_name = parser.name
         if rule_name in ('bin_op', ):
-            def bin_op_parse_action(s, loc, tocs):
-                node = tocs[0]
-                if not isinstance(node, AstNode):
-                    node = bin_op_parse_action(s, loc, node)
-                for i in range(1, len(tocs) - 1, 2):
-                    secondNode = tocs[i + 1]
-                    if not isinstance(secondNode, AstNode):
-                        secondNode = bin_op_parse_action(s, loc, secondNode)
-                    node = BinOpNode(BinOp(tocs[i]), node, secondNode)
-                return node
-            parser.setParseAction(bin_op_parse_action)
+            parser.setParseAction(_bin_op_parse_action)
         else:
-            cls = ''.join(x.capitalize() for x in rule_name.split('_')) + 'Node'
-            with suppress(NameError):
-                cls = eval(cls)
-                if not inspect.isabstract(cls):
-                    def parse_action(s, loc, tocs):
-                        return cls(*tocs)
-                    parser.setParseAction(parse_action)
+            cls = globals().get(''.join(x.capitalize() for x in rule_name.split('_')) + 'Node')
+            if isinstance(cls, type) and issubclass(cls, AstNode) and not cls.__abstractmethods__:
+                parser.setParseAction(_NodeParseAction(cls))
 
     for var_name, value in locals().copy().items():
         if isinstance(value, pp.ParserElement):
@@ -112,8 +129,77 @@ def _make_parser():
     return start
 
 
-parser = _make_parser()
+_parser = None
+
+
+def get_parser():
+    """The pyparsing grammar, built on first use."""
+    global _parser
+    if _parser is None:
+        _parser = _make_parser()
+    return _parser
+
+
+def __getattr__(name):
+    # grammar.parser used to be built at import
+    if name == 'parser':
+        return get_parser()
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+
+def _wrap_parse_action(func):
+    import pyparsing as pp
+    return pp.Empty().setParseAction(func).parseAction[0]
+
+
+def _optional_not_matched():
+    import pyparsing as pp
+    return pp.Opt._Opt__optionalNotMatched
+
+
+def save_snapshot(path: str):
+    """Pickle the built grammar, so that a later process can load it instead of building it."""
+    import pickle
+
+    class SnapshotPickler(pickle.Pickler):
+        # pyparsing stores parse actions wrapped in a closure; pickle the
+        # action itself and wrap it again when loading. The sentinel that
+        # pyparsing compares by identity is pickled by reference.
+        def reducer_override(self, obj):
+            if obj is _optional_not_matched():
+                return _optional_not_matched, ()
+            code = getattr(obj, '__code__', None)
+            if code is not None and obj.__closure__ and 'func' in code.co_freevars \
+                    and obj.__qualname__.startswith('_trim_arity.'):
+                return _wrap_parse_action, (obj.__closure__[code.co_freevars.index('func')].cell_contents,)
+            return NotImplemented
+
+    with open(path, 'wb') as f:
+        SnapshotPickler(f, pickle.HIGHEST_PROTOCOL).dump(get_parser())
+
+
+def load_snapshot(path: str):
+    import pickle
+    global _parser
+    with open(path, 'rb') as f:
+        _parser = pickle.load(f)
+
+
+def parse(prog: str, backend: str = 'pyparsing')->StmtListNode:
+    """Parse ``prog`` with the pyparsing grammar or the hand-written 'pratt' parser."""
+    if backend == 'pratt':
+        from AST import pratt
+        return pratt.parse(str(prog))
+    if backend != 'pyparsing':
+        raise ValueError('Unknown parser backend {}'.format(backend))
+    return get_parser().parseString(str(prog))[0]
+
 
+def parse_indented(source)->StmtListNode:
+    """Parse a program whose blocks are given by indentation.
 
-def parse(prog: str)->StmtListNode:
-    return parser.parseString(str(prog))[0]
+    ``source`` is a string or an iterable of lines such as an open file; it
+    is lexed as it is read.
+    """
+    from AST import pratt
+    return pratt.parse(source, indent=True)
@@ -0,0 +1,149 @@
+"""Streaming lexer for the hand-written parser.
+
+Source is read a line at a time, from a string or any iterable of lines such
+as an open file, so only the current line (plus an unfinished block comment)
+is held in memory. Tokens are (kind, text, line, col, glued) tuples: operators
+are their own kind, and ``glued`` tells whether the token touches identifier
+characters (only set for identifiers and ':'), which pyparsing keywords
+refuse.
+
+With ``indent`` set the lexer tracks an indent stack: it emits one NEWLINE per
+non-blank line and INDENT/DEDENT when the indentation of a line grows or
+shrinks, so blocks can be written without closing braces.
+"""
+import io
+import re
+from typing import Iterable, Iterator, List, Tuple, Union
+
+NEWLINE, NUM, STR, IDENT, INDENT, DEDENT, END = 'newline', 'num', 'str', 'ident', 'indent', 'dedent', 'end'
+
+Token = Tuple[str, str, int, int, bool]
+
+_TOKEN = re.compile(r'''
+    (?P<skip>[ \t]+|/\*(?:[^*]|\*(?!/))*\*/|//(?:\\\n|[^\n])*)
+  | (?P<newline>\r*\n)
+  | (?P<num>\d+\.?\d*(?:[eE][+-]?\d+)?)
+  | (?P<str>"(?:[^"\\\n\r]|\\.)*")
+  | (?P<ident>[^\W\d]\w*)
+  | (?P<op>>=|<=|==|!=|&&|\|\||[-+*/<>=(),:}])
+''', re.VERBOSE)
+_KEYWORD_CHARS = frozenset('abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_$')
+_TAB_SIZE = 8
+
+
+class ParseError(Exception):
+    def __init__(self, message: str, line: int, col: int):
+        self.line = line
+        self.col = col
+        super().__init__('%s (line:%d, col:%d)' % (message, line, col))
+
+
+def _unfinished_comment(text: str, pos: int, match) -> bool:
+    # A block comment, or a // comment continued by a trailing backslash,
+    # that goes on in the next line
+    if text.startswith('/*', pos):
+        return match.lastgroup != 'skip'
+    return text.startswith('//', pos) and match.end() == len(text) and text.endswith('\\\n')
+
+
+def _indentation(text: str, pos: int) -> int:
+    """Width of the whitespace before ``pos`` on its line."""
+    width = 0
+    for char in text[text.rfind('\n', 0, pos) + 1:pos]:
+        width += _TAB_SIZE - width % _TAB_SIZE if char == '\t' else 1
+    return width
+
+
+def _lex(text: str, first_line: int):
+    """Tokens of ``text`` and the offset of the first one, or None when it ends inside a comment."""
+    tokens = []
+    first = None
+    line, line_start = first_line, 0
+    pos = 0
+    end = len(text)
+    while pos < end:
+        match = _TOKEN.match(text, pos)
+        if match is None:
+            raise ParseError('Unexpected character %r' % text[pos], line, pos - line_start + 1)
+        if text[pos] == '/' and _unfinished_comment(text, pos, match):
+            return None
+        start = pos
+        pos = match.end()
+        kind = match.lastgroup
+        if kind == 'skip':
+            if text[start] == '/' and '\n' in match.group():
+                line += text.count('\n', start, pos)
+                line_start = text.rfind('\n', start, pos) + 1
+            continue
+        if first is None:
+            first = start
+        token_text = match.group()
+        if kind == 'op':
+            kind = token_text
+        glued = (kind == IDENT or kind == ':') and (
+            start > 0 and text[start - 1] in _KEYWORD_CHARS or pos < end and text[pos] in _KEYWORD_CHARS)
+        tokens.append((kind, token_text, line, start - line_start + 1, glued))
+        if kind == NEWLINE:
+            line += 1
+            line_start = pos
+    return tokens, first
+
+
+def _indent_tokens(stack: List[int], width: int, token: Token) -> List[Token]:
+    line = token[2]
+    if width > stack[-1]:
+        stack.append(width)
+        return [(INDENT, '', line, 1, False)]
+    dedents = []
+    while width < stack[-1]:
+        stack.pop()
+        dedents.append((DEDENT, '', line, 1, False))
+    if width != stack[-1]:
+        raise ParseError('Unindent does not match any outer indentation level', line, width + 1)
+    return dedents
+
+
+def token_lines(source: Union[str, Iterable[str]], indent: bool = False) -> Iterator[List[Token]]:
+    """Tokens of ``source``, one list per line read, the last ending with END.
+
+    A line that ends inside a comment is lexed together with the lines
+    that complete it.
+    """
+    lines = io.StringIO(source) if isinstance(source, str) else source
+    stack = [0]
+    text = ''
+    first_line = line_no = 0
+    for line in lines:
+        line_no += 1
+        if not text:
+            first_line = line_no
+        text += line
+        lexed = _lex(text, first_line)
+        if lexed is None:
+            continue
+        tokens, first = lexed
+        if indent:
+            if not tokens or tokens[0][0] == NEWLINE:
+                # Blank and comment-only lines do not end statements
+                text = ''
+                continue
+            if tokens[-1][0] != NEWLINE:
+                last = tokens[-1]
+                tokens.append((NEWLINE, '', last[2], last[3] + len(last[1]), False))
+            tokens[:0] = _indent_tokens(stack, _indentation(text, first), tokens[0])
+        text = ''
+        if tokens:
+            yield tokens
+    if text:
+        raise ParseError('Unterminated comment', first_line, 1)
+    tail = []
+    while len(stack) > 1:
+        stack.pop()
+        tail.append((DEDENT, '', line_no + 1, 1, False))
+    tail.append((END, '', line_no + 1, 1, False))
+    yield tail
+
+
+def tokenize(source: Union[str, Iterable[str]], indent: bool = False) -> Iterator[Token]:
+    for tokens in token_lines(source, indent):
+        yield from tokens
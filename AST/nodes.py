@@ -1,16 +1,39 @@
+from __future__ import annotations
+import sys
 from abc import ABC, abstractmethod
-from typing import Callable, Tuple, Optional, Union
-from enum import Enum
-import inspect
+
+# Annotations are not evaluated, so typing is only needed by type checkers
+# and is kept off the import path
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing import Callable, Iterator, TextIO, Tuple, Optional, Union
+
+# Traversal events
+ENTER, EXIT = 'enter', 'exit'
 
 
 class AstNode(ABC):
+    # Nodes have no __dict__; the rare properties that are not fields live in
+    # a side table that is only allocated when one is set
+    __slots__ = ('row', 'line', '_props')
+
     def __init__(self, row: Optional[int] = None, line: Optional[int] = None, **props):
-        super().__init__()
         self.row = row
         self.line = line
-        for k, v in props.items():
-            setattr(self, k, v)
+        self._props = props or None
+
+    def __getattr__(self, name):
+        # Only called when there is no such field
+        props = object.__getattribute__(self, '_props') if name != '_props' else None
+        if props is None or name not in props:
+            raise AttributeError('{} has no attribute {!r}'.format(type(self).__name__, name))
+        return props[name]
+
+    def set_prop(self, name: str, value) -> None:
+        """Attach a property that is not one of the node's fields."""
+        if self._props is None:
+            self._props = {}
+        self._props[name] = value
 
     @property
     def childs(self) -> Tuple['AstNode', ...]:
@@ -20,68 +43,145 @@ class AstNode(ABC):
     def __str__(self) -> str:
         pass
 
+    # Traversals use an explicit stack, so depth is not limited by the
+    # recursion limit. ``prune(node)`` returning True skips the children of
+    # ``node``.
+
+    def events(self, prune: Optional[Callable[['AstNode'], bool]] = None) \
+            -> Iterator[Tuple[str, 'AstNode']]:
+        """(ENTER, node) and (EXIT, node) pairs in depth-first order."""
+        stack = [(ENTER, self)]
+        while stack:
+            event, node = stack.pop()
+            yield event, node
+            if event is ENTER:
+                stack.append((EXIT, node))
+                if prune is None or not prune(node):
+                    stack.extend((ENTER, child) for child in reversed(node.childs))
+
+    def walk(self, prune: Optional[Callable[['AstNode'], bool]] = None) -> Iterator['AstNode']:
+        """Nodes in pre-order."""
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            yield node
+            if prune is None or not prune(node):
+                stack.extend(reversed(node.childs))
+
+    def walk_post(self, prune: Optional[Callable[['AstNode'], bool]] = None) -> Iterator['AstNode']:
+        """Nodes in post-order."""
+        for event, node in self.events(prune):
+            if event is EXIT:
+                yield node
+
+    def tree_lines(self, max_depth: Optional[int] = None) -> Iterator[str]:
+        """Lines of ``tree`` one at a time; subtrees below ``max_depth`` are elided."""
+        # Entries are (node, prefix of its line, prefix of its children's lines, depth)
+        stack = [(self, '', '', 0)]
+        while stack:
+            node, first, rest, depth = stack.pop()
+            childs = node.childs
+            if max_depth is not None and depth >= max_depth and childs:
+                yield first + str(node) + ' ...'
+                continue
+            yield first + str(node)
+            last = len(childs) - 1
+            for i in range(last, -1, -1):
+                if i == last:
+                    stack.append((childs[i], rest + '└ ', rest + '  ', depth + 1))
+                else:
+                    stack.append((childs[i], rest + '├ ', rest + '│ ', depth + 1))
+
+    def print_tree(self, file: Optional[TextIO] = None, max_depth: Optional[int] = None) -> None:
+        """Write ``tree`` line by line without building it."""
+        file = sys.stdout if file is None else file
+        for line in self.tree_lines(max_depth):
+            file.write(line)
+            file.write('\n')
+
     @property
     def tree(self) -> [str, ...]:
-        res = [str(self)]
-        childs_temp = self.childs
-        for i, child in enumerate(childs_temp):
-            ch0, ch = '├', '│'
-            if i == len(childs_temp) - 1:
-                ch0, ch = '└', ' '
-            res.extend(((ch0 if j == 0 else ch) + ' ' + s for j, s in enumerate(child.tree)))
-        return res
+        return list(self.tree_lines())
 
     def visit(self, func: Callable[['AstNode'], None]) -> None:
-        func(self)
-        map(func, self.childs)
+        """Call ``func`` on this node and all its descendants, in pre-order."""
+        for node in self.walk():
+            func(node)
 
     def __getitem__(self, index):
         return self.childs[index] if index < len(self.childs) else None
 
 
 class ExprNode(AstNode):
-    pass
+    __slots__ = ()
 
 
 class LiteralNode(ExprNode):
+    # The source text is only kept when it differs from repr(value)
+    __slots__ = ('_literal', 'value')
+
     def __init__(self, literal: str,
                  row: Optional[int] = None, line: Optional[int] = None, **props):
         super().__init__(row=row, line=line, **props)
-        self.literal = literal
         self.value = eval(literal)
+        self._literal = None if repr(self.value) == literal else literal
+
+    @property
+    def literal(self) -> str:
+        return repr(self.value) if self._literal is None else self._literal
 
     def __str__(self) -> str:
         return '{0} ({1})'.format(self.literal, type(self.value).__name__)
 
 
 class IdentNode(ExprNode):
+    # depth and slot locate the symbol once the semantic analyzer has
+    # resolved the name: scopes up from the one using it, index in that scope
+    __slots__ = ('name', 'depth', 'slot')
+
     def __init__(self, name: str,
                  row: Optional[int] = None, line: Optional[int] = None, **props):
         super().__init__(row=row, line=line, **props)
         self.name = str(name)
+        self.depth = None
+        self.slot = None
 
     def __str__(self) -> str:
         return str(self.name)
 
 
-class BinOp(Enum):
-    ADD = '+'
-    SUB = '-'
-    MUL = '*'
-    DIV = '/'
-    GE = '>='
-    LE = '<='
-    NEQUALS = '<>'
-    EQUALS = '=='
-    GT = '>'
-    LT = '<'
-    BIT_AND = '&'
-    BIT_OR = '|'
-    LOGICAL_AND = '&&'
-    LOGICAL_OR = '||'
+def __getattr__(name: str):
+    # BinOp is defined on first use: importing enum costs several times as
+    # much as the rest of this module. Star imports do not include it, so
+    # the parsers import it by name.
+    if name != 'BinOp':
+        raise AttributeError('module %r has no attribute %r' % (__name__, name))
+    from enum import Enum
+
+    global BinOp
+
+    class BinOp(Enum):
+        ADD = '+'
+        SUB = '-'
+        MUL = '*'
+        DIV = '/'
+        GE = '>='
+        LE = '<='
+        NEQUALS = '!='
+        EQUALS = '=='
+        GT = '>'
+        LT = '<'
+        BIT_AND = '&'
+        BIT_OR = '|'
+        LOGICAL_AND = '&&'
+        LOGICAL_OR = '||'
+
+    return BinOp
 
 
 class BinOpNode(ExprNode):
+    __slots__ = ('op', 'arg1', 'arg2')
+
     def __init__(self, op: BinOp, arg1: ExprNode, arg2: ExprNode,
                  row: Optional[int] = None, line: Optional[int] = None, **props):
         super().__init__(row=row, line=line, **props)
@@ -98,10 +198,12 @@ class BinOpNode(ExprNode):
 
 
 class StmtNode(ExprNode):
-    pass
+    __slots__ = ()
 
 
 class CallNode(StmtNode):
+    __slots__ = ('func', 'params')
+
     def __init__(self, func: IdentNode, *params: Tuple[ExprNode],
                  row: Optional[int] = None, line: Optional[int] = None, **props):
         super().__init__(row=row, line=line, **props)
@@ -118,6 +220,8 @@ class CallNode(StmtNode):
 
 
 class AssignNode(StmtNode):
+    __slots__ = ('var', 'val')
+
     def __init__(self, var: IdentNode, val: ExprNode,
                  row: Optional[int] = None, line: Optional[int] = None, **props):
         super().__init__(row=row, line=line, **props)
@@ -133,6 +237,8 @@ class AssignNode(StmtNode):
 
 
 class IfNode(StmtNode):
+    __slots__ = ('cond', 'then_stmt', 'else_stmt')
+
     def __init__(self, cond: ExprNode, then_stmt: StmtNode, else_stmt: Optional[StmtNode] = None,
                  row: Optional[int] = None, line: Optional[int] = None, **props):
         super().__init__(row=row, line=line, **props)
@@ -148,6 +254,8 @@ class IfNode(StmtNode):
         return 'if'
 
 class WhileNode(StmtNode):
+    __slots__ = ('cond', 'stmt')
+
     def __init__(self, cond: ExprNode, stmt: StmtNode,
                  row: Optional[int] = None, line: Optional[int] = None, **props):
         super().__init__(row=row, line=line, **props)
@@ -163,6 +271,8 @@ class WhileNode(StmtNode):
 
 
 class DefNode(StmtNode):
+    __slots__ = ('def_name', 'args', 'stmt')
+
     def __init__(self, def_name: IdentNode, args: AstNode, stmt: StmtNode,
                  row: Optional[int] = None, line: Optional[int] = None, **props):
         super().__init__(row=row, line=line, **props)
@@ -179,6 +289,8 @@ class DefNode(StmtNode):
 
 
 class ForNode(StmtNode):
+    __slots__ = ('init', 'for_in', 'body')
+
     def __init__(self, init: Union[StmtNode, None],
                  for_in,
                  body: Union[StmtNode, None],
@@ -197,6 +309,8 @@ class ForNode(StmtNode):
 
 
 class StmtListNode(StmtNode):
+    __slots__ = ('exprs',)
+
     def __init__(self, *exprs: StmtNode,
                  row: Optional[int] = None, line: Optional[int] = None, **props):
         super().__init__(row=row, line=line, **props)
@@ -211,6 +325,8 @@ class StmtListNode(StmtNode):
 
 
 class ListBodyNode(StmtNode):
+    __slots__ = ('exprs',)
+
     def __init__(self, *exprs: StmtNode,
                  row: Optional[int] = None, line: Optional[int] = None, **props):
         super().__init__(row=row, line=line, **props)
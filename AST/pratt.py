@@ -0,0 +1,238 @@
+"""Hand-written parser producing the same trees as the pyparsing grammar.
+
+The source is split by a single regular expression into tokens and parsed by
+recursive descent, with expressions handled by precedence climbing instead
+of one grammar rule per precedence level. The accepted language mirrors
+AST.grammar, quirks included: statements end at a newline or at the next
+statement, a block's first statement must be on the line of its colon, a
+sign is part of a number literal only when written right before the digits,
+and comparisons do not chain.
+"""
+from typing import Iterable, Union
+from AST.nodes import *
+from AST.nodes import BinOp
+from AST.lexer import ParseError, Token, token_lines, NEWLINE, NUM, STR, IDENT, INDENT, DEDENT, END
+
+# Binary operator precedence, loosest first. Comparisons do not chain.
+_LEVELS = {
+    '||': 1,
+    '&&': 2,
+    '==': 3, '!=': 3,
+    '>=': 4, '<=': 4, '>': 4, '<': 4,
+    '+': 5, '-': 5,
+    '*': 6, '/': 6,
+}
+_NON_ASSOCIATIVE = {3, 4}
+# Consumed tokens are dropped once this many pile up outside a statement
+_COMPACT_AT = 1024
+
+
+class Parser:
+    """Parses a token stream, reading the lexer only as far as it needs to."""
+
+    def __init__(self, source: Union[str, Iterable[str]], indent: bool = False):
+        self.indent = indent
+        self.lines = token_lines(source, indent)
+        self.tokens = []
+        self.index = 0
+        # Statements that may still backtrack; their tokens must be kept
+        self.marks = 0
+
+    def peek(self, offset: int = 0) -> Token:
+        i = self.index + offset
+        tokens = self.tokens
+        if i < len(tokens):
+            return tokens[i]
+        while i >= len(tokens):
+            # Past the end the END token repeats
+            tokens.extend(next(self.lines, tokens[-1:]))
+        return tokens[i]
+
+    @property
+    def kind(self) -> str:
+        return self.peek()[0]
+
+    def error(self, expected: str):
+        kind, text, line, col, glued = self.peek()
+        found = text.strip() or ('end of text' if kind == END else kind)
+        raise ParseError('Expected %s, found %r' % (expected, found), line, col)
+
+    def expect(self, kind: str) -> str:
+        token = self.peek()
+        if token[0] != kind:
+            self.error(repr(kind))
+        self.index += 1
+        return token[1]
+
+    def at_keyword(self, word: str) -> bool:
+        # pyparsing keywords also refuse to touch identifier characters, so
+        # 'if a > b: ...' does not parse
+        kind, text, line, col, glued = self.peek()
+        return text == word and kind in (IDENT, word) and not glued
+
+    def keyword(self, word: str):
+        if not self.at_keyword(word):
+            kind, text, line, col, glued = self.peek()
+            if text == word and glued:
+                raise ParseError('Expected a space before %r' % word, line, col)
+            self.error(repr(word))
+        self.index += 1
+
+    # Statements
+
+    def program(self) -> StmtListNode:
+        stmts = self.stmt_list()
+        if self.kind != END:
+            self.error('end of text')
+        return stmts
+
+    def stmt_list(self) -> StmtListNode:
+        stmts = []
+        while self.kind == IDENT:
+            stmts.append(self.stmt())
+            while self.kind == NEWLINE:
+                self.index += 1
+            if not self.marks and self.index >= _COMPACT_AT:
+                del self.tokens[:self.index]
+                self.index = 0
+        return StmtListNode(*stmts)
+
+    def block(self) -> StmtListNode:
+        """Statements after ':' up to the closing brace.
+
+        With indentation the block takes the statements on the line of the
+        colon and the lines indented below it; a brace may still close it
+        on the colon line.
+        """
+        self.keyword(':')
+        if not self.indent:
+            stmts = self.stmt_list()
+            self.expect('}')
+            return stmts
+        stmts = []
+        while self.kind == IDENT:
+            stmts.append(self.stmt())
+        if self.kind == '}':
+            self.index += 1
+        elif self.kind == NEWLINE and self.peek(1)[0] == INDENT:
+            self.index += 2
+            stmts.extend(self.stmt_list().exprs)
+            self.expect(DEDENT)
+        elif not stmts:
+            self.error('an indented block')
+        return StmtListNode(*stmts)
+
+    def stmt(self) -> StmtNode:
+        word = self.peek()[1]
+        rule = self.compound_rules.get(word)
+        if rule is None or not self.at_keyword(word) or self.peek(1)[0] == '=':
+            return self.simple_stmt()
+        if self.peek(1)[0] != '(':
+            return rule(self)
+        # Keywords are not reserved: 'if(a)' may be a call
+        start = self.index
+        self.marks += 1
+        try:
+            return rule(self)
+        except ParseError as error:
+            self.index = start
+            try:
+                return self.simple_stmt()
+            except ParseError:
+                raise error
+        finally:
+            self.marks -= 1
+
+    def simple_stmt(self) -> StmtNode:
+        if self.peek(1)[0] == '=':
+            var = IdentNode(self.expect(IDENT))
+            self.index += 1
+            return AssignNode(var, self.expr())
+        return self.call()
+
+    def if_(self) -> IfNode:
+        self.keyword('if')
+        cond = self.expr()
+        return IfNode(cond, self.block())
+
+    def for_(self) -> ForNode:
+        self.keyword('for')
+        init = IdentNode(self.expect(IDENT))
+        self.keyword('in')
+        for_in = self.call()
+        return ForNode(init, for_in, self.block())
+
+    def while_(self) -> WhileNode:
+        self.keyword('while')
+        cond = self.expr()
+        return WhileNode(cond, self.block())
+
+    def def_(self) -> DefNode:
+        self.keyword('def')
+        name = IdentNode(self.expect(IDENT))
+        self.expect('(')
+        params = []
+        if self.kind == IDENT:
+            params.append(IdentNode(self.expect(IDENT)))
+            while self.kind == ',':
+                self.index += 1
+                params.append(IdentNode(self.expect(IDENT)))
+        self.expect(')')
+        return DefNode(name, ListBodyNode(*params), self.block())
+
+    compound_rules = {'if': if_, 'for': for_, 'while': while_, 'def': def_}
+
+    # Expressions
+
+    def call(self) -> CallNode:
+        func = IdentNode(self.expect(IDENT))
+        self.expect('(')
+        params = []
+        if self.kind != ')':
+            params.append(self.expr())
+            while self.kind == ',':
+                self.index += 1
+                params.append(self.expr())
+        self.expect(')')
+        return CallNode(func, *params)
+
+    def expr(self, min_level: int = 1) -> ExprNode:
+        node = self.atom()
+        last = None
+        while True:
+            op = self.kind
+            level = _LEVELS.get(op)
+            if level is None or level < min_level or last is not None and (
+                    level > last or level == last and level in _NON_ASSOCIATIVE):
+                return node
+            self.index += 1
+            node = BinOpNode(BinOp(op), node, self.expr(level + 1))
+            last = level
+
+    def atom(self) -> ExprNode:
+        kind, text, line, col, glued = self.peek()
+        if kind == NUM or kind == STR:
+            self.index += 1
+            return LiteralNode(text)
+        if kind == IDENT:
+            if self.peek(1)[0] == '(':
+                return self.call()
+            self.index += 1
+            return IdentNode(text)
+        if kind == '(':
+            self.index += 1
+            node = self.expr()
+            self.expect(')')
+            return node
+        if kind in ('+', '-'):
+            # A sign written right before the digits belongs to the literal
+            following = self.peek(1)
+            if following[0] == NUM and following[2] == line and following[3] == col + 1:
+                self.index += 2
+                return LiteralNode(text + following[1])
+        self.error('expression')
+
+
+def parse(source: Union[str, Iterable[str]], indent: bool = False) -> StmtListNode:
+    """Parse a string or an iterable of lines, such as an open file."""
+    return Parser(source, indent).program()
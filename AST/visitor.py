@@ -0,0 +1,46 @@
+"""Node visitors with cached type dispatch.
+
+A visitor handles a node of class ``C`` with its ``visit_C`` method. The
+handler for a node type is resolved once per visitor class and cached: the
+node's classes are tried in MRO order, so ``visit_ExprNode`` covers every
+expression without a handler of its own, and ``generic_visit`` is used when
+nothing matches. Handlers are looked up on the class, so they must be plain
+methods, and a handler added to a class after it has visited a node type is
+only seen after ``clear_dispatch_cache()``.
+"""
+
+
+class NodeVisitor:
+    _dispatch = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._dispatch = {}
+
+    @classmethod
+    def handler(cls, node_type: type):
+        """The function handling ``node_type`` nodes, called as ``handler(visitor, node)``."""
+        handler = cls._dispatch.get(node_type)
+        if handler is None:
+            for klass in node_type.__mro__:
+                handler = getattr(cls, 'visit_' + klass.__name__, None)
+                if handler is not None:
+                    break
+            else:
+                handler = cls.generic_visit
+            cls._dispatch[node_type] = handler
+        return handler
+
+    @classmethod
+    def clear_dispatch_cache(cls):
+        cls._dispatch.clear()
+
+    def visit(self, node):
+        try:
+            handler = self._dispatch[type(node)]
+        except KeyError:
+            handler = self.handler(type(node))
+        return handler(self, node)
+
+    def generic_visit(self, node):
+        raise Exception('No visit_{} method'.format(type(node).__name__))
@@ -1,24 +1,25 @@
-from AST.grammar import *
-from Semantic.symbols import *
+import sys
 
+from AST.nodes import *
+from AST.visitor import NodeVisitor
+from Semantic.symbols import *
 
-class NodeVisitor(object):
-    def visit(self, node):
-        method_name = 'visit_' + type(node).__name__
-        visitor = getattr(self, method_name, self.generic_visit)
-        return visitor(node)
 
-    def generic_visit(self, node):
-        raise Exception('No visit_{} method'.format(type(node).__name__))
+class ScopedSymbolTable(object):
+    """Symbols of one scope, in definition order; a symbol's index is its slot.
 
+    Names are interned and lookups walk the enclosing scopes in a loop
+    without any I/O. Define and lookup are traced to ``logger`` at debug
+    level when one is given.
+    """
 
-class ScopedSymbolTable(object):
-    def __init__(self, scope_name, scope_level, enclosing_scope=None):
-        self._symbols = {}
+    def __init__(self, scope_name, scope_level, enclosing_scope=None, logger=None):
+        self.symbols = []
+        self._slots = {}
         self.scope_name = scope_name
         self.scope_level = scope_level
         self.enclosing_scope = enclosing_scope
-        self.init_builtins()
+        self.logger = logger
 
     def __str__(self):
         h1 = 'SCOPE (SCOPED SYMBOL TABLE)'
@@ -34,57 +35,124 @@ class ScopedSymbolTable(object):
         h2 = 'Scope (Scoped symbol table) contents'
         lines.extend([h2, '-' * len(h2)])
         lines.extend(
-            ('%7s: %r' % (key, str(value)))
-            for key, value in self._symbols.items()
+            ('%7s: %r' % (symbol.name, str(symbol)))
+            for symbol in self.symbols
         )
         lines.append('\n')
         s = '\n'.join(lines)
         return s
 
-    def init_builtins(self):
-        self.define(BuiltinTypeSymbol('integer'))
-        self.define(BuiltinTypeSymbol('char'))
-
-    def define(self, symbol: Symbol):
-        print('Define: %s' % symbol)
-        self._symbols[symbol.name] = symbol
+    def __len__(self):
+        return len(self.symbols)
+
+    def define(self, symbol: Symbol) -> int:
+        """Add ``symbol``, replacing one of the same name, and return its slot."""
+        symbol.name = sys.intern(symbol.name)
+        slot = self._slots.get(symbol.name)
+        if slot is None:
+            slot = self._slots[symbol.name] = len(self.symbols)
+            self.symbols.append(symbol)
+        else:
+            self.symbols[slot] = symbol
+        if self.logger is not None:
+            self.logger.debug('Define: %s in %s[%d]', symbol, self.scope_name, slot)
+        return slot
+
+    def resolve(self, name, current_scope_only=False):
+        """(depth, slot, symbol) for ``name``, depth counting scopes up from this one, or None."""
+        scope = self
+        depth = 0
+        while scope is not None:
+            slot = scope._slots.get(name)
+            if slot is not None:
+                if self.logger is not None:
+                    self.logger.debug('Lookup: %s -> %s[%d]', name, scope.scope_name, slot)
+                return depth, slot, scope.symbols[slot]
+            if current_scope_only:
+                break
+            scope = scope.enclosing_scope
+            depth += 1
+        if self.logger is not None:
+            self.logger.debug('Lookup: %s not found', name)
+        return None
 
     def lookup(self, name, current_scope_only=False) -> Symbol:
-        print('Lookup: %s' % name)
-        symbol = self._symbols.get(name)
-        if symbol is not None:
-            return symbol
+        found = self.resolve(name, current_scope_only)
+        return found[2] if found is not None else None
 
-        if current_scope_only:
-            return None
 
-        if self.enclosing_scope is not None:
-            return self.enclosing_scope.lookup(name)
+_builtin_scope = None
+
+
+def builtin_scope() -> ScopedSymbolTable:
+    """The root scope shared by every program: builtin types and functions."""
+    global _builtin_scope
+    if _builtin_scope is None:
+        # Imported here: the machine package is not needed to import the analyzer
+        from machine.registry import default_registry
+        scope = ScopedSymbolTable('builtins', 0)
+        scope.define(BuiltinTypeSymbol('integer'))
+        scope.define(BuiltinTypeSymbol('char'))
+        # FUNC calls these by name
+        for name in default_registry().names():
+            scope.define(BuiltinFuncSymbol(name))
+        _builtin_scope = scope
+    return _builtin_scope
 
 
 class SemanticAnalyzer(NodeVisitor):
-    def __init__(self):
-        self.current_scope = None
+    """Resolves every identifier to the scope and slot of its symbol.
+
+    Each IdentNode gets ``depth`` (how many scopes up from its own the
+    symbol was found) and ``slot`` (its index there). Names that are not
+    defined keep None for both and are collected in ``unresolved``.
+    """
+
+    def __init__(self, logger=None):
+        self.logger = logger
+        self.global_scope = ScopedSymbolTable('global', 1, builtin_scope(), logger)
+        self.current_scope = self.global_scope
+        self.unresolved = []
+
+    def resolve(self, ident: IdentNode):
+        found = self.current_scope.resolve(ident.name)
+        if found is None:
+            ident.depth = ident.slot = None
+            self.unresolved.append(ident)
+        else:
+            ident.depth, ident.slot = found[0], found[1]
+
+    def bind(self, ident: IdentNode, symbol: Symbol):
+        """Define ``symbol`` in the current scope for the name ``ident`` assigns."""
+        found = self.current_scope.resolve(ident.name, current_scope_only=True)
+        ident.depth = 0
+        ident.slot = found[1] if found is not None else self.current_scope.define(symbol)
 
     def visit_BinOpNode(self, node):
         self.visit(node.arg1)
         self.visit(node.arg2)
 
     def visit_IdentNode(self, node: IdentNode):
-        var_name = node.name
+        self.resolve(node)
 
     def visit_LiteralNode(self, node: LiteralNode):
         pass
 
     def visit_StmtListNode(self, node: StmtListNode):
+        # Functions can be called before their definition
+        for stmt in node.exprs:
+            if isinstance(stmt, DefNode):
+                params = [param.name for param in stmt.args.childs]
+                self.current_scope.define(FuncSymbol(stmt.def_name.name, params))
         for stmt in node.exprs:
             self.visit(stmt)
 
     def visit_AssignNode(self, node: AssignNode):
-        var_name = node.var.name
         self.visit(node.val)
+        self.bind(node.var, VarSymbol(node.var.name))
 
     def visit_CallNode(self, node: CallNode):
+        self.visit(node.func)
         for param in node.params:
             self.visit(param)
 
@@ -100,11 +168,23 @@ class SemanticAnalyzer(NodeVisitor):
         self.visit(node.stmt)
 
     def visit_DefNode(self, node: DefNode):
-        self.visit(node.def_name)
-        self.visit(node.args)
-        self.visit(node.stmt)
+        self.resolve(node.def_name)
+        enclosing = self.current_scope
+        self.current_scope = ScopedSymbolTable(
+            node.def_name.name, enclosing.scope_level + 1, enclosing, self.logger)
+        try:
+            for param in node.args.childs:
+                self.bind(param, VarSymbol(param.name))
+            self.visit(node.stmt)
+        finally:
+            self.current_scope = enclosing
+
+    def visit_ListBodyNode(self, node: ListBodyNode):
+        for expr in node.exprs:
+            self.visit(expr)
 
     def visit_ForNode(self, node: ForNode):
-        self.visit(node.init)
         self.visit(node.for_in)
+        if isinstance(node.init, IdentNode):
+            self.bind(node.init, VarSymbol(node.init.name))
         self.visit(node.body)
@@ -18,3 +18,28 @@ class BlockSymbol(Symbol):
 
     def __str__(self):
         return '{name}'.format(name=self.name)
+
+
+class BuiltinFuncSymbol(Symbol):
+    def __init__(self, name):
+        super().__init__(name)
+
+    def __str__(self):
+        return '<builtin {name}>'.format(name=self.name)
+
+
+class VarSymbol(Symbol):
+    def __init__(self, name, type=None):
+        super().__init__(name, type)
+
+    def __str__(self):
+        return '<{name}:{type}>'.format(name=self.name, type=self.type)
+
+
+class FuncSymbol(Symbol):
+    def __init__(self, name, params=()):
+        super().__init__(name)
+        self.params = list(params)
+
+    def __str__(self):
+        return '<{name}({params})>'.format(name=self.name, params=', '.join(self.params))
@@ -0,0 +1,252 @@
+"""Flow-sensitive type inference for the code generator.
+
+Every expression node gets one of INT, FLOAT, STR, BOOL or None (unknown).
+Types come from literal values, flow through assignments in program order,
+join where control flow merges (if branches, loop heads) and come out of
+builtins through ``BUILTIN_RESULTS``. A function parameter has the join of
+the argument types of every call of the function, so the whole program is
+inferred again until the parameter types settle. Functions always return
+None, so their calls are unknown.
+
+Builtin results assume the default registry.
+"""
+from AST.nodes import *
+from AST.visitor import NodeVisitor
+
+INT, FLOAT, STR, BOOL = 'int', 'float', 'str', 'bool'
+# Below every type: a value that was never produced (an uncalled function's
+# parameter); joining with it keeps the other type
+UNSEEN = 'unseen'
+MAX_ROUNDS = 8
+
+_LITERALS = {int: INT, float: FLOAT, str: STR, bool: BOOL}
+_NUMBERS = (BOOL, INT, FLOAT)
+# Compiled with NOT, so the result is a bool whatever the operands are
+_NEGATED_COMPARES = {'!=', '<=', '<'}
+_COMPARES = {'==', '>', '>='}
+
+
+def join(a, b):
+    if a is UNSEEN:
+        return b
+    if b is UNSEEN:
+        return a
+    return a if a == b else None
+
+
+def _join_env(a: dict, b: dict) -> dict:
+    return {name: join(a.get(name, UNSEEN), b.get(name, UNSEEN)) for name in a.keys() | b.keys()}
+
+
+def binary_type(op: str, lh, rh):
+    """Type of ``lh op rh``."""
+    if lh is UNSEEN or rh is UNSEEN:
+        return UNSEEN
+    if op in _NEGATED_COMPARES:
+        return BOOL
+    if op in _COMPARES:
+        return BOOL if lh is not None and rh is not None else None
+    if op in ('&&', '||'):
+        # One of the operands
+        return join(lh, rh)
+    if lh in _NUMBERS and rh in _NUMBERS:
+        if op == '/':
+            return FLOAT
+        if op in ('+', '-', '*'):
+            return FLOAT if FLOAT in (lh, rh) else INT
+    if op == '+' and lh == rh == STR:
+        return STR
+    if op == '*' and {lh, rh} == {STR, INT}:
+        return STR
+    return None
+
+
+def _same_number(params):
+    return params[0] if len(params) == 1 and params[0] in (INT, FLOAT) else None
+
+
+def _rounded(params):
+    return INT if len(params) == 1 and params[0] in (INT, FLOAT) else None
+
+
+def _extreme(params):
+    # min(a, b, ...) is one of its arguments; min(iterable) is unknown
+    if len(params) < 2:
+        return None
+    result = UNSEEN
+    for param in params:
+        result = join(result, param)
+    return result
+
+
+# Builtin name -> result type, or a function of the argument types
+BUILTIN_RESULTS = {
+    'int': INT,
+    'float': FLOAT,
+    'str': STR,
+    'bool': BOOL,
+    'len': INT,
+    'ord': INT,
+    'chr': STR,
+    'repr': STR,
+    'input': STR,
+    'sqrt': FLOAT,
+    'rnd': FLOAT,
+    'abs': _same_number,
+    'round': _rounded,
+    'min': _extreme,
+    'max': _extreme,
+}
+
+
+class TypeInference(NodeVisitor):
+    """Infers the types of one program; see ``infer_types``.
+
+    Expressions are visited for their type, statements for their effect on
+    ``env``, the types of the variables at the current program point.
+    Types of loop bodies are taken at the loop's fixed point.
+    """
+
+    def __init__(self):
+        self.types = {}
+        self.env = {}
+        self.functions = {}
+        # Function name -> parameter types assumed in this round
+        self.signatures = {}
+        # Function name -> argument types seen in this round
+        self.calls = {}
+
+    def infer(self, tree: StmtNode) -> dict:
+        defs = [child for child in tree.childs if isinstance(child, DefNode)]
+        self.functions = {node.def_name.name: node for node in defs}
+        self.signatures = {name: [UNSEEN] * len(node.args.childs) for name, node in self.functions.items()}
+        for i in range(MAX_ROUNDS):
+            self._infer_round(tree, defs)
+            if self.calls == self.signatures:
+                break
+            self.signatures = self.calls
+        else:
+            # Did not settle: assume nothing about parameters
+            self.signatures = {name: [None] * len(node.args.childs) for name, node in self.functions.items()}
+            self._infer_round(tree, defs)
+        return {node: type_ for node, type_ in self.types.items() if type_ is not UNSEEN}
+
+    def _infer_round(self, tree: StmtNode, defs: list):
+        self.types = {}
+        self.calls = {name: [UNSEEN] * len(node.args.childs) for name, node in self.functions.items()}
+        self.env = {}
+        self.visit(tree)
+        for node in defs:
+            # Each call runs in a fresh context holding only the parameters
+            params = [param.name for param in node.args.childs]
+            self.env = dict(zip(params, self.signatures[node.def_name.name]))
+            self.visit(node.stmt)
+
+    def record(self, node: AstNode, type_):
+        self.types[node] = type_
+        return type_
+
+    # Expressions
+
+    def visit_LiteralNode(self, node: LiteralNode):
+        return self.record(node, _LITERALS.get(type(node.value)))
+
+    def visit_IdentNode(self, node: IdentNode):
+        # Reading a variable that is not set fails at run time, whatever its type
+        return self.record(node, self.env.get(node.name))
+
+    def visit_BinOpNode(self, node: BinOpNode):
+        lh = self.visit(node.arg1)
+        rh = self.visit(node.arg2)
+        return self.record(node, binary_type(node.op.value, lh, rh))
+
+    def visit_CallNode(self, node: CallNode):
+        params = [self.visit(param) for param in node.params]
+        name = node.func.name
+        if name in self.functions:
+            seen = self.calls[name]
+            if len(params) == len(seen):
+                self.calls[name] = [join(a, b) for a, b in zip(seen, params)]
+            return self.record(node, None)
+        if UNSEEN in params:
+            return self.record(node, UNSEEN)
+        result = BUILTIN_RESULTS.get(name)
+        if callable(result):
+            result = result(params)
+        return self.record(node, result)
+
+    # Statements
+
+    def visit_StmtListNode(self, node: StmtListNode):
+        for stmt in node.exprs:
+            self.visit(stmt)
+
+    visit_ListBodyNode = visit_StmtListNode
+
+    def visit_AssignNode(self, node: AssignNode):
+        self.env[node.var.name] = self.record(node.var, self.visit(node.val))
+
+    def visit_DefNode(self, node: DefNode):
+        # Bodies are inferred by _infer_round, with the parameter types
+        pass
+
+    def visit_IfNode(self, node: IfNode):
+        self.visit(node.cond)
+        before = self.env
+        self.env = dict(before)
+        self.visit(node.then_stmt)
+        then_env = self.env
+        self.env = dict(before)
+        if node.else_stmt:
+            self.visit(node.else_stmt)
+        self.env = _join_env(then_env, self.env)
+
+    def visit_WhileNode(self, node: WhileNode):
+        while True:
+            head = self.env
+            self.env = dict(head)
+            self.visit(node.cond)
+            self.visit(node.stmt)
+            merged = _join_env(head, self.env)
+            if merged == head:
+                break
+            self.env = merged
+        # The loop is left from its head
+        self.env = head
+
+    def visit_ForNode(self, node: ForNode):
+        call = node.for_in
+        if not isinstance(call, CallNode) or call.func.name != 'range' or not isinstance(node.init, IdentNode):
+            # The code generator rejects the loop
+            return self.generic_visit(node)
+        params = [self.visit(param) for param in call.params]
+        first = params[0] if len(params) > 1 else INT
+        step = params[2] if len(params) > 2 else INT
+        # The hidden counter only changes by the step; the body can not assign it
+        counter = first
+        while True:
+            advanced = join(counter, binary_type('+', counter, step))
+            if advanced == counter:
+                break
+            counter = advanced
+        name = node.init.name
+        while True:
+            head = self.env
+            self.env = dict(head)
+            self.env[name] = self.record(node.init, counter)
+            self.visit(node.body)
+            merged = _join_env(head, self.env)
+            if merged == head:
+                break
+            self.env = merged
+        self.env = head
+
+    def generic_visit(self, node: AstNode):
+        for child in node.childs:
+            self.visit(child)
+        return None
+
+
+def infer_types(tree: StmtNode) -> dict:
+    """Map every expression node of ``tree`` whose type is known to the type."""
+    return TypeInference().infer(tree)
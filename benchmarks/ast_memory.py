@@ -0,0 +1,33 @@
+import random
+import tracemalloc
+
+import AST.grammar as grammar
+from AST.differential import Generator
+
+
+def source(statements: int) -> str:
+    generator = Generator(random.Random(2))
+    stmts = []
+    while len(stmts) < statements:
+        stmt = generator.stmt()
+        try:
+            grammar.parse(stmt, backend='pratt')
+        except Exception:
+            continue
+        stmts.append(stmt)
+    return '\n'.join(stmts) + '\n'
+
+
+def main():
+    prog = source(3000)
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    tree = grammar.parse(prog, backend='pratt')
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    nodes = sum(1 for node in tree.walk())
+    print('%d nodes, %.0f KiB, %.1f bytes/node (source %d bytes)' % (nodes, used / 1024, used / nodes, len(prog)))
+
+
+if __name__ == '__main__':
+    main()
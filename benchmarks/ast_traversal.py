@@ -0,0 +1,42 @@
+"""Traversal and tree printing of very deep trees.
+
+A long sum parses to a left-deep chain of '+' nodes, one level per term;
+walking it or printing it must not hit the recursion limit.
+"""
+import io
+import sys
+import time
+
+import AST.pratt as pratt
+
+DEPTH = 100000
+
+
+def timed(label, func):
+    start = time.perf_counter()
+    result = func()
+    print('%-28s %8.1f ms  %s' % (label, (time.perf_counter() - start) * 1e3, result))
+
+
+def main():
+    tree = pratt.parse('x = ' + ' + '.join(['a'] * DEPTH) + '\n')
+    print('recursion limit %d, chain depth %d' % (sys.getrecursionlimit(), DEPTH))
+    timed('walk (pre-order)', lambda: sum(1 for node in tree.walk()))
+    timed('walk_post', lambda: sum(1 for node in tree.walk_post()))
+    timed('events', lambda: sum(1 for event in tree.events()))
+    timed('walk pruned at depth 1', lambda: sum(1 for node in tree.walk(prune=lambda node: node is not tree)))
+    # Full lines of a chain grow with depth, so the whole tree is quadratic
+    # in size; print the top of it and all of a shallower chain
+    timed('print_tree(max_depth=1000)', lambda: _print(tree, 1000))
+    small = pratt.parse('x = ' + ' + '.join(['a'] * 5000) + '\n')
+    timed('print_tree, depth 5000', lambda: _print(small, None))
+
+
+def _print(tree, max_depth) -> str:
+    out = io.StringIO()
+    tree.print_tree(out, max_depth=max_depth)
+    return '%d bytes' % out.tell()
+
+
+if __name__ == '__main__':
+    main()
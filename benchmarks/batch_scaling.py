@@ -0,0 +1,54 @@
+"""Scripts per second of compiler.batch with 1 to N worker processes.
+
+    python -m benchmarks.batch_scaling [scripts] [max workers]
+"""
+import os
+import sys
+import time
+
+from compiler.batch import _init_worker, _process, run_batch
+
+
+def scripts(count: int) -> list:
+    items = []
+    for i in range(count):
+        items.append(('script%d' % i, (
+            'total = 0\n'
+            'i = 0\n'
+            'while i < %d :\n'
+            '    total = total + i * %d\n'
+            '    i = i + 1\n'
+            'if total > 1000 :\n'
+            '    total = total / 2\n'
+            'print(total)\n') % (200 + i % 50, i % 7 + 1)))
+    return items
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    count = int(argv[0]) if argv else 2000
+    max_workers = int(argv[1]) if len(argv) > 1 else os.cpu_count()
+    items = scripts(count)
+
+    _init_worker()
+    start = time.perf_counter()
+    for index, (name, source) in enumerate(items):
+        _process(index, name, source, True, None)
+    serial = count / (time.perf_counter() - start)
+    print('in process   %8.0f scripts/s' % serial)
+
+    workers = 1
+    while True:
+        start = time.perf_counter()
+        results = run_batch(items, workers=workers, run=True)
+        rate = count / (time.perf_counter() - start)
+        failed = sum(not result.ok for result in results)
+        print('%2d workers   %8.0f scripts/s  (%.2fx)%s' % (
+            workers, rate, rate / serial, '  %d failed' % failed if failed else ''))
+        if workers >= max_workers:
+            break
+        workers = min(workers * 2, max_workers)
+
+
+if __name__ == '__main__':
+    main()
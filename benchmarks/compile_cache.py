@@ -0,0 +1,54 @@
+import tempfile
+import time
+
+from compiler.compile_cache import CompileCache
+from machine import *
+
+SOURCE = '''def power(a, b) :
+    result = 1
+    i = 0
+    while b > i :
+        result = result * a
+        i = i + 1
+    total = result
+for k in range(0, 3000) : power(3, 40)
+x = 1.5 * 2
+print("done", x)
+'''
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        cache = CompileCache(directory)
+        start = time.perf_counter()
+        cold = cache.compile(SOURCE)
+        cold_time = time.perf_counter() - start
+        start = time.perf_counter()
+        for i in range(100):
+            warm = cache.compile(SOURCE)
+        warm_time = (time.perf_counter() - start) / 100
+        assert warm == cold
+        print('cold: %.2f ms' % (cold_time * 1000))
+        print('warm: %.2f ms (%.0fx)' % (warm_time * 1000, cold_time / warm_time))
+        print(cache.stats)
+        check_damaged_entries(cache, cold)
+
+
+def check_damaged_entries(cache: CompileCache, expected: list):
+    """A corrupt or truncated entry is a miss that recompiles, never an error."""
+    path = cache.path(cache.key(SOURCE))
+    with open(path, 'rb') as f:
+        data = f.read()
+    damaged = [b'\xff' * len(data), data[:len(data) // 2] + bytes(len(data) - len(data) // 2)]
+    damaged += [data[:length] for length in range(len(data))]
+    for entry in damaged:
+        with open(path, 'wb') as f:
+            f.write(entry)
+        misses = cache.stats.misses
+        assert cache.compile(SOURCE) == expected
+        assert cache.stats.misses == misses + 1
+    print('%d damaged entries recompiled' % len(damaged))
+
+
+if __name__ == '__main__':
+    main()
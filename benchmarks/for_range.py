@@ -0,0 +1,43 @@
+"""Loop iterations per second of a range() loop against the same loop written with while."""
+import time
+
+import AST.grammar as grammar
+from compiler.code_generator import CodeGenerator
+from machine import *
+
+ITERATIONS = 300000
+LOOPS = {
+    'while': '''i = 0
+while i < %d : x = i
+ i = i + 1 }
+''' % ITERATIONS,
+    'for range()': '''for i in range(0, %d) : x = i }
+''' % ITERATIONS,
+}
+
+
+def measure(source: str, slots: bool) -> float:
+    instruction_table = Machine.get_instruction_table()
+    program = CodeGenerator(grammar.parse(source), slots=slots, peephole=slots).program
+    best = None
+    for i in range(5):
+        machine = Machine(program, instruction_table)
+        start = time.perf_counter()
+        machine.run()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return ITERATIONS / best
+
+
+def main():
+    for slots in (False, True):
+        print('slots + peephole' if slots else 'names')
+        baseline = None
+        for name, source in LOOPS.items():
+            rate = measure(source, slots)
+            baseline = baseline or rate
+            print('  %-12s %12.0f iterations/s (%.2fx)' % (name, rate, rate / baseline))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""Frame allocations with and without the frame pool and tail calls.
+
+'before' compiles without tail calls and runs with an empty frame pool, so
+every CALL allocates a Context, as the machine used to.
+"""
+import time
+import tracemalloc
+
+import AST.grammar as grammar
+from compiler.code_generator import CodeGenerator
+from machine import *
+
+# One deep tail-recursive loop
+TAIL = '''def count(n) : if n > 0 : count(n - 1) } }
+count(%d)
+'''
+# Many shallow recursions with work after the call
+REPEATED = '''def walk(n) : if n > 0 : walk(n - 1)
+ x = n } }
+for k in range(0, %d) : walk(100) }
+'''
+REPEAT = 3
+CASES = [
+    ('before', False, 0),
+    ('pool', False, Machine.frame_pool_size),
+    ('pool + tail calls', True, Machine.frame_pool_size),
+]
+
+
+def measure(source: str, tail_call: bool, pool_size: int, calls: int):
+    instruction_table = Machine.get_instruction_table()
+    program = CodeGenerator(grammar.parse(source), tail_call=tail_call).program
+    machine = Machine(program, instruction_table)
+    machine.frame_pool_size = pool_size
+    tracemalloc.start()
+    start = time.perf_counter()
+    machine.run()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    # Timed again without tracemalloc, which slows allocation down; best of REPEAT
+    for i in range(REPEAT):
+        machine = Machine(program, instruction_table)
+        machine.frame_pool_size = pool_size
+        start = time.perf_counter()
+        machine.run()
+        elapsed = min(elapsed, time.perf_counter() - start)
+    return calls / elapsed, machine.frames_allocated / elapsed, machine.frames_allocated, peak
+
+
+def main():
+    for title, source, calls in (('tail recursion, depth 100000', TAIL % 100000, 100001),
+                                 ('500 recursions of depth 100', REPEATED % 500, 500 * 101)):
+        print(title)
+        print('%20s %12s %16s %12s %12s' % ('', 'calls/s', 'allocations/s', 'allocations', 'peak KiB'))
+        for name, tail_call, pool_size in CASES:
+            rate, allocation_rate, allocations, peak = measure(source, tail_call, pool_size, calls)
+            print('%20s %12.0f %16.0f %12d %12.0f' % (name, rate, allocation_rate, allocations, peak / 1024))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+"""Import-time budget check: exits with status 1 when a budget is exceeded.
+
+Each module is imported in a fresh interpreter several times and the best
+cumulative time reported by -X importtime is compared to its budget. The
+modules must also not pull in the parser or other heavy dependencies.
+"""
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RUNS = 5
+# module: (budget in ms, modules it must not import); budgets are about
+# twice the usual best time
+BUDGETS = {
+    'machine': (3.0, ('pyparsing', 'typing', 'hashlib', 'collections', 'AST', 'enum', 'importlib',
+                      'machine.jit', 'machine.quickening')),
+    'AST.nodes': (2.0, ('pyparsing', 'typing', 'inspect', 'machine', 'enum')),
+    'AST.grammar': (13.0, ('pyparsing', 'pickle')),
+    'Semantic.semantic': (4.0, ('pyparsing', 'machine', 'enum')),
+}
+
+
+def measure(module: str):
+    code = 'import sys, {0}; print(" ".join(sys.modules))'.format(module)
+    best = None
+    for i in range(RUNS):
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                                cwd=ROOT, capture_output=True, text=True, check=True)
+        for line in result.stderr.splitlines():
+            fields = line.split('|')
+            if len(fields) == 3 and fields[2].strip() == module:
+                cumulative = int(fields[1]) / 1000
+                best = cumulative if best is None else min(best, cumulative)
+    return best, set(result.stdout.split())
+
+
+def main() -> int:
+    failures = 0
+    for module, (budget, forbidden) in BUDGETS.items():
+        elapsed, loaded = measure(module)
+        pulled = sorted(name for name in forbidden if name in loaded)
+        ok = elapsed <= budget and not pulled
+        failures += not ok
+        print('%-18s %6.2f ms (budget %4.1f ms)%s %s' % (
+            module, elapsed, budget, ' imports ' + ', '.join(pulled) if pulled else '', 'ok' if ok else 'FAIL'))
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
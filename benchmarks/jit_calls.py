@@ -0,0 +1,34 @@
+import time
+
+import AST.grammar as grammar
+from compiler.code_generator import CodeGenerator
+from machine import *
+
+SOURCE = '''def power(a, b) : result = 1
+ i = 0
+ while b > i : result = result * a
+ i = i + 1 }
+ total = result }
+for k in range(0, 3000) : power(3, 40) }
+'''
+
+
+def measure(program, instruction_table, **kwargs):
+    machine = Machine(program, instruction_table, **kwargs)
+    start = time.perf_counter()
+    machine.run()
+    return time.perf_counter() - start, machine
+
+
+def main():
+    instruction_table = Machine.get_instruction_table()
+    program = CodeGenerator(grammar.parse(SOURCE)).program
+    interpreted, _ = measure(program, instruction_table)
+    jitted, machine = measure(program, instruction_table, jit_threshold=100)
+    print('interpreted: %.3f s' % interpreted)
+    print('jit:         %.3f s (%.1fx), compiled entries %s' % (
+        jitted, interpreted / jitted, sorted(machine.jit.compiled)))
+
+
+if __name__ == '__main__':
+    main()
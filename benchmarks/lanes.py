@@ -0,0 +1,72 @@
+"""Rows per second of a scoring program: one Machine per row against machine.lanes.
+
+    python -m benchmarks.lanes [rows]
+"""
+import sys
+import time
+
+import numpy as np
+
+from compiler.instrumentation import compile_program
+from machine import Machine
+from machine.lanes import run_lanes
+
+SOURCE = '''
+score = income / 1000 * 0.5 + age * 2
+if age > 60 :
+    score = score - 10
+if debt > income && age < 30 :
+    score = score * 0.25
+while score > 100 :
+    score = score / 2
+score = max(score, 0)
+'''
+MACHINE_ROWS = 20000
+
+
+def columns(rows: int) -> dict:
+    rnd = np.random.default_rng(0)
+    return {
+        'income': rnd.uniform(0, 300000, rows),
+        'age': rnd.integers(18, 90, rows),
+        'debt': rnd.uniform(0, 300000, rows),
+    }
+
+
+def run_machines(program: list, data: dict) -> list:
+    table = Machine.get_instruction_table()
+    names = list(data)
+    results = []
+    for row in zip(*(data[name].tolist() for name in names)):
+        machine = Machine(program, table)
+        machine.current_context.variables.update(zip(names, row))
+        machine.run()
+        results.append(machine.current_context.get_variable('score'))
+    return results
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    rows = int(argv[0]) if argv else 1000000
+    program = compile_program(SOURCE, slots=False, peephole=False)
+    data = columns(rows)
+
+    sample = {name: column[:MACHINE_ROWS] for name, column in data.items()}
+    start = time.perf_counter()
+    expected = run_machines(program, sample)
+    per_row = MACHINE_ROWS / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    result = run_lanes(program, data, 'score')
+    lanes = rows / (time.perf_counter() - start)
+
+    if not np.allclose(result[:MACHINE_ROWS], expected):
+        print('lanes and per-row results differ')
+        return 1
+    print('Machine per row  %12.0f rows/s  (%d rows)' % (per_row, MACHINE_ROWS))
+    print('lanes            %12.0f rows/s  (%d rows, %.0fx)' % (lanes, rows, lanes / per_row))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,49 @@
+"""Instructions executed and run time of one program compiled at each -O level."""
+import time
+
+import AST.grammar as grammar
+from compiler.code_generator import CodeGenerator
+from machine import *
+
+ITERATIONS = 100000
+SOURCE = '''
+width = int("640")
+scale = 3
+border = scale * 2
+total = 0
+i = 0
+while i < %d :
+    offset = (width * scale + border) * i
+    total = total + offset - (width * scale + border)
+    i = i + 1
+for k in range(1000) :
+    total = total + k * (border + 1)
+''' % ITERATIONS
+
+
+def measure(level: int, slots: bool):
+    instruction_table = Machine.get_instruction_table()
+    program = CodeGenerator(grammar.parse_indented(SOURCE), opt_level=level, slots=slots, peephole=slots).program
+    instructions = Machine(program, instruction_table).run_counted()
+    best = None
+    for i in range(5):
+        machine = Machine(program, instruction_table)
+        start = time.perf_counter()
+        machine.run()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return instructions, best
+
+
+def main():
+    for slots in (False, True):
+        print('slots + peephole' if slots else 'names')
+        baseline = None
+        for level in range(3):
+            instructions, elapsed = measure(level, slots)
+            baseline = baseline or elapsed
+            print('  -O%d %10d instructions %8.3fs (%.2fx)' % (level, instructions, elapsed, baseline / elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,29 @@
+import random
+import time
+
+import AST.grammar as grammar
+from AST.differential import Generator, outcome, BACKENDS
+
+
+def source(lines: int) -> str:
+    generator = Generator(random.Random(1))
+    stmts = []
+    while sum(stmt.count('\n') + 1 for stmt in stmts) < lines:
+        stmt = generator.stmt()
+        if outcome(stmt, 'pratt') != 'rejected':
+            stmts.append(stmt)
+    return '\n'.join(stmts) + '\n'
+
+
+def main():
+    prog = source(2000)
+    lines = prog.count('\n')
+    for backend in BACKENDS:
+        start = time.perf_counter()
+        grammar.parse(prog, backend=backend)
+        elapsed = time.perf_counter() - start
+        print('%-10s %7.3f s %9.0f lines/s' % (backend, elapsed, lines / elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+import contextlib
+import io
+import time
+
+from machine import *
+from compiler.assembler import resolve_slots
+from compiler.peephole import optimize_program
+
+
+def power_program(a, b):
+    # test5.py with configurable operands
+    return [
+        'PUSH', a,
+        'PUSH', b,
+        'CALL', 10,
+        'FUNC', 'print', 1,
+        'HALT',
+        'STORE', 'b',
+        'STORE', 'a',
+        'PUSH', 1,
+        'STORE', 'result',
+        'PUSH', 0,
+        'STORE', 'i',
+        'LOAD', 'b',
+        'LOAD', 'i',
+        'ISGT',
+        'NOT',
+        'JUMP_IF', 46,
+        'LOAD', 'a',
+        'LOAD', 'result',
+        'MUL',
+        'STORE', 'result',
+        'LOAD', 'i',
+        'PUSH', 1,
+        'ADD',
+        'STORE', 'i',
+        'JUMP', 22,
+        'LOAD', 'result',
+        'RET'
+    ]
+
+
+def run_with_step(machine):
+    while not machine._is_halted:
+        machine.step()
+
+
+def measure(runner, iterations, slots=False, peephole=False, quicken_threshold=None):
+    instruction_table = Machine.get_instruction_table()
+    program = power_program(1, iterations)
+    if slots:
+        program = resolve_slots(program, instruction_table)
+    if peephole:
+        program = optimize_program(program, instruction_table)
+    machine = Machine(program, instruction_table, quicken_threshold=quicken_threshold)
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        runner(machine)
+    return time.perf_counter() - start
+
+
+def main(iterations=100000):
+    step_time = measure(run_with_step, iterations)
+    run_time = measure(Machine.run, iterations)
+    quickened_time = measure(Machine.run, iterations, quicken_threshold=16)
+    slots_time = measure(Machine.run, iterations, slots=True)
+    print('step():          %.3f s' % step_time)
+    print('run():           %.3f s (%.1fx)' % (run_time, step_time / run_time))
+    fused_time = measure(Machine.run, iterations, slots=True, peephole=True)
+    print('run() quickened: %.3f s (%.1fx)' % (quickened_time, step_time / quickened_time))
+    print('run() + slots:   %.3f s (%.1fx)' % (slots_time, step_time / slots_time))
+    print('+ peephole:      %.3f s (%.1fx)' % (fused_time, step_time / fused_time))
+    fused_quickened_time = measure(Machine.run, iterations, slots=True, peephole=True, quicken_threshold=16)
+    print('+ quickened:     %.3f s (%.1fx)' % (fused_quickened_time, step_time / fused_quickened_time))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+"""Instructions per second of many scripts on machine.scheduler at several
+slice budgets, against running the same machines one after another.
+
+    python -m benchmarks.scheduler [scripts]
+"""
+import asyncio
+import contextlib
+import io
+import sys
+import time
+
+from compiler.instrumentation import compile_program
+from machine import Machine
+from machine.scheduler import Scheduler
+
+SOURCE = 'i = 0\nt = 0\nwhile i < %d :\n    t = t + i\n    i = i + 1\nprint(t)\n'
+
+
+def sequential(programs: list) -> float:
+    table = Machine.get_instruction_table()
+    start = time.perf_counter()
+    count = 0
+    with contextlib.redirect_stdout(io.StringIO()):
+        for program in programs:
+            count += Machine(program, table).run_counted()
+    return count / (time.perf_counter() - start)
+
+
+def scheduled(programs: list, budget: int) -> float:
+    scheduler = Scheduler(budget)
+    for program in programs:
+        scheduler.spawn(program)
+    start = time.perf_counter()
+    asyncio.run(scheduler.run())
+    elapsed = time.perf_counter() - start
+    return sum(task.instructions for task in scheduler.tasks) / elapsed
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    count = int(argv[0]) if argv else 2000
+    programs = [compile_program(SOURCE % (100 + i % 100)) for i in range(count)]
+    base = sequential(programs)
+    print('sequential run       %10.0f instructions/s' % base)
+    for budget in (100, 1000, 10000):
+        rate = scheduled(programs, budget)
+        print('scheduled, budget %-5d %8.0f instructions/s  (%.2fx)' % (budget, rate, rate / base))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+import time
+
+from machine import *
+
+OPS = 20000
+
+
+def operand_cost(depth):
+    # PUSH/POP pairs on top of an operand stack already ``depth`` deep
+    machine = Machine(['PUSH', 1, 'POP'] * OPS + ['HALT'], Machine.get_instruction_table())
+    machine.operand_stack.extend([0] * depth)
+    start = time.perf_counter()
+    machine.run()
+    return (time.perf_counter() - start) / (2 * OPS) * 1e9
+
+
+def call_program(depth):
+    # Recursive countdown: every level keeps its context on the context stack
+    return [
+        'PUSH', depth,
+        'CALL', 5,
+        'HALT',
+        'DUP',
+        'NOT',
+        'JUMP_IF', 15,
+        'PUSH', 1,
+        'SUB',
+        'CALL', 5,
+        'RET',
+        'RET'
+    ]
+
+
+def call_cost(depth):
+    machine = Machine(call_program(depth), Machine.get_instruction_table())
+    start = time.perf_counter()
+    machine.run()
+    return (time.perf_counter() - start) / depth * 1e9
+
+
+def main():
+    print('%10s %18s %18s' % ('depth', 'operand ns/op', 'call ns/level'))
+    for depth in (10, 1000, 10000, 100000):
+        print('%10d %18.1f %18.1f' % (depth, operand_cost(depth), call_cost(depth)))
+
+
+if __name__ == '__main__':
+    main()
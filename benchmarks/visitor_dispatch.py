@@ -0,0 +1,53 @@
+"""Visits per second of the semantic analyzer and code generator on a large AST.
+
+Each visitor is timed with the cached type dispatch of AST.visitor and with
+the old per-visit dispatch on the node's class name.
+"""
+import time
+
+import AST.grammar as grammar
+from AST.nodes import *
+from compiler.code_generator import CodeGenerator
+from Semantic.semantic import SemanticAnalyzer
+from benchmarks.ast_memory import source
+
+
+class NameDispatch:
+    """Per-visit dispatch: ``getattr`` of ``'visit_' + class name``."""
+
+    def visit(self, node):
+        return getattr(self, 'visit_' + type(node).__name__, self.generic_visit)(node)
+
+
+class NameDispatchAnalyzer(NameDispatch, SemanticAnalyzer):
+    pass
+
+
+class NameDispatchGenerator(NameDispatch, CodeGenerator):
+    pass
+
+
+def rate(visitor_class, tree, nodes: int, repeat: int = 5) -> float:
+    best = float('inf')
+    for i in range(repeat):
+        start = time.perf_counter()
+        visitor_class(tree) if issubclass(visitor_class, CodeGenerator) else visitor_class().visit(tree)
+        best = min(best, time.perf_counter() - start)
+    return nodes / best
+
+
+def main():
+    tree = grammar.parse(source(3000), backend='pratt')
+    # The code generator only handles functions at the top level
+    tree = StmtListNode(*[stmt for stmt in tree.exprs if not isinstance(stmt, DefNode)])
+    nodes = sum(1 for node in tree.walk())
+    print('%d nodes' % nodes)
+    for label, cached, by_name in (
+            ('semantic analyzer', SemanticAnalyzer, NameDispatchAnalyzer),
+            ('code generator', CodeGenerator, NameDispatchGenerator)):
+        new, old = rate(cached, tree, nodes), rate(by_name, tree, nodes)
+        print('%-18s cached %9.0f visits/s   by name %9.0f visits/s   (%.2fx)' % (label, new, old, new / old))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,180 @@
+from typing import List
+from machine import InstructionTable
+
+# Pseudo instruction that marks a jump target; it takes no space in the program
+LABEL = 'LABEL'
+
+_TAIL_CALLS = {'TAIL_CALL', 'TAIL_CALL_FAST'}
+_NO_FALLTHROUGH = {'JUMP', 'RET', 'HALT'} | _TAIL_CALLS
+_CALLS = {'CALL', 'CALL_FAST'} | _TAIL_CALLS
+_FAST = {'LOAD_FAST', 'STORE_FAST', 'ENTER', 'FOR_RANGE_FAST'}
+# Instructions whose leading arguments are variable names
+_NAMED = {'LOAD': 1, 'STORE': 1, 'FOR_RANGE': 4}
+
+
+class CodeLine:
+    def __init__(self, cmd: str, *args):
+        self.cmd = cmd
+        self.args = list(args)
+
+    def __str__(self):
+        return ' '.join([self.cmd] + [
+            '<' + arg.cmd + '>' if isinstance(arg, CodeLine) else repr(arg) for arg in self.args
+        ])
+
+
+def disassemble(program: list, instruction_table: InstructionTable) -> List[CodeLine]:
+    """Split a flat program into lines whose jump operands reference lines."""
+    lines = []
+    by_offset = {}
+    ip = 0
+    while ip < len(program):
+        instruction = instruction_table.table.get(program[ip])
+        if instruction is None:
+            raise Exception('Instruction ' + str(program[ip]) + ' does not supported')
+        line = CodeLine(program[ip], *program[ip + 1:ip + 1 + instruction.arity])
+        by_offset[ip] = line
+        lines.append(line)
+        ip += 1 + instruction.arity
+    for line in lines:
+        for target in instruction_table.get(line.cmd).targets:
+            offset = line.args[target]
+            if offset not in by_offset:
+                raise Exception('Jump target %s is not an instruction boundary' % offset)
+            line.args[target] = by_offset[offset]
+    return lines
+
+
+def assemble(lines: List[CodeLine], instruction_table: InstructionTable) -> list:
+    """Lay lines out as a flat program, replacing line references with offsets."""
+    offsets = {}
+    ip = 0
+    for line in lines:
+        offsets[id(line)] = ip
+        if line.cmd != LABEL:
+            ip += 1 + instruction_table.get(line.cmd).arity
+
+    program = []
+    for line in lines:
+        if line.cmd == LABEL:
+            continue
+        args = list(line.args)
+        for target in instruction_table.get(line.cmd).targets:
+            args[target] = offsets[id(args[target])]
+        program.append(line.cmd)
+        program.extend(args)
+    return program
+
+
+def successors(lines: List[CodeLine], i: int, index: dict, instruction_table: InstructionTable) -> List[int]:
+    """Indices of the lines control can reach from ``lines[i]`` inside one function."""
+    line = lines[i]
+    result = []
+    if line.cmd != LABEL and line.cmd not in _CALLS:
+        for target in instruction_table.get(line.cmd).targets:
+            result.append(index[id(line.args[target])])
+    if line.cmd not in _NO_FALLTHROUGH and i + 1 < len(lines):
+        result.append(i + 1)
+    return result
+
+
+def function_bodies(lines: List[CodeLine], instruction_table: InstructionTable) -> dict:
+    """Map every function entry (line index) to the set of lines reachable from it.
+
+    The program start and every CALL target are entries.
+    """
+    index = {id(line): i for i, line in enumerate(lines)}
+    entries = [0]
+    for line in lines:
+        if line.cmd in _CALLS and index[id(line.args[0])] not in entries:
+            entries.append(index[id(line.args[0])])
+
+    bodies = {}
+    for entry in entries:
+        body = set()
+        pending = [entry]
+        while pending:
+            i = pending.pop()
+            if i in body:
+                continue
+            body.add(i)
+            pending.extend(successors(lines, i, index, instruction_table))
+        bodies[entry] = body
+    return bodies
+
+
+def _returns_none(lines: List[CodeLine], i: int, index: dict) -> bool:
+    """Whether control at ``lines[i]`` reaches PUSH None; RET without other work."""
+    seen = set()
+    while i < len(lines) and i not in seen:
+        seen.add(i)
+        line = lines[i]
+        if line.cmd == LABEL:
+            i += 1
+        elif line.cmd == 'JUMP':
+            i = index[id(line.args[0])]
+        else:
+            return line.cmd == 'PUSH' and line.args[0] is None \
+                and i + 1 < len(lines) and lines[i + 1].cmd == 'RET'
+    return False
+
+
+def tail_calls(lines: List[CodeLine]) -> List[CodeLine]:
+    """Turn calls whose result is the caller's result into TAIL_CALL.
+
+    A statement call (CALL; POP) followed only by the function epilogue
+    (PUSH None; RET), possibly through labels and jumps, returns what the
+    caller would. TAIL_CALL runs the callee in the caller's frame, so tail
+    recursion takes constant memory.
+    """
+    index = {id(line): i for i, line in enumerate(lines)}
+    dropped = set()
+    for i, line in enumerate(lines):
+        if line.cmd == 'CALL' and i + 2 < len(lines) and lines[i + 1].cmd == 'POP' \
+                and _returns_none(lines, i + 2, index):
+            line.cmd = 'TAIL_CALL'
+            dropped.add(i + 1)
+    return [line for i, line in enumerate(lines) if i not in dropped]
+
+
+def resolve_slots(program: list, instruction_table: InstructionTable) -> list:
+    """Replace name based LOAD/STORE/FOR_RANGE with their _FAST forms on frame slots.
+
+    Each function gets a fixed-size frame holding one slot per variable name
+    it uses; calls to it become CALL_FAST with that frame size, and the main
+    program frame is sized by a leading ENTER. Functions that share code with
+    another function or already use slots keep name based access.
+    """
+    lines = disassemble(program, instruction_table)
+    if not lines:
+        return list(program)
+    bodies = function_bodies(lines, instruction_table)
+
+    owners = {}
+    for entry, body in bodies.items():
+        for i in body:
+            owners[i] = owners.get(i, 0) + 1
+
+    frame_sizes = {}
+    for entry, body in bodies.items():
+        if any(owners[i] > 1 or lines[i].cmd in _FAST for i in body):
+            continue
+        slots = {}
+        for i in sorted(body):
+            line = lines[i]
+            if line.cmd in _NAMED:
+                count = _NAMED[line.cmd]
+                for name in line.args[:count]:
+                    if name not in slots:
+                        slots[name] = len(slots)
+                line.cmd = line.cmd + '_FAST'
+                line.args = [slots[name] for name in line.args[:count]] + line.args[count:]
+        frame_sizes[id(lines[entry])] = len(slots)
+
+    for line in lines:
+        if line.cmd in ('CALL', 'TAIL_CALL') and id(line.args[0]) in frame_sizes:
+            line.cmd = line.cmd + '_FAST'
+            line.args.append(frame_sizes[id(line.args[0])])
+    if frame_sizes.get(id(lines[0])):
+        lines.insert(0, CodeLine('ENTER', frame_sizes[id(lines[0])]))
+    return assemble(lines, instruction_table)
@@ -0,0 +1,155 @@
+"""Compile, and optionally run, many scripts on a process pool.
+
+Every worker builds the parser and the instruction table once, in the pool
+initializer. Items travel in chunks; each result carries the program as
+machine.bytecode bytes (never the AST), what the run printed, and the error
+if the item failed, and results are yielded as their chunks complete.
+Exceptions are caught per item, so one bad script only fails itself. A
+timeout is enforced inside the worker with SIGALRM, where the platform has
+it; a worker process that dies fails the items it had been given.
+
+    python -m compiler.batch [--workers N] [--run] [--timeout S] [--out DIR] file ...
+"""
+import argparse
+import concurrent.futures
+import contextlib
+import io
+import os
+import signal
+import sys
+import time
+from concurrent.futures.process import BrokenProcessPool
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from compiler.instrumentation import compile_program
+from machine import Machine
+from machine import bytecode
+
+_instruction_table = None
+
+
+class ItemTimeout(Exception):
+    pass
+
+
+class BatchResult:
+    __slots__ = ('index', 'name', 'bytecode', 'output', 'error', 'time')
+
+    def __init__(self, index: int, name: str, bytecode: Optional[bytes] = None, output: str = '',
+                 error: Optional[str] = None, time: float = 0.0):
+        self.index = index
+        self.name = name
+        self.bytecode = bytecode
+        self.output = output
+        self.error = error
+        self.time = time
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    def program(self) -> bytecode.Bytecode:
+        return bytecode.loads(self.bytecode, Machine.get_instruction_table())
+
+    def __str__(self):
+        status = 'ok' if self.ok else 'FAILED: ' + self.error
+        return '%s %.1f ms %s' % (self.name, self.time * 1e3, status)
+
+
+def _init_worker():
+    global _instruction_table
+    _instruction_table = Machine.get_instruction_table()
+    # Warm the parser and code generator so the first item does not pay for it
+    compile_program('a = 1\n')
+
+
+def _on_alarm(signum, frame):
+    raise ItemTimeout()
+
+
+def _process(index: int, name: str, source: str, run: bool, timeout: Optional[float]) -> BatchResult:
+    start = time.perf_counter()
+    result = BatchResult(index, name)
+    output = io.StringIO()
+    alarm = timeout is not None and hasattr(signal, 'setitimer')
+    if alarm:
+        previous = signal.signal(signal.SIGALRM, _on_alarm)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        program = compile_program(source)
+        result.bytecode = bytecode.dumps(program, _instruction_table)
+        if run:
+            with contextlib.redirect_stdout(output):
+                Machine(program, _instruction_table).run()
+    except ItemTimeout:
+        result.error = 'timed out after %gs' % timeout
+    except Exception as e:
+        result.error = '%s: %s' % (type(e).__name__, e)
+    finally:
+        if alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous)
+    result.output = output.getvalue()
+    result.time = time.perf_counter() - start
+    return result
+
+
+def _process_chunk(chunk: List[Tuple[int, str, str]], run: bool, timeout: Optional[float]) -> List[BatchResult]:
+    return [_process(index, name, source, run, timeout) for index, name, source in chunk]
+
+
+def iter_batch(items: Iterable[Tuple[str, str]], workers: Optional[int] = None, run: bool = False,
+               timeout: Optional[float] = None, chunksize: int = 8) -> Iterator[BatchResult]:
+    """Process (name, source) pairs, yielding results in completion order."""
+    items = [(index, name, source) for index, (name, source) in enumerate(items)]
+    chunks = [items[i:i + chunksize] for i in range(0, len(items), chunksize)]
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+        futures = {executor.submit(_process_chunk, chunk, run, timeout): chunk for chunk in chunks}
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                results = future.result()
+            except BrokenProcessPool:
+                results = [BatchResult(index, name, error='worker process died')
+                           for index, name, source in futures[future]]
+            yield from results
+
+
+def run_batch(items: Iterable[Tuple[str, str]], **options) -> List[BatchResult]:
+    """Process (name, source) pairs; results in input order."""
+    return sorted(iter_batch(items, **options), key=lambda result: result.index)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m compiler.batch')
+    parser.add_argument('files', nargs='+')
+    parser.add_argument('--workers', type=int, help='worker processes (default: one per CPU)')
+    parser.add_argument('--run', action='store_true', help='run each program after compiling it')
+    parser.add_argument('--timeout', type=float, help='seconds allowed per script')
+    parser.add_argument('--chunksize', type=int, default=8, help='scripts sent to a worker at a time')
+    parser.add_argument('--out', metavar='DIR', help='write each program as bytecode to DIR')
+    args = parser.parse_args(argv)
+
+    items = []
+    for path in args.files:
+        with open(path, encoding='utf-8') as f:
+            items.append((path, f.read()))
+    if args.out:
+        os.makedirs(args.out, exist_ok=True)
+
+    failures = 0
+    for result in iter_batch(items, workers=args.workers, run=args.run, timeout=args.timeout,
+                             chunksize=args.chunksize):
+        print(result)
+        if result.output:
+            sys.stdout.write(result.output)
+        failures += not result.ok
+        if args.out and result.bytecode is not None:
+            stem = os.path.splitext(os.path.basename(result.name))[0]
+            with open(os.path.join(args.out, stem + '.ctvm'), 'wb') as f:
+                f.write(result.bytecode)
+    print('%d scripts, %d failed' % (len(items), failures))
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
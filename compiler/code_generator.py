@@ -1,87 +1,274 @@
-import inspect
 from typing import List
-from pyparsing import ParseResults
 from AST.nodes import *
-import compiler.custom_builtins as custom_builtins
+from AST.visitor import NodeVisitor
+from machine import Machine
+from compiler import ir
+from compiler.assembler import CodeLine, LABEL, assemble, resolve_slots, tail_calls
+from compiler.passes import optimize
+from compiler.peephole import optimize_program
+from Semantic.type_inference import infer_types
+
 op_cmd = {
-    '+': 'ADD',
-    '-': 'SUB',
-    '*': 'MUL',
-    '/': 'DIV',
-    '%': 'MOD',
-    '>=': 'GE',
-    '<=': 'LE',
-    '!=': 'NEQ',
-    '==': 'EQ',
-    '>': 'GT',
-    '<': 'LT',
-    '&&': 'AND',
-    '||': 'OR',
-    '**': 'PWR'
+    '+': ['ADD'],
+    '-': ['SUB'],
+    '*': ['MUL'],
+    '/': ['DIV'],
+    '>=': ['ISGE'],
+    '<=': ['ISGT', 'NOT'],
+    '!=': ['ISEQ', 'NOT'],
+    '==': ['ISEQ'],
+    '>': ['ISGT'],
+    '<': ['ISGE', 'NOT'],
+    '&&': ['AND'],
+    '||': ['OR'],
 }
-builtin_funcs = [f for f in dir(custom_builtins) if inspect.isfunction(getattr(custom_builtins, f))]
 
-class CodeLine:
-    def __init__(self, cmd: str, value: Optional = None):
-        self.cmd = cmd
-        self.value = value
 
-    def __str__(self):
-        return self.cmd + ' ' + (str(self.value) if self.value is not None else '')
+class CodeGenerator(NodeVisitor):
+    """Compiles a program to machine code lines.
+
+    The AST is lowered to the control-flow graph of compiler.ir, which the
+    passes of compiler.passes enabled at ``opt_level`` (or the ones named in
+    ``passes``) rewrite; ``dump``, a text stream, gets the IR before and
+    after each of them. Blocks are then emitted in layout order, with a jump
+    only where control does not fall into the next block.
+
+    Expressions carry the types Semantic.type_inference proves for them,
+    which tell the passes what can not raise.
+
+    The program keeps variables in frame slots (compiler.assembler.
+    resolve_slots), then common instruction sequences are fused into
+    superinstructions (compiler.peephole). Turning ``slots`` off keeps name
+    based LOAD and STORE, and turning ``peephole`` off keeps the base
+    instructions, for debugging and for consumers such as machine.lanes
+    that read variables by name and only know the base instruction set.
+    """
 
-class CodeGenerator:
-    def __init__(self, ast: StmtNode):
+    def __init__(self, ast: StmtNode, tail_call: bool = True, opt_level: int = 0, dump=None,
+                 slots: bool = True, peephole: bool = True, passes=None):
         self.__ast = ast
-        self.lines: List[CodeLine] = []
+        self.__slots = slots
+        self.__peephole = peephole
+        self.__types = infer_types(ast)
+        self.ir = ir.Program()
         self.__funcs = {}
-        self.__compile_functions()
-        self.__generate_code(self.__ast)
-        self.__add_line(CodeLine('HALT'))
-
-    def __compile_functions(self):
-        for child in self.__ast.children:
-            if child.__class__.__name__ in ["FuncDeclarationNode"]:
-                self.__funcs[child.ident.name] = len(self.lines) + 1
-                if not isinstance(child.params.params[0], ParseResults):
-                    for param in child.params.params[::-1]:
-                        self.__add_line(CodeLine('STORE', param.name))
-                self.__generate_code(child.block)
-                if self.lines[len(self.lines) - 1].cmd not in ['RET']:
-                    self.__add_line(CodeLine('RET'))
-        if len(self.__funcs) != 0:
-            self.__add_line_at(CodeLine('JMP', len(self.lines) + 1), 0, len(self.lines))
-
-    def __generate_code(self, node: AstNode):
-        if node.__class__.__name__ in ["BinExprNode"]:
-            self.__compile_binexpr(node)
-        elif node.__class__.__name__ in ["UnaryExprNode"]:
-            self.__compile_unexpr(node)
-        elif node.__class__.__name__ in ["LiteralNode"]:
-            self.__add_line(CodeLine('PUSH', node.value))
-        elif node.__class__.__name__ in ["IdentNode"]:
-            self.__add_line(CodeLine('LOAD', node.name))
-        elif node.__class__.__name__ in ["ReturnNode"]:
-            self.__generate_code(node.argument)
-            self.__add_line(CodeLine('RET'))
-        elif node.__class__.__name__ in ["DeclaratorNode"]:
-            if node.init is not None:
-                self.__generate_code(node.init)
-                self.__add_line(CodeLine('STORE', node.ident.name))
-        elif node.__class__.__name__ in ["CallNode"]:
-            for param in node.args:
-                self.__generate_code(param)
-            if node.ident.name in builtin_funcs:
-                self.__add_line(CodeLine('CBLTN', node.ident.name))
+        self.__function = None
+        self.__block = None
+        self.__lower()
+        optimize(self.ir, opt_level, dump, passes)
+        self.lines: List[CodeLine] = []
+        self.__emit()
+        if tail_call:
+            self.lines = tail_calls(self.lines)
+
+    @property
+    def program(self) -> list:
+        instruction_table = Machine.get_instruction_table()
+        program = assemble(self.lines, instruction_table)
+        if self.__slots:
+            program = resolve_slots(program, instruction_table)
+        if self.__peephole:
+            program = optimize_program(program, instruction_table)
+        return program
+
+    # Lowering to the IR
+
+    def __lower(self):
+        defs = [child for child in self.__ast.childs if isinstance(child, DefNode)]
+        functions = [ir.Function(child.def_name.name, self.ir) for child in defs]
+        for function in functions:
+            self.__funcs[function.name] = function
+        self.ir.functions = functions
+        for child, function in zip(defs, functions):
+            self.__start(function)
+            params = [param.name for param in child.args.childs]
+            if params:
+                self.__block.stmts.append(ir.Params(params))
+            self.visit(child.stmt)
+            self.__block.term = ir.Return()
+        self.ir.main = ir.Function('main', self.ir)
+        self.__start(self.ir.main)
+        self.visit(self.__ast)
+        self.__block.term = ir.Halt()
+
+    def __start(self, function: ir.Function):
+        self.__function = function
+        self.__block = function.entry
+
+    def __enter(self, block: ir.Block):
+        self.__function.blocks.append(block)
+        self.__block = block
+
+    def __jump(self, target: ir.Block):
+        self.__block.term = ir.Jump(target)
+
+    def visit_LiteralNode(self, node: LiteralNode):
+        return ir.Const(node.value)
+
+    def visit_IdentNode(self, node: IdentNode):
+        return ir.Var(node.name, self.__types.get(node))
+
+    def visit_AssignNode(self, node: AssignNode):
+        self.__block.stmts.append(ir.Assign(node.var.name, self.visit(node.val)))
+
+    def visit_StmtListNode(self, node: StmtListNode):
+        for child in node.childs:
+            if isinstance(child, CallNode):
+                self.__block.stmts.append(ir.Eval(self.visit(child)))
             else:
-                self.__add_line(CodeLine('CALL', self.__funcs[node.ident.name]))
-        elif node.__class__.__name__ in ["BlockStatementNode", "VarDeclarationNode"]:
-            for child in node.children:
-                self.__generate_code(child)
-        elif node.__class__.__name__ in ["IfNode"]:
-            self.__compile_if(node)
-        elif node.__class__.__name__ in ["WhileNode"]:
-            self.__compile_while(node)
-        elif node.__class__.__name__ in ["DoWhileNode"]:
-            self.__compile_dowhile(node)
-        elif node.__class__.__name__ in ["ForNode"]:
-            self.__compile_for(node)
\ No newline at end of file
+                self.visit(child)
+
+    def visit_DefNode(self, node: DefNode):
+        # Functions are lowered up front by __lower
+        pass
+
+    def visit_BinOpNode(self, node: BinOpNode):
+        if node.op.value not in op_cmd:
+            raise Exception('Operator {} is not supported'.format(node.op.value))
+        return ir.BinOp(node.op.value, self.visit(node.arg1), self.visit(node.arg2), self.__types.get(node))
+
+    def visit_CallNode(self, node: CallNode):
+        name = node.func.name
+        args = [self.visit(param) for param in node.params]
+        if name in self.__funcs:
+            return ir.CallFunction(self.__funcs[name], args)
+        return ir.Call(name, args, self.__types.get(node))
+
+    def visit_IfNode(self, node: IfNode):
+        function = self.__function
+        then, end = function.new_block(), function.new_block()
+        else_ = function.new_block() if node.else_stmt else end
+        self.__block.term = ir.Branch(self.visit(node.cond), then, else_)
+        self.__enter(then)
+        self.visit(node.then_stmt)
+        self.__jump(end)
+        if node.else_stmt:
+            self.__enter(else_)
+            self.visit(node.else_stmt)
+            self.__jump(end)
+        self.__enter(end)
+
+    def visit_WhileNode(self, node: WhileNode):
+        function = self.__function
+        head, body, end = function.new_block(), function.new_block(), function.new_block()
+        self.__jump(head)
+        self.__enter(head)
+        head.term = ir.Branch(self.visit(node.cond), body, end)
+        self.__enter(body)
+        self.visit(node.stmt)
+        self.__jump(head)
+        self.__enter(end)
+
+    def visit_ForNode(self, node: ForNode):
+        call = node.for_in
+        if not isinstance(call, CallNode) or call.func.name != 'range' or not 1 <= len(call.params) <= 3:
+            raise Exception('Only for loops over range() are supported')
+        params = [self.visit(param) for param in call.params]
+        first, stop = (params[0], params[1]) if len(params) > 1 else (ir.Const(0), params[0])
+        step = params[2] if len(params) > 2 else ir.Const(1)
+        counter, stop_var, step_var = self.ir.new_temp(), self.ir.new_temp(), self.ir.new_temp()
+
+        # The bounds are evaluated once, before the loop
+        self.__block.stmts += [ir.Assign(counter, first), ir.Assign(stop_var, stop), ir.Assign(step_var, step)]
+
+        # The test block runs once per iteration: FOR_RANGE sets the loop
+        # variable from the counter, advances the counter and jumps back to
+        # the body, or falls through when the range is exhausted
+        function = self.__function
+        body, test, end = function.new_block(), function.new_block(), function.new_block()
+        self.__jump(test)
+        self.__enter(body)
+        self.visit(node.body)
+        self.__jump(test)
+        self.__enter(test)
+        test.term = ir.ForRange(counter, stop_var, step_var, node.init.name, body, end)
+        self.__enter(end)
+
+    def generic_visit(self, node: AstNode):
+        raise Exception('Code generation for {} is not supported'.format(node.__class__.__name__))
+
+    # Emission
+
+    def __emit(self):
+        # Lines, with each block in front of its own lines; jump operands are blocks
+        out = []
+        if self.ir.functions:
+            out.append(CodeLine('JUMP', self.ir.main.entry))
+        for function in self.ir.all_functions():
+            blocks = function.blocks
+            for i, block in enumerate(blocks):
+                out.append(block)
+                for stmt in block.stmts:
+                    self.__emit_stmt(stmt, out)
+                self.__emit_term(block.term, blocks[i + 1] if i + 1 < len(blocks) else None, out)
+
+        # Only the blocks something jumps to get a label
+        labels = {}
+        for line in out:
+            if isinstance(line, CodeLine):
+                for i, arg in enumerate(line.args):
+                    if isinstance(arg, ir.Block):
+                        line.args[i] = labels.setdefault(arg, CodeLine(LABEL))
+        for line in out:
+            if isinstance(line, CodeLine):
+                self.lines.append(line)
+            elif line in labels:
+                self.lines.append(labels[line])
+
+    def __emit_stmt(self, stmt: ir.Stmt, out: list):
+        if isinstance(stmt, ir.Assign):
+            self.__emit_expr(stmt.value, out)
+            out.append(CodeLine('STORE', stmt.name))
+        elif isinstance(stmt, ir.Eval):
+            self.__emit_expr(stmt.value, out)
+            out.append(CodeLine('POP'))
+        elif isinstance(stmt, ir.Params):
+            # Arguments are pushed in order, so the last one is on top
+            for name in stmt.names[::-1]:
+                out.append(CodeLine('STORE', name))
+        else:
+            raise Exception('Code generation for {} is not supported'.format(type(stmt).__name__))
+
+    def __emit_term(self, term: ir.Terminator, following: ir.Block, out: list):
+        if isinstance(term, ir.Jump):
+            if term.target is not following:
+                out.append(CodeLine('JUMP', term.target))
+        elif isinstance(term, ir.Branch):
+            self.__emit_expr(term.cond, out)
+            if term.if_true is term.if_false:
+                out.append(CodeLine('POP'))
+                self.__emit_term(ir.Jump(term.if_true), following, out)
+            elif term.if_false is following:
+                out.append(CodeLine('JUMP_IF', term.if_true))
+            else:
+                out.append(CodeLine('NOT'))
+                out.append(CodeLine('JUMP_IF', term.if_false))
+                self.__emit_term(ir.Jump(term.if_true), following, out)
+        elif isinstance(term, ir.ForRange):
+            out.append(CodeLine('FOR_RANGE', term.counter, term.stop, term.step, term.var, term.body))
+            self.__emit_term(ir.Jump(term.exit), following, out)
+        elif isinstance(term, ir.Return):
+            out.append(CodeLine('PUSH', None))
+            out.append(CodeLine('RET'))
+        else:
+            out.append(CodeLine('HALT'))
+
+    def __emit_expr(self, expr: ir.Expr, out: list):
+        if isinstance(expr, ir.Const):
+            out.append(CodeLine('PUSH', expr.value))
+        elif isinstance(expr, ir.Var):
+            out.append(CodeLine('LOAD', expr.name))
+        elif isinstance(expr, ir.BinOp):
+            self.__emit_expr(expr.lh, out)
+            self.__emit_expr(expr.rh, out)
+            for cmd in op_cmd[expr.op]:
+                out.append(CodeLine(cmd))
+        elif isinstance(expr, ir.CallFunction):
+            for arg in expr.args:
+                self.__emit_expr(arg, out)
+            out.append(CodeLine('CALL', expr.function.entry))
+        else:
+            # FUNC pops its arguments top first
+            for arg in expr.args[::-1]:
+                self.__emit_expr(arg, out)
+            out.append(CodeLine('FUNC', expr.name, len(expr.args)))
@@ -0,0 +1,166 @@
+"""Content addressed on-disk cache of compiled programs.
+
+An entry is keyed by the source text, the grammar version and the compiler
+version, so editing the grammar or the code generator invalidates old
+entries the way a new interpreter version does for __pycache__. Entries are
+the machine.bytecode form of the program prefixed by the time it took to
+compile, written to a temporary file and renamed into place. The directory
+is kept under ``max_bytes`` by evicting the least recently used entries;
+a hit refreshes the entry's mtime.
+"""
+import hashlib
+import os
+import struct
+import tempfile
+import time
+
+import AST.grammar as grammar
+import AST.lexer as lexer
+import AST.nodes as nodes
+import AST.pratt as pratt
+import AST.visitor as visitor
+import compiler.assembler as assembler
+import compiler.code_generator as code_generator
+import compiler.ir as ir
+import compiler.passes as passes
+import compiler.peephole as peephole
+import Semantic.type_inference as type_inference
+from machine import Machine
+from machine import bytecode
+
+SUFFIX = '.ctc'
+_COMPILE_TIME = struct.Struct('<d')
+
+
+def _files_digest(*modules) -> str:
+    digest = hashlib.sha1()
+    for module in modules:
+        with open(module.__file__, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+
+GRAMMAR_VERSION = _files_digest(grammar, lexer, pratt, nodes)
+COMPILER_VERSION = _files_digest(code_generator, ir, passes, assembler, peephole, visitor, type_inference) \
+    + Machine.get_instruction_table().version().hex()
+
+
+def compile_source(source: str) -> list:
+    """Compile source text to a flat program, without caching."""
+    return code_generator.CodeGenerator(grammar.parse_indented(source)).program
+
+
+class CacheStats:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.time_saved = 0.0
+
+    def __str__(self):
+        return 'hits=%d misses=%d evictions=%d saved=%.3fs' % (
+            self.hits, self.misses, self.evictions, self.time_saved)
+
+
+class CompileCache:
+    def __init__(self, directory: str, max_bytes: int = 16 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.instruction_table = Machine.get_instruction_table()
+        self.stats = CacheStats()
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(source: str) -> str:
+        digest = hashlib.sha256()
+        for part in (GRAMMAR_VERSION, COMPILER_VERSION, source):
+            digest.update(part.encode('utf-8'))
+            digest.update(b'\0')
+        return digest.hexdigest()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key + SUFFIX)
+
+    def compile(self, source: str) -> list:
+        """The compiled program for ``source``, from the cache when possible."""
+        start = time.perf_counter()
+        path = self.path(self.key(source))
+        program = self._read(path)
+        if program is not None:
+            program, compile_time = program
+            self.stats.hits += 1
+            self.stats.time_saved += max(compile_time - (time.perf_counter() - start), 0.0)
+            return program
+        self.stats.misses += 1
+        program = compile_source(source)
+        self._write(path, program, time.perf_counter() - start)
+        return program
+
+    def _read(self, path: str):
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)
+        except OSError:
+            return None
+        try:
+            program = bytecode.loads(data[_COMPILE_TIME.size:], self.instruction_table).to_list()
+        except (bytecode.BytecodeError, struct.error, IndexError):
+            # Truncated, damaged or foreign file, or cells that point past the
+            # constant pool; it is replaced on the next write
+            return None
+        return program, _COMPILE_TIME.unpack_from(data)[0]
+
+    def _write(self, path: str, program: list, compile_time: float):
+        try:
+            data = _COMPILE_TIME.pack(compile_time) + bytecode.dumps(program, self.instruction_table)
+        except bytecode.BytecodeError:
+            # Constants without a serialized form are compiled every time
+            return
+        fd, temp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(temp, path)
+        except BaseException:
+            os.unlink(temp)
+            raise
+        self.evict()
+
+    def entries(self) -> list:
+        """(mtime, size, path) of every entry, least recently used first."""
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(SUFFIX):
+                path = os.path.join(self.directory, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime_ns, stat.st_size, path))
+        return sorted(entries)
+
+    def evict(self):
+        entries = self.entries()
+        total = sum(size for mtime, size, path in entries)
+        for mtime, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            self.stats.evictions += 1
+
+    def clear(self):
+        for mtime, size, path in self.entries():
+            os.unlink(path)
+
+
+def compile_file(path: str, cache: CompileCache = None) -> list:
+    """Compile a source file, caching in ``__ctcache__`` next to it by default."""
+    if cache is None:
+        cache = CompileCache(os.path.join(os.path.dirname(os.path.abspath(path)), '__ctcache__'))
+    with open(path, encoding='utf-8') as f:
+        return cache.compile(f.read())
@@ -0,0 +1,193 @@
+"""Differential check of the back end.
+
+Random well-formed programs, the CASES below and any given files run under
+every configuration in CONFIGS; all of them must print the same output and
+end the same way: halted, or with the same kind of error.
+
+    python -m compiler.differential [--count N] [--seed S] [file ...]
+"""
+import argparse
+import contextlib
+import io
+import random
+import sys
+
+import AST.grammar as grammar
+from compiler.code_generator import CodeGenerator
+from compiler.passes import PASSES
+from machine import Machine
+
+# Instructions a program may run before it counts as not halting
+BUDGET = 1000000
+# name: (CodeGenerator options, Machine options)
+CONFIGS = {
+    'interpreted': ({}, {}),
+    'names': ({'slots': False}, {}),
+    'base instructions': ({'slots': False, 'peephole': False}, {}),
+    # Every function is compiled on its first call
+    'jit': ({}, {'jit_threshold': 1}),
+    'names jit': ({'slots': False}, {'jit_threshold': 1}),
+    # Sites specialize on their second run
+    'quickened': ({}, {'quicken_threshold': 2}),
+    'names quickened': ({'slots': False, 'peephole': False}, {'quicken_threshold': 2}),
+    '-O1': ({'opt_level': 1}, {}),
+    '-O2': ({'opt_level': 2}, {}),
+    '-O2 base instructions': ({'opt_level': 2, 'slots': False, 'peephole': False}, {}),
+    '-O2 jit': ({'opt_level': 2}, {'jit_threshold': 1}),
+}
+# Each pass of compiler.passes on its own
+CONFIGS.update(('only ' + pass_.__name__, ({'passes': {pass_.__name__}}, {})) for minimum, pass_ in PASSES)
+CASES = [
+    # Both operands of || and && are evaluated, even when the left one decides
+    'def f(p, q) :\n    print(1 || p / q)\nf(1, 0)\n',
+    'def f(p, q) :\n    print(0 && p / q)\nf(1, 0)\n',
+    # Values are computed in order: errors and output come as the machine gives them
+    'def f(a) :\n    y = (1 / 0) + print(5)\nf(1)\n',
+    'def f(a) :\n    print(a / 0, a + "s")\nf(1)\n',
+    'def f(a) :\n    print(print(a) + (a / 0) + print(2))\nf(1)\n',
+    # A self tail call restarts the function with fresh variables
+    'def f(n, acc) :\n    if n < 1 :\n        print(acc)\n    if n > 0 :\n        f(n - 1, acc + n)\nf(3000, 0)\n',
+    # Rotated loops test >, >= and == at the bottom
+    'i = 5\nwhile i > 0 :\n    i = i - 1\nwhile i >= 0 :\n    i = i - 2\nwhile i == -2 :\n    i = 7\nprint(i)\n',
+    'i = 5\nz = int("0")\nwhile i > z :\n    i = i - 1\nwhile i >= z :\n    i = i - 2\nz = int("-2")\nwhile i == z :\n    i = 7\nprint(i)\n',
+    # Nothing that can raise is hoisted out of a loop that does not run
+    'a = 0\ni = 0\nwhile i < 0 :\n    print(1 / a)\n    i = i + 1\nprint(i)\n',
+    # A value is not reused once an operand is assigned again
+    'a = 2\nb = a * 3 + 1\na = 5\nc = a * 3 + 1\nprint(b, c, a * 3 + 1)\n',
+    # An unused value that raises still raises
+    'x = 1 / 0\nprint(1)\n',
+    # Reading a variable that was never set raises, in frame slots as by name
+    'x = 1\nwhile x < 3 :\n    x = x + 1\n    y = z\nprint(x)\n',
+    'def f(a) :\n    print(z)\nf(1)\n',
+    'def f(a) :\n    if a > 1 :\n        b = 1\n    print(a + b, b > a)\nf(1)\n',
+    # ... including one set before a self tail call restarted the function
+    'def f(n) :\n    if n > 1 :\n        b = n\n    print(b)\n    if n > 0 :\n        f(n - 1)\nf(3)\n',
+    # Quickened sites see int operands, then float ones
+    'x = 1\ni = 0\nwhile i < 6 :\n    if i == 3 :\n        x = 0.5\n    y = x * 3\n    x = y - x\n    print(y, x > 2)\n    i = i + 1\n',
+    # 0.0 and -0.0 are different constants
+    'a = 0.0\nb = 0.0 * -1\nprint(1 / (a + 1), b, a)\n',
+]
+_OPS = ['+', '-', '*', '/', '<', '<=', '>', '>=', '==', '!=', '&&', '||']
+_NAMES = ['a', 'b', 'c', 'x', 'y']
+
+
+def outcome(tree, config: str):
+    options, machine_options = CONFIGS[config]
+    output = io.StringIO()
+    try:
+        program = CodeGenerator(tree, **options).program
+        with contextlib.redirect_stdout(output):
+            machine = Machine(program, Machine.get_instruction_table(), **machine_options)
+            machine.run_for(BUDGET)
+    except Exception as e:
+        return output.getvalue(), type(e).__name__
+    return output.getvalue(), 'halted' if machine.is_halted else 'running'
+
+
+class Generator:
+    """Programs that parse, terminate and only read variables they assigned."""
+
+    def __init__(self, rnd: random.Random):
+        self.rnd = rnd
+
+    def atom(self, names: list) -> str:
+        if names and self.rnd.random() < 0.6:
+            return self.rnd.choice(names)
+        return self.rnd.choice(['0', '1', '2', '7', '2.5', '0.5'])
+
+    def expr(self, names: list, depth: int = 0) -> str:
+        if depth > 2 or self.rnd.random() < 0.3:
+            return self.atom(names)
+        op = self.rnd.choice(_OPS)
+        # A constant factor keeps values from growing exponentially in loops
+        if op == '*':
+            rh = self.rnd.choice(['2', '3', '0.5'])
+        elif op == '/' and self.rnd.random() < 0.8:
+            rh = self.rnd.choice(['2', '0.5'])
+        else:
+            rh = self.expr(names, depth + 1)
+        return '(%s %s %s)' % (self.expr(names, depth + 1), op, rh)
+
+    def block(self, names: list, indent: int, functions: list) -> list:
+        """Lines of 1-3 statements; ``names`` gains the variables they surely assign."""
+        pad = '    ' * indent
+        lines = []
+        for i in range(self.rnd.randrange(1, 4)):
+            choice = self.rnd.randrange(6 if indent < 3 else 2)
+            if choice == 0:
+                name = self.rnd.choice(_NAMES)
+                lines.append(pad + '%s = %s' % (name, self.expr(names)))
+                if name not in names:
+                    names.append(name)
+            elif choice == 1:
+                lines.append(pad + 'print(%s)' % self.expr(names))
+            elif choice == 2 and functions:
+                name, arity = self.rnd.choice(functions)
+                lines.append(pad + '%s(%s)' % (name, ', '.join(self.expr(names) for i in range(arity))))
+            elif choice == 3:
+                lines.append(pad + 'if %s :' % self.expr(names))
+                lines += self.block(list(names), indent + 1, functions)
+            elif choice == 4:
+                counter = 'i%d' % indent
+                lines.append(pad + '%s = 0' % counter)
+                lines.append(pad + 'while %s < %d :' % (counter, self.rnd.randrange(5)))
+                lines += self.block(names + [counter], indent + 1, functions)
+                lines.append(pad + '    %s = %s + 1' % (counter, counter))
+                if counter not in names:
+                    names.append(counter)
+            else:
+                var = 'k%d' % indent
+                args = self.rnd.choice(['3', '0', '1, 5', '5, 1, -2'])
+                lines.append(pad + 'for %s in range(%s) :' % (var, args))
+                lines += self.block(names + [var], indent + 1, functions)
+        return lines
+
+    def program(self) -> str:
+        lines = []
+        functions = []
+        for i in range(self.rnd.randrange(3)):
+            params = ['p', 'q'][:self.rnd.randrange(3)]
+            lines.append('def f%d(%s) :' % (i, ', '.join(params)))
+            lines += self.block(list(params), 1, functions)
+            functions.append(('f%d' % i, len(params)))
+        names = []
+        lines += self.block(names, 0, functions)
+        lines += self.block(names, 0, functions)
+        if names:
+            lines.append('print(%s)' % ', '.join(names))
+        return '\n'.join(lines) + '\n'
+
+
+def check(prog: str) -> bool:
+    tree = grammar.parse_indented(prog)
+    results = {config: outcome(tree, config) for config in CONFIGS}
+    expected = results['interpreted']
+    if any(result != expected for result in results.values()):
+        print('MISMATCH for %r' % prog)
+        for config, result in results.items():
+            print('  %s: %r' % (config, result))
+        return False
+    return True
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m compiler.differential')
+    parser.add_argument('--count', type=int, default=300, help='random programs to generate')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('files', nargs='*', help='source files to check as well')
+    args = parser.parse_args(argv)
+
+    generator = Generator(random.Random(args.seed))
+    progs = list(CASES)
+    for path in args.files:
+        with open(path, encoding='utf-8') as f:
+            progs.append(f.read())
+    progs.extend(generator.program() for i in range(args.count))
+
+    failures = sum(not check(prog) for prog in progs)
+    print('%d programs, %d configurations, %d mismatches' % (len(progs), len(CONFIGS), failures))
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,200 @@
+"""Timing and allocation instrumentation of the compiler pipeline.
+
+Code that can be measured takes an ``instrumentation`` argument and wraps
+its stages in ``with instrumentation.stage(name):``. Each stage records its
+wall time and, with ``memory`` set, the bytes it left allocated and its
+peak according to tracemalloc. Counters hold the rest: AST nodes, code
+lines, executed instructions. Anything worth computing only for a report
+is guarded by ``instrumentation.enabled``. ``NO_INSTRUMENTATION`` is the
+default: its stages are a shared object whose enter and exit do nothing.
+
+Stages may nest for timing; tracemalloc peaks are reset per stage, so an
+enclosing stage's peak only covers the time after its last inner stage.
+"""
+import json
+import time
+import tracemalloc
+
+import AST.grammar as grammar
+from AST.nodes import IdentNode
+from Semantic.semantic import SemanticAnalyzer
+from compiler.code_generator import CodeGenerator
+from machine import Machine
+
+
+class _NullStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class NullInstrumentation:
+    enabled = False
+
+    def stage(self, name: str) -> _NullStage:
+        return _NULL_STAGE
+
+    def count(self, name: str, value: int = 1):
+        pass
+
+
+NO_INSTRUMENTATION = NullInstrumentation()
+
+
+class Stage:
+    __slots__ = ('name', 'instrumentation', 'start', 'time', 'allocated', 'peak', '_memory_start')
+
+    def __init__(self, name: str, instrumentation: 'Instrumentation'):
+        self.name = name
+        self.instrumentation = instrumentation
+        self.time = 0.0
+        self.allocated = None
+        self.peak = None
+
+    def __enter__(self):
+        if self.instrumentation.memory:
+            self._memory_start = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.time = time.perf_counter() - self.start
+        if self.instrumentation.memory:
+            current, peak = tracemalloc.get_traced_memory()
+            self.allocated = current - self._memory_start
+            self.peak = peak - self._memory_start
+        self.instrumentation.stages.append(self)
+        return False
+
+    def as_dict(self) -> dict:
+        result = {'name': self.name, 'time': self.time}
+        if self.allocated is not None:
+            result['allocated'] = self.allocated
+            result['peak'] = self.peak
+        return result
+
+
+class Instrumentation:
+    """Stage timings, allocations and counters of one run.
+
+    With ``memory`` set, tracemalloc is started (unless it already runs)
+    and stays on until ``close``; use the instrumentation as a context
+    manager to have that done.
+    """
+    enabled = True
+
+    def __init__(self, memory: bool = False):
+        self.memory = memory
+        self.stages = []
+        self.counters = {}
+        self._started_tracemalloc = False
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+    def close(self):
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+
+    def stage(self, name: str) -> Stage:
+        return Stage(name, self)
+
+    def count(self, name: str, value: int = 1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def report(self) -> dict:
+        return {
+            'stages': [stage.as_dict() for stage in self.stages],
+            'counters': dict(self.counters),
+            'memory': self.memory,
+        }
+
+    def dumps(self) -> str:
+        return json.dumps(self.report(), indent=2)
+
+    def save(self, path: str):
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(self.dumps())
+            f.write('\n')
+
+    def __str__(self):
+        lines = []
+        for stage in self.stages:
+            line = '%-24s %10.3f ms' % (stage.name, stage.time * 1e3)
+            if stage.allocated is not None:
+                line += '  %10.1f KiB allocated  %10.1f KiB peak' % (stage.allocated / 1024, stage.peak / 1024)
+            lines.append(line)
+        for name, value in self.counters.items():
+            lines.append('%-24s %d' % (name, value))
+        return '\n'.join(lines)
+
+
+def compile_program(source: str, instrumentation=NO_INSTRUMENTATION, analyze: bool = True,
+                    opt_level: int = 0, dump_ir=None, slots: bool = True, peephole: bool = True) -> list:
+    """Parse, analyze and compile ``source`` to a flat program, stage by stage.
+
+    ``opt_level``, ``dump_ir``, ``slots`` and ``peephole`` are passed on to the
+    CodeGenerator.
+    """
+    with instrumentation.stage('parse'):
+        tree = grammar.parse_indented(source)
+    if instrumentation.enabled:
+        nodes = 0
+        identifiers = 0
+        for node in tree.walk():
+            nodes += 1
+            identifiers += isinstance(node, IdentNode)
+        instrumentation.count('ast_nodes', nodes)
+        instrumentation.count('identifiers', identifiers)
+    if analyze:
+        with instrumentation.stage('semantic'):
+            analyzer = SemanticAnalyzer()
+            analyzer.visit(tree)
+        if instrumentation.enabled:
+            instrumentation.count('unresolved_identifiers', len(analyzer.unresolved))
+    with instrumentation.stage('codegen'):
+        generator = CodeGenerator(tree, opt_level=opt_level, dump=dump_ir, slots=slots,
+                                  peephole=peephole)
+        program = generator.program
+    if instrumentation.enabled:
+        instrumentation.count('code_lines', len(generator.lines))
+        instrumentation.count('program_cells', len(program))
+    return program
+
+
+def run_program(program: list, instrumentation=NO_INSTRUMENTATION, **machine_options) -> Machine:
+    with instrumentation.stage('load'):
+        machine = Machine(program, Machine.get_instruction_table(), **machine_options)
+    with instrumentation.stage('run'):
+        if instrumentation.enabled:
+            instrumentation.count('instructions', machine.run_counted())
+        else:
+            machine.run()
+    return machine
+
+
+def profile(source: str, run: bool = True, memory: bool = False, opt_level: int = 0,
+            slots: bool = True, peephole: bool = True) -> Instrumentation:
+    """Compile and optionally run ``source`` with every stage measured."""
+    with Instrumentation(memory) as instrumentation:
+        program = compile_program(source, instrumentation, opt_level=opt_level, slots=slots,
+                                  peephole=peephole)
+        if run:
+            run_program(program, instrumentation)
+    return instrumentation
@@ -0,0 +1,459 @@
+"""Basic-block intermediate representation between the AST and code lines.
+
+A Program holds one Function per top-level ``def`` plus ``main``. A
+function is a control-flow graph of Blocks; each block is a list of
+statements (Assign, Eval, Params) ending in one terminator (Jump, Branch,
+ForRange, Return, Halt) whose targets are the block's successors.
+Expressions are trees of Const, Var, BinOp and calls; every expression
+carries the type Semantic.type_inference proved for it, or None.
+
+Statements run in order and an expression's operands are evaluated left
+to right, as the emitted stack code does. The only expressions with side
+effects are calls; everything else is pure apart from the exceptions it
+may raise. ``Function.blocks`` is the layout order used by emission.
+"""
+from Semantic.type_inference import INT, FLOAT, STR, BOOL
+
+_CONST_TYPES = {int: INT, float: FLOAT, str: STR, bool: BOOL}
+
+
+# Expressions
+
+class Expr:
+    __slots__ = ('type',)
+
+    def children(self) -> tuple:
+        return ()
+
+    def rebuild(self, func) -> 'Expr':
+        """This expression with every child replaced by ``func(child)``."""
+        return self
+
+
+class Const(Expr):
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+        self.type = _CONST_TYPES.get(type(value))
+
+    def __str__(self):
+        return repr(self.value)
+
+
+class Var(Expr):
+    __slots__ = ('name',)
+
+    def __init__(self, name: str, type_=None):
+        self.name = name
+        self.type = type_
+
+    def __str__(self):
+        return self.name
+
+
+class BinOp(Expr):
+    __slots__ = ('op', 'lh', 'rh')
+
+    def __init__(self, op: str, lh: Expr, rh: Expr, type_=None):
+        self.op = op
+        self.lh = lh
+        self.rh = rh
+        self.type = type_
+
+    def children(self) -> tuple:
+        return self.lh, self.rh
+
+    def rebuild(self, func) -> Expr:
+        lh, rh = func(self.lh), func(self.rh)
+        if lh is self.lh and rh is self.rh:
+            return self
+        return BinOp(self.op, lh, rh, self.type)
+
+    def __str__(self):
+        return '(%s %s %s)' % (self.lh, self.op, self.rh)
+
+
+class Call(Expr):
+    """A builtin called with FUNC."""
+    __slots__ = ('name', 'args')
+
+    def __init__(self, name: str, args: list, type_=None):
+        self.name = name
+        self.args = args
+        self.type = type_
+
+    def children(self) -> tuple:
+        return tuple(self.args)
+
+    def rebuild(self, func) -> Expr:
+        args = [func(arg) for arg in self.args]
+        if all(new is old for new, old in zip(args, self.args)):
+            return self
+        return Call(self.name, args, self.type)
+
+    def __str__(self):
+        return '%s(%s)' % (self.name, ', '.join(str(arg) for arg in self.args))
+
+
+class CallFunction(Expr):
+    """A call of a program function; the result is always None."""
+    __slots__ = ('function', 'args')
+
+    def __init__(self, function: 'Function', args: list):
+        self.function = function
+        self.args = args
+        self.type = None
+
+    def children(self) -> tuple:
+        return tuple(self.args)
+
+    def rebuild(self, func) -> Expr:
+        args = [func(arg) for arg in self.args]
+        if all(new is old for new, old in zip(args, self.args)):
+            return self
+        return CallFunction(self.function, args)
+
+    def __str__(self):
+        return 'call %s(%s)' % (self.function.name, ', '.join(str(arg) for arg in self.args))
+
+
+def walk(expr: Expr):
+    """``expr`` and all its subexpressions, in pre-order."""
+    stack = [expr]
+    while stack:
+        expr = stack.pop()
+        yield expr
+        stack.extend(reversed(expr.children()))
+
+
+def is_pure(expr: Expr) -> bool:
+    """Whether evaluating ``expr`` calls nothing, so only its operands decide its value."""
+    return not any(isinstance(sub, (Call, CallFunction)) for sub in walk(expr))
+
+
+def reads(expr: Expr) -> set:
+    return {sub.name for sub in walk(expr) if isinstance(sub, Var)}
+
+
+# Statements and terminators. ``exprs`` are the expressions they evaluate,
+# in order; ``replace(func)`` substitutes each of them with func(expr).
+
+class Stmt:
+    __slots__ = ()
+    exprs = ()
+
+    def replace(self, func):
+        pass
+
+    def defines(self) -> tuple:
+        return ()
+
+
+class Assign(Stmt):
+    __slots__ = ('name', 'value')
+
+    def __init__(self, name: str, value: Expr):
+        self.name = name
+        self.value = value
+
+    @property
+    def exprs(self):
+        return self.value,
+
+    def replace(self, func):
+        self.value = func(self.value)
+
+    def defines(self) -> tuple:
+        return self.name,
+
+    def __str__(self):
+        return '%s = %s' % (self.name, self.value)
+
+
+class Eval(Stmt):
+    """An expression evaluated for its side effects; the result is dropped."""
+    __slots__ = ('value',)
+
+    def __init__(self, value: Expr):
+        self.value = value
+
+    @property
+    def exprs(self):
+        return self.value,
+
+    def replace(self, func):
+        self.value = func(self.value)
+
+    def __str__(self):
+        return str(self.value)
+
+
+class Params(Stmt):
+    """Stores the arguments of a call, which the caller left on the operand stack."""
+    __slots__ = ('names',)
+
+    def __init__(self, names: list):
+        self.names = names
+
+    def defines(self) -> tuple:
+        return tuple(self.names)
+
+    def __str__(self):
+        return 'params ' + ', '.join(self.names)
+
+
+class Terminator(Stmt):
+    __slots__ = ()
+
+    def successors(self) -> tuple:
+        return ()
+
+    def retarget(self, old: 'Block', new: 'Block'):
+        pass
+
+
+class Jump(Terminator):
+    __slots__ = ('target',)
+
+    def __init__(self, target: 'Block'):
+        self.target = target
+
+    def successors(self) -> tuple:
+        return self.target,
+
+    def retarget(self, old, new):
+        if self.target is old:
+            self.target = new
+
+    def __str__(self):
+        return 'jump %s' % self.target
+
+
+class Branch(Terminator):
+    __slots__ = ('cond', 'if_true', 'if_false')
+
+    def __init__(self, cond: Expr, if_true: 'Block', if_false: 'Block'):
+        self.cond = cond
+        self.if_true = if_true
+        self.if_false = if_false
+
+    @property
+    def exprs(self):
+        return self.cond,
+
+    def replace(self, func):
+        self.cond = func(self.cond)
+
+    def successors(self) -> tuple:
+        return self.if_true, self.if_false
+
+    def retarget(self, old, new):
+        if self.if_true is old:
+            self.if_true = new
+        if self.if_false is old:
+            self.if_false = new
+
+    def __str__(self):
+        return 'branch %s ? %s : %s' % (self.cond, self.if_true, self.if_false)
+
+
+class ForRange(Terminator):
+    """Next iteration of a range() loop: enter ``body`` with ``var`` set, or leave to ``exit``."""
+    __slots__ = ('counter', 'stop', 'step', 'var', 'body', 'exit')
+
+    def __init__(self, counter: str, stop: str, step: str, var: str, body: 'Block', exit: 'Block'):
+        self.counter = counter
+        self.stop = stop
+        self.step = step
+        self.var = var
+        self.body = body
+        self.exit = exit
+
+    def defines(self) -> tuple:
+        return self.var, self.counter
+
+    def successors(self) -> tuple:
+        return self.body, self.exit
+
+    def retarget(self, old, new):
+        if self.body is old:
+            self.body = new
+        if self.exit is old:
+            self.exit = new
+
+    def __str__(self):
+        return 'for %s in %s..%s step %s ? %s : %s' % (
+            self.var, self.counter, self.stop, self.step, self.body, self.exit)
+
+
+class Return(Terminator):
+    __slots__ = ()
+
+    def __str__(self):
+        return 'return'
+
+
+class Halt(Terminator):
+    __slots__ = ()
+
+    def __str__(self):
+        return 'halt'
+
+
+def uses(stmt: Stmt) -> set:
+    """Variables ``stmt`` reads."""
+    names = set()
+    for expr in stmt.exprs:
+        names |= reads(expr)
+    if isinstance(stmt, ForRange):
+        names.update((stmt.counter, stmt.stop, stmt.step))
+    return names
+
+
+# Graph
+
+class Block:
+    __slots__ = ('id', 'stmts', 'term')
+
+    def __init__(self, id: int):
+        self.id = id
+        self.stmts = []
+        self.term = None
+
+    def successors(self) -> tuple:
+        return self.term.successors()
+
+    def __str__(self):
+        return 'b%d' % self.id
+
+    def __repr__(self):
+        return '<Block b%d>' % self.id
+
+
+class Function:
+    def __init__(self, name: str, program: 'Program'):
+        self.name = name
+        self.program = program
+        self.entry = self.new_block()
+        self.blocks = [self.entry]
+
+    def new_block(self) -> Block:
+        return Block(self.program.new_block_id())
+
+    def add_block(self) -> Block:
+        block = self.new_block()
+        self.blocks.append(block)
+        return block
+
+    @property
+    def is_main(self) -> bool:
+        return self is self.program.main
+
+    def predecessors(self) -> dict:
+        preds = {block: [] for block in self.blocks}
+        for block in self.blocks:
+            for succ in block.successors():
+                preds[succ].append(block)
+        return preds
+
+    def reachable(self) -> list:
+        """Blocks reachable from the entry, in depth-first preorder."""
+        seen = {self.entry}
+        order = []
+        stack = [self.entry]
+        while stack:
+            block = stack.pop()
+            order.append(block)
+            for succ in reversed(block.successors()):
+                if succ not in seen:
+                    seen.add(succ)
+                    stack.append(succ)
+        return order
+
+    def reverse_postorder(self) -> list:
+        seen = set()
+        order = []
+        stack = [(self.entry, iter(self.entry.successors()))]
+        seen.add(self.entry)
+        while stack:
+            block, succs = stack[-1]
+            for succ in succs:
+                if succ not in seen:
+                    seen.add(succ)
+                    stack.append((succ, iter(succ.successors())))
+                    break
+            else:
+                stack.pop()
+                order.append(block)
+        order.reverse()
+        return order
+
+    def dominators(self) -> dict:
+        """Block -> set of the blocks dominating it, for reachable blocks."""
+        order = self.reverse_postorder()
+        preds = self.predecessors()
+        everything = set(order)
+        dom = {block: set(everything) for block in order}
+        dom[self.entry] = {self.entry}
+        changed = True
+        while changed:
+            changed = False
+            for block in order[1:]:
+                incoming = [dom[pred] for pred in preds[block] if pred in dom]
+                new = set.intersection(*incoming) if incoming else set()
+                new.add(block)
+                if new != dom[block]:
+                    dom[block] = new
+                    changed = True
+        return dom
+
+    def loops(self) -> list:
+        """(header, body) of each natural loop, innermost first; body includes the header."""
+        dom = self.dominators()
+        preds = self.predecessors()
+        found = {}
+        for block in dom:
+            for succ in block.successors():
+                if succ in dom[block]:
+                    # Back edge block -> succ
+                    body = found.setdefault(succ, {succ})
+                    stack = [block]
+                    while stack:
+                        node = stack.pop()
+                        if node not in body:
+                            body.add(node)
+                            stack.extend(pred for pred in preds[node] if pred in dom)
+        return sorted(found.items(), key=lambda item: len(item[1]))
+
+    def dump(self) -> str:
+        header = 'main' if self.is_main else 'function %s' % self.name
+        lines = [header + ':']
+        for block in self.blocks:
+            lines.append('  %s:' % block)
+            lines.extend('    %s' % stmt for stmt in block.stmts)
+            lines.append('    %s' % block.term)
+        return '\n'.join(lines)
+
+
+class Program:
+    def __init__(self):
+        self._blocks = 0
+        self._temps = 0
+        self.functions = []
+        self.main = None
+
+    def new_block_id(self) -> int:
+        self._blocks += 1
+        return self._blocks - 1
+
+    def new_temp(self) -> str:
+        # Hidden variables can not clash with identifiers
+        self._temps += 1
+        return '$' + str(self._temps)
+
+    def all_functions(self) -> list:
+        return self.functions + [self.main]
+
+    def dump(self) -> str:
+        return '\n'.join(function.dump() for function in self.all_functions()) + '\n'
@@ -1,11 +1,10 @@
-import os
+import argparse
+import sys
+
 import AST.grammar as grammar
-import compiler.compiler_utils as compiler_utils
 from Semantic.semantic import *
 
-
-def main():
-    prog = '''
+DEMO = '''
 str = "Hello"
 name = input("Input name: ") // comment 
 print(str, name)
@@ -30,8 +29,68 @@ def func(a):
 
     '''
 
-    prog = grammar.parse(compiler_utils.close_blocks(prog))
-    print(*prog.tree, sep=os.linesep)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m compiler.main')
+    parser.add_argument('file', nargs='?', help='source file (default: a demo program)')
+    parser.add_argument('--run', action='store_true', help='compile and run the program')
+    parser.add_argument('-O', type=int, choices=range(3), default=0, metavar='LEVEL', dest='opt_level',
+                        help='optimization level: 0 none, 1 constants, dead code and layout, '
+                             '2 also common subexpressions and loop invariants (default: 0)')
+    parser.add_argument('--dump-ir', action='store_true',
+                        help='write the IR before and after each optimization pass to stderr')
+    parser.add_argument('--names', action='store_false', dest='slots',
+                        help='keep variables in name based LOAD/STORE instead of frame slots, for debugging')
+    parser.add_argument('--no-peephole', action='store_false', dest='peephole',
+                        help='do not fuse instruction sequences into superinstructions, for debugging')
+    parser.add_argument('--profile', nargs='?', const='-', metavar='REPORT',
+                        help='time each stage; write a JSON report to REPORT, or a summary to stderr')
+    parser.add_argument('--profile-memory', action='store_true',
+                        help='with --profile, also record allocations with tracemalloc')
+    parser.add_argument('--vm-profile', nargs='?', const='-', metavar='STACKS',
+                        help='run under the VM profiler; print its report to stderr and '
+                             'write collapsed stacks for flamegraph tools to STACKS')
+    parser.add_argument('--vm-sample', type=int, metavar='N',
+                        help='with --vm-profile, sample one instruction in N instead of counting all')
+    args = parser.parse_args(argv)
+
+    if args.file is None:
+        prog = DEMO
+    else:
+        with open(args.file, encoding='utf-8') as f:
+            prog = f.read()
+
+    dump_ir = sys.stderr if args.dump_ir else None
+    options = {'opt_level': args.opt_level, 'slots': args.slots, 'peephole': args.peephole}
+    if args.profile is not None:
+        from compiler.instrumentation import profile
+        report = profile(prog, run=args.run, memory=args.profile_memory, **options)
+        if args.profile == '-':
+            print(report, file=sys.stderr)
+        else:
+            report.save(args.profile)
+        return
+    if args.vm_profile is not None:
+        from compiler.instrumentation import compile_program
+        from machine import Machine, Profiler
+        machine = Machine(compile_program(prog, dump_ir=dump_ir, **options), Machine.get_instruction_table())
+        profiler = Profiler(machine, sample_every=args.vm_sample).run()
+        print(profiler, file=sys.stderr)
+        if args.vm_profile != '-':
+            with open(args.vm_profile, 'w', encoding='utf-8') as f:
+                profiler.write_collapsed(f)
+        return
+    if args.run:
+        from compiler.instrumentation import compile_program, run_program
+        run_program(compile_program(prog, dump_ir=dump_ir, **options))
+        return
+    if dump_ir is not None:
+        from compiler.instrumentation import compile_program
+        compile_program(prog, dump_ir=dump_ir, **options)
+        return
+
+    prog = grammar.parse_indented(prog)
+    prog.print_tree()
     symb_table_builder = SemanticAnalyzer()
     symb_table_builder.visit(prog)
 
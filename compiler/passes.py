@@ -0,0 +1,619 @@
+"""Optimization passes over the IR of compiler.ir.
+
+Each pass rewrites one ir.Function in place. ``optimize`` runs the passes
+enabled at an ``-O`` level over every function of a program:
+
+    -O0  nothing: blocks are emitted as the AST was lowered
+    -O1  constant folding and propagation, CFG simplification (unreachable
+         blocks, jump threading, block merging), dead-code elimination and
+         block layout
+    -O2  also common-subexpression elimination and loop-invariant code motion
+
+The passes keep what a program does, including the error it stops with: an
+expression that may raise (a division, an operator on operands of unknown
+types, a variable that may be unset) is never dropped or moved, only reused
+where it already ran. Every variable of the main program is live when it
+halts, since the host reads them; the variables of a function die with it.
+"""
+import operator
+
+from compiler import ir
+from Semantic.type_inference import INT, FLOAT, STR, BOOL
+
+# Folded constants larger than this stay computed at run time
+MAX_FOLDED_LENGTH = 256
+MAX_FOLDED_BITS = 1024
+
+# Python semantics of each operator, as the instructions of op_cmd compute it
+_OPERATORS = {
+    '+': operator.add,
+    '-': operator.sub,
+    '*': operator.mul,
+    '/': operator.truediv,
+    '>=': operator.ge,
+    '<=': lambda lh, rh: not lh > rh,
+    '!=': lambda lh, rh: not lh == rh,
+    '==': operator.eq,
+    '>': operator.gt,
+    '<': lambda lh, rh: not lh >= rh,
+    # Both operands are evaluated, then 'and' or 'or' picks one
+    '&&': lambda lh, rh: lh and rh,
+    '||': lambda lh, rh: lh or rh,
+}
+
+_INTEGERS = (INT, BOOL)
+_NUMBERS = (INT, FLOAT, BOOL)
+_ORDERED = ('>=', '<=', '>', '<')
+
+
+# Expression helpers
+
+def _key(const: ir.Const):
+    # 1, 1.0 and True are equal but are different constants, so are 0.0 and -0.0
+    return type(const.value), repr(const.value)
+
+
+def _foldable(value) -> bool:
+    if isinstance(value, str):
+        return len(value) <= MAX_FOLDED_LENGTH
+    if isinstance(value, bool) or isinstance(value, float) or value is None:
+        return True
+    return isinstance(value, int) and value.bit_length() <= MAX_FOLDED_BITS
+
+
+def fold(expr: ir.Expr) -> ir.Expr:
+    """``expr`` with the operators on constants computed."""
+    expr = expr.rebuild(fold)
+    if not isinstance(expr, ir.BinOp) or not isinstance(expr.lh, ir.Const):
+        return expr
+    lh = expr.lh.value
+    if isinstance(expr.rh, ir.Const):
+        try:
+            value = _OPERATORS[expr.op](lh, expr.rh.value)
+        except Exception:
+            # Raised at run time, as before
+            return expr
+        return ir.Const(value) if _foldable(value) else expr
+    # The right operand is evaluated anyway and is the result
+    if expr.op == '&&' and lh or expr.op == '||' and not lh:
+        return expr.rh
+    return expr
+
+
+def _substitute(expr: ir.Expr, constants: dict) -> ir.Expr:
+    if isinstance(expr, ir.Var):
+        const = constants.get(expr.name)
+        return ir.Const(const.value) if const is not None else expr
+    return expr.rebuild(lambda child: _substitute(child, constants))
+
+
+def _propagate(expr: ir.Expr, constants: dict) -> ir.Expr:
+    """``expr`` with the subexpressions that are constant given ``constants`` folded.
+
+    A variable on its own stays a load: that costs what pushing the constant
+    does, and keeps the slot superinstructions of compiler.peephole.
+    """
+    if isinstance(expr, ir.Var):
+        return expr
+    folded = fold(_substitute(expr, constants))
+    if isinstance(folded, ir.Const):
+        return folded
+    return fold(expr.rebuild(lambda child: _propagate(child, constants)))
+
+
+def _safe_operator(expr: ir.BinOp) -> bool:
+    lh, rh = expr.lh.type, expr.rh.type
+    if lh is None or rh is None:
+        return False
+    if expr.op in ('==', '!=', '&&', '||'):
+        return True
+    if expr.op in _ORDERED:
+        return lh in _NUMBERS and rh in _NUMBERS or lh == rh == STR
+    if expr.op == '/':
+        return lh == rh == FLOAT and isinstance(expr.rh, ir.Const) and expr.rh.value != 0
+    if expr.op == '+' and lh == rh == STR:
+        return True
+    # Mixing ints and floats can overflow converting the int
+    return expr.op in ('+', '-', '*') and (lh in _INTEGERS and rh in _INTEGERS or lh == rh == FLOAT)
+
+
+def is_safe(expr: ir.Expr, defined) -> bool:
+    """Whether ``expr`` can neither raise nor have an effect, if the variables in ``defined`` are set."""
+    for sub in ir.walk(expr):
+        if isinstance(sub, ir.Var):
+            if sub.name not in defined:
+                return False
+        elif isinstance(sub, ir.BinOp):
+            if not _safe_operator(sub):
+                return False
+        elif not isinstance(sub, ir.Const):
+            return False
+    return True
+
+
+# Analyses
+
+def _rewrite_exprs(function: ir.Function, func):
+    for block in function.blocks:
+        for stmt in block.stmts:
+            stmt.replace(func)
+        block.term.replace(func)
+
+
+def _edge_defines(block: ir.Block, succ: ir.Block) -> tuple:
+    term = block.term
+    if isinstance(term, ir.ForRange) and succ is term.body:
+        return term.var,
+    return ()
+
+
+def definitely_set(function: ir.Function) -> dict:
+    """Block -> names certainly set on entry to it, on every path.
+
+    A variable is set after a statement assigns it, and also after one
+    reads it: had it not been set, the read would have raised.
+    """
+    order = function.reverse_postorder()
+    preds = function.predecessors()
+    ins = {function.entry: frozenset()}
+    outs = {}
+    changed = True
+    while changed:
+        changed = False
+        for block in order:
+            if block is not function.entry:
+                incoming = [outs[pred] | set(_edge_defines(pred, block)) for pred in preds[block] if pred in outs]
+                new = frozenset.intersection(*incoming)
+                if ins.get(block) != new:
+                    ins[block] = new
+                    changed = True
+            defined = set(ins[block])
+            for stmt in block.stmts:
+                defined |= ir.uses(stmt)
+                defined.update(stmt.defines())
+            defined |= ir.uses(block.term)
+            outs[block] = frozenset(defined)
+    return ins
+
+
+def _all_names(function: ir.Function) -> set:
+    names = set()
+    for block in function.blocks:
+        for stmt in block.stmts + [block.term]:
+            names |= ir.uses(stmt)
+            names.update(stmt.defines())
+    return names
+
+
+def live_variables(function: ir.Function) -> dict:
+    """Block -> names whose value may still be read after the block ends."""
+    exit_live = {name for name in _all_names(function) if not name.startswith('$')}
+    blocks = function.reachable()
+    live_in = {block: set() for block in blocks}
+    live_out = {}
+    changed = True
+    while changed:
+        changed = False
+        for block in reversed(blocks):
+            term = block.term
+            if isinstance(term, ir.Halt):
+                live = set(exit_live)
+            else:
+                live = set()
+                for succ in term.successors():
+                    live |= live_in[succ]
+            live_out[block] = set(live)
+            # A loop may run no iteration, so FOR_RANGE does not always set its variable
+            live |= ir.uses(term)
+            for stmt in block.stmts[::-1]:
+                live.difference_update(stmt.defines())
+                live |= ir.uses(stmt)
+            if live != live_in[block]:
+                live_in[block] = live
+                changed = True
+    return live_out
+
+
+# Passes
+
+def fold_constants(function: ir.Function):
+    """Compute operators on constants; branch on a constant condition directly."""
+    _rewrite_exprs(function, fold)
+    for block in function.blocks:
+        term = block.term
+        if isinstance(term, ir.Branch) and isinstance(term.cond, ir.Const):
+            block.term = ir.Jump(term.if_true if term.cond.value else term.if_false)
+
+
+def propagate_constants(function: ir.Function):
+    """Fold expressions over variables that hold the same constant on every path.
+
+    A variable is constant after an assignment of a constant, folded with
+    what is known at that point. Paths meet at block entries, and a variable
+    that is constant on only some of them is not. Variables the host may
+    set before the program runs are never constant on entry. Branch
+    conditions that turn out constant become jumps.
+    """
+    order = function.reverse_postorder()
+    preds = function.predecessors()
+    outs = {}
+
+    def condition(expr, constants):
+        folded = fold(_substitute(expr, constants))
+        return folded if isinstance(folded, ir.Const) else _propagate(expr, constants)
+
+    def transfer(block, constants, rewrite):
+        for stmt in block.stmts:
+            if rewrite:
+                stmt.replace(lambda expr: _propagate(expr, constants))
+            if isinstance(stmt, ir.Assign):
+                value = fold(_substitute(stmt.value, constants))
+                if isinstance(value, ir.Const):
+                    constants[stmt.name] = value
+                    continue
+            for name in stmt.defines():
+                constants.pop(name, None)
+        if rewrite:
+            block.term.replace(lambda expr: condition(expr, constants))
+        for name in block.term.defines():
+            constants.pop(name, None)
+        return constants
+
+    def entry_constants(block):
+        if block is function.entry:
+            return {}
+        incoming = [outs[pred] for pred in preds[block] if pred in outs]
+        constants = dict(incoming[0])
+        for other in incoming[1:]:
+            for name, const in list(constants.items()):
+                if name not in other or _key(other[name]) != _key(const):
+                    del constants[name]
+        return constants
+
+    changed = True
+    while changed:
+        changed = False
+        for block in order:
+            out = transfer(block, entry_constants(block), False)
+            if block not in outs or {name: _key(const) for name, const in outs[block].items()} \
+                    != {name: _key(const) for name, const in out.items()}:
+                outs[block] = out
+                changed = True
+    for block in order:
+        transfer(block, entry_constants(block), True)
+    fold_constants(function)
+
+
+def simplify_cfg(function: ir.Function):
+    """Drop unreachable blocks, jump past empty blocks and merge straight-line chains."""
+    for block in function.blocks:
+        term = block.term
+        if isinstance(term, ir.Branch) and term.if_true is term.if_false:
+            if not isinstance(term.cond, ir.Const):
+                block.stmts.append(ir.Eval(term.cond))
+            block.term = ir.Jump(term.if_true)
+    changed = True
+    while changed:
+        changed = False
+        reachable = set(function.reachable())
+        function.blocks = [block for block in function.blocks if block in reachable]
+        for block in function.blocks:
+            term = block.term
+            if block is function.entry or block.stmts or not isinstance(term, ir.Jump) or term.target is block:
+                continue
+            for pred in function.blocks:
+                if block in pred.successors():
+                    pred.term.retarget(block, term.target)
+                    changed = True
+        preds = function.predecessors()
+        for block in function.blocks:
+            term = block.term
+            while isinstance(term, ir.Jump) and term.target is not function.entry \
+                    and term.target is not block and preds[term.target] == [block]:
+                merged = term.target
+                block.stmts += merged.stmts
+                block.term = term = merged.term
+                preds[merged] = []
+                for succ in term.successors():
+                    preds[succ] = [block if pred is merged else pred for pred in preds[succ]]
+                changed = True
+        for block in function.blocks:
+            term = block.term
+            if isinstance(term, ir.Branch) and term.if_true is term.if_false:
+                if not isinstance(term.cond, ir.Const):
+                    block.stmts.append(ir.Eval(term.cond))
+                block.term = ir.Jump(term.if_true)
+                changed = True
+
+
+def eliminate_dead_code(function: ir.Function):
+    """Remove assignments nothing reads, copies of a variable to itself and
+    evaluations of values nothing uses.
+
+    Only statements whose expression is safe go: one that may raise or call
+    something still runs.
+    """
+    changed = True
+    while changed:
+        changed = False
+        defined = definitely_set(function)
+        live_out = live_variables(function)
+        for block in function.blocks:
+            if block not in live_out:
+                continue
+            # Names set before each statement, going forward
+            before = []
+            names = set(defined[block])
+            for stmt in block.stmts:
+                before.append(frozenset(names))
+                names |= ir.uses(stmt)
+                names.update(stmt.defines())
+            live = set(live_out[block])
+            live |= ir.uses(block.term)
+            kept = []
+            for stmt, names in zip(block.stmts[::-1], before[::-1]):
+                dead = isinstance(stmt, ir.Eval) or isinstance(stmt, ir.Assign) and (
+                    stmt.name not in live or isinstance(stmt.value, ir.Var) and stmt.value.name == stmt.name)
+                if dead and is_safe(stmt.value, names):
+                    changed = True
+                    continue
+                kept.append(stmt)
+                live.difference_update(stmt.defines())
+                live |= ir.uses(stmt)
+            block.stmts = kept[::-1]
+
+
+def eliminate_common_subexpressions(function: ir.Function):
+    """Reuse the value of an operator computed earlier on the same path.
+
+    Value numbering runs over extended basic blocks: trees of blocks in which
+    every block but the root has the block before it as its only
+    predecessor. Variables are numbered by the assignment that set them, so
+    an expression is the same one only while its operands keep their
+    values. A value assigned to a variable is reused from it while the
+    variable holds it; one computed inside a larger expression is kept in a
+    temporary when it is used again further down and can not raise.
+    """
+    preds = function.predecessors()
+    defined = definitely_set(function)
+    children = {block: [] for block in function.blocks}
+    roots = []
+    for block in function.reverse_postorder():
+        if block is not function.entry and len(preds[block]) == 1 and preds[block][0] is not block:
+            children[preds[block][0]].append(block)
+        else:
+            roots.append(block)
+
+    def key_of(expr, versions):
+        if isinstance(expr, ir.Const):
+            return ('const',) + _key(expr)
+        if isinstance(expr, ir.Var):
+            return 'var', expr.name, versions.get(expr.name)
+        if isinstance(expr, ir.BinOp):
+            lh, rh = key_of(expr.lh, versions), key_of(expr.rh, versions)
+            if lh is not None and rh is not None:
+                return 'op', expr.op, lh, rh
+        return None
+
+    def define(stmt_names, versions, site):
+        for name in stmt_names:
+            versions[name] = site
+
+    # How often each value is computed in a block, and at most below it
+    counts = {}
+
+    def count(block, versions):
+        here = {}
+        for stmt in block.stmts + [block.term]:
+            for expr in stmt.exprs:
+                for sub in ir.walk(expr):
+                    key = key_of(sub, versions) if isinstance(sub, ir.BinOp) else None
+                    if key is not None:
+                        here[key] = here.get(key, 0) + 1
+            define(stmt.defines(), versions, id(stmt))
+        below = {}
+        for child in children[block]:
+            child_versions = dict(versions)
+            define(_edge_defines(block, child), child_versions, (id(block), id(child)))
+            for key, n in count(child, child_versions).items():
+                below[key] = max(below.get(key, 0), n)
+        counts[block] = here, below
+        total = dict(below)
+        for key, n in here.items():
+            total[key] = total.get(key, 0) + n
+        return total
+
+    def number(block, versions, available):
+        here, below = counts[block]
+        seen = {}
+        names = set(defined[block])
+        stmts = []
+
+        def reuse(expr):
+            key = key_of(expr, versions) if isinstance(expr, ir.BinOp) else None
+            if key is None:
+                return expr.rebuild(reuse)
+            seen[key] = seen.get(key, 0) + 1
+            holder = available.get(key)
+            if holder is not None and versions.get(holder[0]) == holder[1]:
+                return ir.Var(holder[0], expr.type)
+            new = expr.rebuild(reuse)
+            if expr is not held and here.get(key, 0) - seen[key] + below.get(key, 0) > 0 \
+                    and is_safe(new, names):
+                temp = function.program.new_temp()
+                stmts.append(ir.Assign(temp, new))
+                available[key] = temp, None
+                return ir.Var(temp, expr.type)
+            return new
+
+        for stmt in block.stmts + [block.term]:
+            # The value of an assignment is reused from its variable
+            held = None
+            if isinstance(stmt, ir.Assign) and stmt.name not in ir.reads(stmt.value):
+                held = stmt.value
+                key = key_of(held, versions)
+            stmt.replace(reuse)
+            if stmt is not block.term:
+                stmts.append(stmt)
+            names |= ir.uses(stmt)
+            names.update(stmt.defines())
+            define(stmt.defines(), versions, id(stmt))
+            if held is not None and key is not None and key[0] == 'op':
+                available[key] = stmt.name, versions[stmt.name]
+        block.stmts = stmts
+        for child in children[block]:
+            child_versions = dict(versions)
+            define(_edge_defines(block, child), child_versions, (id(block), id(child)))
+            number(child, child_versions, dict(available))
+
+    for root in roots:
+        count(root, {})
+        number(root, {}, {})
+
+
+def hoist_loop_invariants(function: ir.Function):
+    """Compute operators whose operands a loop never changes once, before the loop.
+
+    Only safe expressions move, since they run even when the loop body does
+    not, into a preheader block that every entry into the loop goes
+    through; each is computed into a temporary the loop then reads. A
+    temporary assigned only once, such as one from common-subexpression
+    elimination, moves with its assignment.
+    """
+    assignments = {}
+    for block in function.blocks:
+        for stmt in block.stmts:
+            if isinstance(stmt, ir.Assign):
+                assignments[stmt.name] = assignments.get(stmt.name, 0) + 1
+    done = set()
+    while True:
+        # Preheaders change the loops around them, so they are found again each time
+        loops = [(header, body) for header, body in function.loops()
+                 if header not in done and header is not function.entry]
+        if not loops:
+            break
+        header, body = loops[0]
+        done.add(header)
+        written = set()
+        for block in body:
+            for stmt in block.stmts + [block.term]:
+                written.update(stmt.defines())
+        defined = definitely_set(function)
+        outside = [pred for pred in function.predecessors()[header] if pred not in body and pred in defined]
+        # Names set on every way into the loop
+        names = None
+        for pred in outside:
+            out = set(defined[pred])
+            for stmt in pred.stmts + [pred.term]:
+                out |= ir.uses(stmt)
+                out.update(stmt.defines())
+            out.update(_edge_defines(pred, header))
+            names = out if names is None else names & out
+        if names is None:
+            continue
+        hoisted = []
+        temps = {}
+
+        def invariant(expr):
+            return isinstance(expr, ir.BinOp) and not ir.reads(expr) & written and is_safe(expr, names)
+
+        def hoist(expr):
+            if invariant(expr):
+                key = str(expr)
+                if key not in temps:
+                    temps[key] = function.program.new_temp()
+                    assignments[temps[key]] = 1
+                    hoisted.append(ir.Assign(temps[key], expr))
+                return ir.Var(temps[key], expr.type)
+            return expr.rebuild(hoist)
+
+        for block in function.blocks:
+            if block not in body:
+                continue
+            kept = []
+            for stmt in block.stmts:
+                if isinstance(stmt, ir.Assign) and stmt.name.startswith('$') \
+                        and assignments[stmt.name] == 1 and invariant(stmt.value):
+                    hoisted.append(stmt)
+                    temps.setdefault(str(stmt.value), stmt.name)
+                    continue
+                stmt.replace(hoist)
+                kept.append(stmt)
+            block.stmts = kept
+            block.term.replace(hoist)
+        if not hoisted:
+            continue
+        if len(outside) == 1 and isinstance(outside[0].term, ir.Jump):
+            outside[0].stmts += hoisted
+        else:
+            preheader = function.new_block()
+            preheader.stmts = hoisted
+            preheader.term = ir.Jump(header)
+            for pred in outside:
+                pred.term.retarget(header, preheader)
+            function.blocks.insert(function.blocks.index(header), preheader)
+
+
+def layout_blocks(function: ir.Function):
+    """Order blocks so that control falls through instead of jumping where it can.
+
+    Blocks follow a depth-first order in which each block's first successor
+    comes right after it. A loop whose header tests the condition is then
+    rotated: the header moves below the body, so each iteration ends by
+    falling into the test, which jumps back to the top of the body, and only
+    entering the loop takes a jump.
+    """
+    seen = {function.entry}
+    order = []
+    stack = [(function.entry, iter(function.entry.successors()[::-1]))]
+    while stack:
+        block, succs = stack[-1]
+        for succ in succs:
+            if succ not in seen:
+                seen.add(succ)
+                stack.append((succ, iter(succ.successors()[::-1])))
+                break
+        else:
+            stack.pop()
+            order.append(block)
+    order.reverse()
+    for header, body in function.loops():
+        if header is function.entry or not isinstance(header.term, (ir.Branch, ir.ForRange)):
+            continue
+        start = order.index(header)
+        end = start + len(body)
+        if set(order[start:end]) != body or header not in order[end - 1].successors():
+            continue
+        order = order[:start] + order[start + 1:end] + [header] + order[end:]
+    function.blocks = order
+
+
+# (minimum -O level, pass) in the order they run
+PASSES = [
+    (1, fold_constants),
+    (1, propagate_constants),
+    (1, simplify_cfg),
+    (2, eliminate_common_subexpressions),
+    (2, hoist_loop_invariants),
+    (1, eliminate_dead_code),
+    (1, simplify_cfg),
+    (1, layout_blocks),
+]
+
+
+def optimize(program: ir.Program, level: int, dump=None, passes=None) -> ir.Program:
+    """Run the passes enabled at ``level`` over ``program``, writing the IR to ``dump`` around each.
+
+    ``passes``, a collection of pass names, runs just those instead, for
+    checking one pass on its own.
+    """
+    if dump is not None:
+        dump.write('; IR before optimization\n' + program.dump())
+    for minimum, pass_ in PASSES:
+        if (pass_.__name__ not in passes) if passes is not None else level < minimum:
+            continue
+        for function in program.all_functions():
+            pass_(function)
+        if dump is not None:
+            dump.write('; IR after %s\n' % pass_.__name__ + program.dump())
+    return program
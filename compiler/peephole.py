@@ -0,0 +1,200 @@
+from collections import Counter
+from types import MethodType
+from typing import List, Iterable, Tuple
+from machine import Machine, Instruction, InstructionTable
+from compiler.assembler import CodeLine, disassemble, assemble
+
+_COMPARES = {'ISEQ': 'EQ', 'ISGT': 'GT', 'ISGE': 'GE'}
+# A compare followed by one of these jumps fuses into prefix + compare
+_COMPARE_JUMPS = {'JUMP_IF_NOT': 'JUMP_UNLESS_', 'JUMP_IF': 'JUMP_IF_'}
+_COMPARE_BRANCHES = {prefix + suffix for prefix in _COMPARE_JUMPS.values() for suffix in _COMPARES.values()}
+_ARITHMETIC = {'ADD', 'SUB', 'MUL', 'DIV'}
+_CONTROL = {'HALT', 'RET'}
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _drop_double_not(window):
+    # Only the truthiness of the value reaches the jump
+    if [line.cmd for line in window] == ['NOT', 'NOT', 'JUMP_IF']:
+        return CodeLine('JUMP_IF', *window[2].args)
+
+
+def _invert_jump(window):
+    if [line.cmd for line in window] == ['NOT', 'JUMP_IF']:
+        return CodeLine('JUMP_IF_NOT', *window[1].args)
+
+
+def _compare_and_branch(window):
+    if window[0].cmd in _COMPARES and window[1].cmd in _COMPARE_JUMPS:
+        return CodeLine(_COMPARE_JUMPS[window[1].cmd] + _COMPARES[window[0].cmd], *window[1].args)
+
+
+def _compare_slots_and_branch(window):
+    load1, load2, jump = window
+    if load1.cmd == load2.cmd == 'LOAD_FAST' and jump.cmd in _COMPARE_BRANCHES:
+        return CodeLine(jump.cmd + '_FAST', load1.args[0], load2.args[0], *jump.args)
+
+
+def _arithmetic_on_slots(window):
+    load1, load2, op = window
+    if load1.cmd == load2.cmd == 'LOAD_FAST' and op.cmd in _ARITHMETIC:
+        return CodeLine(op.cmd + '_FAST', load1.args[0], load2.args[0])
+
+
+def _increment(window):
+    load, push, op, store = window
+    if load.cmd not in ('LOAD', 'LOAD_FAST') or store.cmd != load.cmd.replace('LOAD', 'STORE') \
+            or load.args != store.args or push.cmd != 'PUSH' or not _is_number(push.args[0]):
+        return None
+    suffix = load.cmd[len('LOAD'):]
+    if op.cmd == 'ADD':
+        return CodeLine('INC' + suffix, load.args[0], push.args[0])
+    if op.cmd == 'SUB':
+        return CodeLine('INC' + suffix, load.args[0], -push.args[0])
+
+
+def _load_pair(window):
+    if window[0].cmd == window[1].cmd and window[0].cmd in ('LOAD', 'LOAD_FAST'):
+        return CodeLine(window[0].cmd.replace('LOAD', 'LOAD2'), window[0].args[0], window[1].args[0])
+
+
+# Rules run phase by phase, each phase to a fixed point. A rule gets a window
+# of lines and returns the fused line or None.
+_PHASES = [
+    [(3, _drop_double_not), (2, _invert_jump), (2, _compare_and_branch)],
+    [(3, _compare_slots_and_branch), (3, _arithmetic_on_slots), (4, _increment)],
+    [(2, _load_pair)],
+]
+
+
+def _jump_targets(lines: List[CodeLine], instruction_table: InstructionTable) -> set:
+    targets = set()
+    for line in lines:
+        if line.cmd in instruction_table.table:
+            for target in instruction_table.get(line.cmd).targets:
+                targets.add(id(line.args[target]))
+    return targets
+
+
+def _run_phase(lines: List[CodeLine], rules, instruction_table: InstructionTable) -> List[CodeLine]:
+    changed = True
+    while changed:
+        changed = False
+        targets = _jump_targets(lines, instruction_table)
+        i = 0
+        while i < len(lines):
+            for size, rule in rules:
+                window = lines[i:i + size]
+                # Control may only enter a fused sequence at its first line
+                if len(window) < size or any(id(line) in targets for line in window[1:]):
+                    continue
+                fused = rule(window)
+                if fused is not None:
+                    # Keep the first line object so jumps to it stay valid
+                    lines[i].cmd, lines[i].args = fused.cmd, fused.args
+                    del lines[i + 1:i + size]
+                    changed = True
+                    break
+            i += 1
+    return lines
+
+
+def _fuse_pairs(lines: List[CodeLine], fusions: Iterable[Tuple[str, str]], instruction_table: InstructionTable):
+    pairs = set(fusions)
+    targets = _jump_targets(lines, instruction_table)
+    i = 0
+    while i < len(lines) - 1:
+        first, second = lines[i], lines[i + 1]
+        if (first.cmd, second.cmd) in pairs and id(second) not in targets:
+            first.cmd, first.args = first.cmd + '+' + second.cmd, first.args + second.args
+            del lines[i + 1]
+        i += 1
+    return lines
+
+
+def optimize(lines: List[CodeLine], instruction_table: InstructionTable = None,
+             fusions: Iterable[Tuple[str, str]] = ()) -> List[CodeLine]:
+    """Fuse common instruction sequences into superinstructions, in place.
+
+    ``fusions`` are opcode pairs registered by ``derive_fusions``.
+    """
+    instruction_table = instruction_table or Machine.get_instruction_table()
+    for rules in _PHASES:
+        _run_phase(lines, rules, instruction_table)
+    return _fuse_pairs(lines, fusions, instruction_table)
+
+
+def optimize_program(program: list, instruction_table: InstructionTable,
+                     fusions: Iterable[Tuple[str, str]] = ()) -> list:
+    lines = disassemble(program, instruction_table)
+    return assemble(optimize(lines, instruction_table, fusions), instruction_table)
+
+
+def pair_profile(machine: Machine) -> Counter:
+    """Run ``machine`` to completion, counting executed opcode pairs."""
+    counts = Counter()
+    previous = None
+    while not machine.is_halted:
+        op_name = machine.program[machine.instruction_pointer]
+        if previous is not None:
+            counts[previous, op_name] += 1
+        previous = op_name
+        machine.step()
+    return counts
+
+
+def _bound(instruction: Instruction, machine: Machine, args: tuple):
+    if instruction.bind is not None:
+        return instruction.bind(machine, args)
+    return MethodType(instruction.func, machine)
+
+
+def _compose(first: Instruction, second: Instruction):
+    """The func and bind hook of an instruction running ``first``, then ``second``.
+
+    Bound sites compose the handlers the two instructions bind, so they keep
+    any specialization made at decode time, such as FUNC's resolved builtin.
+    """
+    split = first.arity
+
+    def func(self, args):
+        first.func(self, args[:split])
+        second.func(self, args[split:])
+
+    def bind(machine, args):
+        first_args, second_args = args[:split], args[split:]
+        run_first = _bound(first, machine, first_args)
+        run_second = _bound(second, machine, second_args)
+
+        def handler(args):
+            run_first(first_args)
+            run_second(second_args)
+        return handler
+    return func, bind
+
+
+def derive_fusions(profile: Counter, instruction_table: InstructionTable,
+                   limit: int = 4, min_count: int = 1) -> List[Tuple[str, str]]:
+    """Register composite instructions for the hottest fusable opcode pairs.
+
+    A pair is fusable when its first instruction never transfers control. The
+    composite is named 'FIRST+SECOND'. Returns the registered pairs, hottest
+    first.
+    """
+    names = []
+    for (first_name, second_name), count in profile.most_common():
+        if len(names) >= limit or count < min_count:
+            break
+        first = instruction_table.table.get(first_name)
+        second = instruction_table.table.get(second_name)
+        if first is None or second is None or first.targets or first_name in _CONTROL:
+            continue
+        func, bind = _compose(first, second)
+        instruction_table.insert(Instruction(
+            first_name + '+' + second_name, first.arity + second.arity, func,
+            targets=tuple(first.arity + target for target in second.targets), bind=bind))
+        names.append((first_name, second_name))
+    return names
@@ -1,4 +1,24 @@
 from .instruction import Instruction
 from .instructionTable import InstructionTable
-from .machine import Machine
+from .machine import Machine, StackOverflowError, Suspend
 from .context import Context
+from .registry import BuiltinRegistry, BuiltinError, default_registry
+
+__all__ = ['Instruction', 'InstructionTable', 'Machine', 'StackOverflowError', 'Suspend', 'Context',
+           'Quickening', 'Site', 'Jit', 'JitCache', 'Profiler', 'BuiltinRegistry', 'BuiltinError',
+           'default_registry']
+
+
+def __getattr__(name: str):
+    # Quickening, the JIT and the profiler are imported on first use, which
+    # keeps them off the path of ``import machine``
+    if name in ('Quickening', 'Site'):
+        from . import quickening as module
+    elif name in ('Jit', 'JitCache'):
+        from . import jit as module
+    elif name == 'Profiler':
+        from . import profiler as module
+    else:
+        raise AttributeError('module %r has no attribute %r' % (__name__, name))
+    value = globals()[name] = getattr(module, name)
+    return value
@@ -0,0 +1,220 @@
+"""Binary module format for machine programs.
+
+Layout (little endian)::
+
+    header   magic 'CTVM', format version (u16), reserved (u16),
+             instruction table version (8 bytes), code cells (u32),
+             pool entries (u32)
+    code     one int32 cell per flat program slot: an opcode cell holds
+             -(opcode number + 1), an operand cell holds its pool index
+    pool     deduplicated constants and names, each a one byte tag and payload
+
+Cells line up with the offsets of the list form, so jump targets and return
+addresses are unchanged. Opcode numbers follow the insertion order of the
+instruction table, whose version must match when loading.
+"""
+import ast
+import mmap
+import struct
+import sys
+from array import array
+from .instructionTable import InstructionTable
+
+MAGIC = b'CTVM'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<4sHH8sII')
+_INT64 = struct.Struct('<q')
+_FLOAT64 = struct.Struct('<d')
+_LENGTH = struct.Struct('<I')
+
+
+class BytecodeError(Exception):
+    pass
+
+
+def _encode_constant(value) -> bytes:
+    if value is None:
+        return b'N'
+    if value is True:
+        return b'T'
+    if value is False:
+        return b'F'
+    if type(value) is int:
+        if -2 ** 63 <= value < 2 ** 63:
+            return b'i' + _INT64.pack(value)
+        digits = str(value).encode()
+        return b'I' + _LENGTH.pack(len(digits)) + digits
+    if type(value) is float:
+        return b'f' + _FLOAT64.pack(value)
+    if type(value) is str:
+        data = value.encode('utf-8')
+        return b's' + _LENGTH.pack(len(data)) + data
+    raise BytecodeError('Constant %r can not be serialized' % (value,))
+
+
+def _decode_pool(buffer, offset: int, count: int) -> list:
+    try:
+        return _decode_constants(buffer, offset, count)
+    except (struct.error, ValueError) as e:
+        raise BytecodeError('Bad constant pool: %s' % e) from None
+
+
+def _decode_constants(buffer, offset: int, count: int) -> list:
+    pool = []
+    for i in range(count):
+        tag = bytes(buffer[offset:offset + 1])
+        offset += 1
+        if tag == b'N':
+            pool.append(None)
+        elif tag in (b'T', b'F'):
+            pool.append(tag == b'T')
+        elif tag == b'i':
+            pool.append(_INT64.unpack_from(buffer, offset)[0])
+            offset += _INT64.size
+        elif tag == b'f':
+            pool.append(_FLOAT64.unpack_from(buffer, offset)[0])
+            offset += _FLOAT64.size
+        elif tag in (b'I', b's'):
+            length = _LENGTH.unpack_from(buffer, offset)[0]
+            offset += _LENGTH.size
+            data = bytes(buffer[offset:offset + length])
+            if len(data) != length:
+                raise BytecodeError('Truncated constant pool')
+            offset += length
+            pool.append(int(data) if tag == b'I' else data.decode('utf-8'))
+        else:
+            raise BytecodeError('Unknown constant tag %r' % tag)
+    return pool
+
+
+def dumps(program: list, instruction_table: InstructionTable) -> bytes:
+    opcodes = {name: number for number, name in enumerate(instruction_table.table)}
+    pool = []
+    indexes = {}
+    cells = array('i', [0]) * len(program)
+    ip = 0
+    while ip < len(program):
+        op_name = program[ip]
+        if op_name not in opcodes:
+            raise BytecodeError('Instruction %r at %d is not in the instruction table' % (op_name, ip))
+        cells[ip] = -(opcodes[op_name] + 1)
+        for offset in range(ip + 1, ip + 1 + instruction_table.get(op_name).arity):
+            value = program[offset]
+            # By bits for floats: 0.0 and -0.0 are equal but distinct, a NaN equals nothing
+            key = (float, _FLOAT64.pack(value)) if type(value) is float else (type(value), value)
+            if key not in indexes:
+                indexes[key] = len(pool)
+                pool.append(value)
+            cells[offset] = indexes[key]
+        ip += 1 + instruction_table.get(op_name).arity
+    if sys.byteorder != 'little':
+        cells.byteswap()
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, 0, instruction_table.version(), len(cells), len(pool))
+    return header + cells.tobytes() + b''.join(_encode_constant(value) for value in pool)
+
+
+def save(program: list, instruction_table: InstructionTable, path: str):
+    with open(path, 'wb') as f:
+        f.write(dumps(program, instruction_table))
+
+
+class Bytecode:
+    """Read-only program view over a serialized module.
+
+    Indexing returns the same values as the list form, decoding a cell only
+    when it is read, so a Machine running it creates records just for the
+    instructions it executes.
+    """
+
+    def __init__(self, buffer, instruction_table: InstructionTable):
+        if len(buffer) < HEADER.size:
+            raise BytecodeError('Truncated header')
+        magic, format_version, reserved, table_version, size, pool_count = HEADER.unpack_from(buffer, 0)
+        if magic != MAGIC:
+            raise BytecodeError('Not a bytecode module')
+        if format_version != FORMAT_VERSION:
+            raise BytecodeError('Unsupported format version %d' % format_version)
+        if table_version != instruction_table.version():
+            raise BytecodeError('Module was built for a different instruction table')
+        self.buffer = buffer
+        code_end = HEADER.size + 4 * size
+        if code_end > len(buffer):
+            raise BytecodeError('Truncated code')
+        view = memoryview(buffer)[HEADER.size:code_end]
+        if sys.byteorder == 'little':
+            self.cells = view.cast('i')
+        else:
+            self.cells = array('i', view)
+            self.cells.byteswap()
+        self.pool = _decode_pool(buffer, code_end, pool_count)
+        self.opcodes = list(instruction_table.table)
+
+    def __len__(self):
+        return len(self.cells)
+
+    def _value(self, cell):
+        return self.opcodes[-cell - 1] if cell < 0 else self.pool[cell]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._value(cell) for cell in self.cells[index]]
+        return self._value(self.cells[index])
+
+    def to_list(self) -> list:
+        return [self._value(cell) for cell in self.cells]
+
+    def close(self):
+        if isinstance(self.cells, memoryview):
+            self.cells.release()
+        if isinstance(self.buffer, mmap.mmap):
+            self.buffer.close()
+
+
+def loads(data: bytes, instruction_table: InstructionTable) -> Bytecode:
+    return Bytecode(data, instruction_table)
+
+
+def load(path: str, instruction_table: InstructionTable) -> Bytecode:
+    """Memory-map a module file."""
+    with open(path, 'rb') as f:
+        return Bytecode(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ), instruction_table)
+
+
+def read_program_literal(path: str) -> list:
+    """The ``program = [...]`` list of a script such as test5.py, without running it."""
+    with open(path) as f:
+        tree = ast.parse(f.read())
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and any(getattr(t, 'id', None) == 'program' for t in node.targets):
+            return ast.literal_eval(node.value)
+    raise BytecodeError('No program list in %s' % path)
+
+
+def main(argv=None):
+    import argparse
+    from .machine import Machine
+    parser = argparse.ArgumentParser(prog='python -m machine.bytecode')
+    commands = parser.add_subparsers(dest='command', required=True)
+    pack = commands.add_parser('pack', help='serialize the program list of a script')
+    pack.add_argument('script')
+    pack.add_argument('module')
+    unpack = commands.add_parser('unpack', help='print the list form of a module')
+    unpack.add_argument('module')
+    run = commands.add_parser('run', help='run a module')
+    run.add_argument('module')
+    args = parser.parse_args(argv)
+
+    instruction_table = Machine.get_instruction_table()
+    if args.command == 'pack':
+        save(read_program_literal(args.script), instruction_table, args.module)
+    elif args.command == 'unpack':
+        bytecode = load(args.module, instruction_table)
+        print(bytecode.to_list())
+        bytecode.close()
+    else:
+        bytecode = load(args.module, instruction_table)
+        Machine(bytecode, instruction_table).run()
+
+
+if __name__ == '__main__':
+    main()
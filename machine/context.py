@@ -1,7 +1,30 @@
+class _Unset:
+    """Value of a frame slot that nothing has been stored to yet."""
+    __slots__ = ()
+
+    def __repr__(self):
+        return '<unset>'
+
+
+_UNSET = _Unset()
+
+
+def unset_slot(index) -> KeyError:
+    """The error reading an unset slot raises, as reading an unset name does."""
+    return KeyError('slot %d' % index)
+
+
 class Context:
 
-    def __init__(self, return_address):
+    def __init__(self, return_address, frame_size=0):
         self.variables = dict()
+        self.slots = [_UNSET] * frame_size
+        self.return_address = return_address
+
+    def reset(self, return_address, frame_size=0):
+        """Make a pooled context look newly created."""
+        self.variables.clear()
+        self.slots = [_UNSET] * frame_size
         self.return_address = return_address
 
     def get_return_address(self):
@@ -2,7 +2,12 @@
 
 class Instruction:
 
-    def __init__(self, name: str, arity: int, func):
+    def __init__(self, name: str, arity: int, func, targets: tuple = (), bind=None):
         self.name = name
         self.arity = arity
         self.func = func
+        # Indices of the operands that hold code addresses
+        self.targets = targets
+        # Optional bind(machine, args) -> handler, called when a site is
+        # decoded to build a handler specialized for its operands
+        self.bind = bind
@@ -11,3 +11,9 @@ class InstructionTable:
 
     def get(self, name: str) -> Instruction:
         return self.table[name]
+
+    def version(self) -> bytes:
+        """8-byte digest of the opcode numbering (insertion order), arities and jump operands."""
+        import hashlib
+        layout = [(i.name, i.arity, i.targets) for i in self.table.values()]
+        return hashlib.sha1(repr(layout).encode()).digest()[:8]
@@ -0,0 +1,407 @@
+import math
+
+# Operations the translator understands; anything else keeps the function interpreted
+_BINARY = {'ADD': '+', 'SUB': '-', 'MUL': '*', 'DIV': '/', 'ISEQ': '==', 'ISGT': '>', 'ISGE': '>='}
+# AND/OR evaluate both operands in the machine, so Python's short circuit must not skip one
+_LOGICAL = {'AND': 'and', 'OR': 'or'}
+_BINARY_FAST = {'ADD_FAST': '+', 'SUB_FAST': '-', 'MUL_FAST': '*', 'DIV_FAST': '/'}
+_UNLESS = {'JUMP_UNLESS_EQ': '==', 'JUMP_UNLESS_GT': '>', 'JUMP_UNLESS_GE': '>='}
+_UNLESS_FAST = {'JUMP_UNLESS_EQ_FAST': '==', 'JUMP_UNLESS_GT_FAST': '>', 'JUMP_UNLESS_GE_FAST': '>='}
+_IF = {'JUMP_IF_EQ': '==', 'JUMP_IF_GT': '>', 'JUMP_IF_GE': '>='}
+_IF_FAST = {'JUMP_IF_EQ_FAST': '==', 'JUMP_IF_GT_FAST': '>', 'JUMP_IF_GE_FAST': '>='}
+_CALLS = {'CALL', 'CALL_FAST'}
+_TAIL_CALLS = {'TAIL_CALL', 'TAIL_CALL_FAST'}
+_NO_FALLTHROUGH = {'JUMP', 'RET'} | _TAIL_CALLS
+_LITERAL_TYPES = (int, str, bool, type(None))
+
+
+class Unsupported(Exception):
+    pass
+
+
+def _zero_step():
+    raise ValueError('range() arg 3 must not be zero')
+
+
+class JitCache:
+    """LRU cache of compiled function code, keyed by generated source."""
+
+    def __init__(self, max_size: int = 256):
+        self.max_size = max_size
+        self.code = {}
+        self.hits = 0
+        self.misses = 0
+
+    def compile(self, source: str):
+        code = self.code.pop(source, None)
+        if code is not None:
+            self.hits += 1
+            # Reinserted as the most recently used
+            self.code[source] = code
+            return code
+        self.misses += 1
+        code = compile(source, '<jit>', 'exec')
+        self.code[source] = code
+        if len(self.code) > self.max_size:
+            del self.code[next(iter(self.code))]
+        return code
+
+
+default_cache = JitCache()
+
+
+class _Translator:
+    """Translates the function at ``entry`` into Python source.
+
+    Operand stack values are kept as Python expressions and only written to
+    the machine stack at block boundaries, calls and RET. Before any other
+    line that evaluates something, the values still on the stack are
+    evaluated into temporaries, bottom first: they were computed earlier
+    in the machine, so their errors and effects come first here too.
+    Variables become locals, so the function runs without a Context.
+    """
+
+    def __init__(self, program, instruction_table, entry: int, builtins):
+        self.program = program
+        self.instruction_table = instruction_table
+        self.entry = entry
+        self.builtins = builtins
+        self.constants = {}
+        self.variables = {}
+        self.slots = set()
+        self.temps = 0
+        # Expressions already evaluated: temporaries and constants
+        self.settled = set()
+        # Indexes in ``out`` of the slot resets of self tail calls
+        self.resets = []
+        self.stack = []
+        self.out = []
+
+    def decode(self, ip: int):
+        if not 0 <= ip < len(self.program):
+            raise Unsupported('address %s is outside the program' % ip)
+        instruction = self.instruction_table.table.get(self.program[ip])
+        if instruction is None:
+            raise Unsupported('unknown instruction at %d' % ip)
+        next_ip = ip + 1 + instruction.arity
+        return instruction, list(self.program[ip + 1:next_ip]), next_ip
+
+    def blocks(self):
+        decoded = {}
+        leaders = {self.entry}
+        pending = [self.entry]
+        while pending:
+            ip = pending.pop()
+            if ip in decoded:
+                continue
+            instruction, args, next_ip = decoded[ip] = self.decode(ip)
+            successors = []
+            # Tail calls leave the function like RET
+            if instruction.name not in _CALLS and instruction.name not in _TAIL_CALLS:
+                successors.extend(args[target] for target in instruction.targets)
+                leaders.update(successors)
+            if instruction.name not in _NO_FALLTHROUGH:
+                successors.append(next_ip)
+                if instruction.targets and instruction.name not in _CALLS:
+                    leaders.add(next_ip)
+            pending.extend(successors)
+        for ip in leaders:
+            if ip not in decoded:
+                raise Unsupported('jump into the middle of an instruction at %d' % ip)
+
+        blocks = []
+        for ip in sorted(decoded):
+            if ip in leaders:
+                blocks.append([])
+            blocks[-1].append((ip,) + decoded[ip])
+        return blocks
+
+    # Symbolic operand stack
+
+    def constant(self, value) -> str:
+        if type(value) in _LITERAL_TYPES or type(value) is float and math.isfinite(value):
+            expr = repr(value)
+            self.settled.add(expr)
+            return expr
+        return self.constant_object(value)
+
+    def constant_object(self, value) -> str:
+        name = 'c%d' % len(self.constants)
+        self.constants[name] = value
+        self.settled.add(name)
+        return name
+
+    def variable(self, name) -> str:
+        if name not in self.variables:
+            self.variables[name] = 'v%d' % len(self.variables)
+        return self.variables[name]
+
+    def slot(self, index) -> str:
+        self.slots.add(index)
+        return 's%d' % index
+
+    def temp(self) -> str:
+        self.temps += 1
+        temp = 't%d' % self.temps
+        self.settled.add(temp)
+        return temp
+
+    def emit(self, line: str):
+        self.out.append('                ' + line)
+
+    def push(self, expr: str, deps=frozenset()):
+        self.stack.append((expr, frozenset(deps)))
+
+    def pop(self):
+        if self.stack:
+            return self.stack.pop()
+        # The value was pushed by the caller or before a block boundary
+        temp = self.temp()
+        self.emit('%s = pop()' % temp)
+        return temp, frozenset()
+
+    def settle(self):
+        for i, (expr, deps) in enumerate(self.stack):
+            if expr not in self.settled:
+                temp = self.temp()
+                self.emit('%s = %s' % (temp, expr))
+                self.stack[i] = (temp, frozenset())
+
+    def flush(self):
+        for expr, deps in self.stack:
+            self.emit('push(%s)' % expr)
+        self.stack = []
+
+    def branch(self, target: int):
+        self.emit('pc = %d' % target)
+        self.emit('continue')
+
+    # Translation
+
+    def translate(self, name: str) -> str:
+        blocks = self.blocks()
+        for block in blocks:
+            self.out.append('            if pc == %d:' % block[0][0])
+            self.stack = []
+            for ip, instruction, args, next_ip in block:
+                self.translate_instruction(instruction.name, args, next_ip)
+            if block[-1][1].name not in _NO_FALLTHROUGH:
+                self.flush()
+                self.branch(block[-1][3])
+        # Locals start unbound, and a self tail call unbinds them again
+        locals_ = ['s%d' % index for index in sorted(self.slots)] + list(self.variables.values())
+        if locals_:
+            reset = '                %s = None; del %s' % (' = '.join(locals_), ', '.join(locals_))
+            for index in self.resets:
+                self.out[index] = reset
+        header = ['def %s(args):' % name,
+                  '    pc = %d' % self.entry,
+                  '    try:',
+                  '        while True:']
+        # Reading a local nothing was stored to fails like reading an unset
+        # variable; one no line stores to at all is looked up as a global
+        footer = ['    except NameError as e:',
+                  '        raise KeyError(str(e)) from None']
+        return '\n'.join(header + [line for line in self.out if line is not None] + footer) + '\n'
+
+    def translate_instruction(self, op: str, args: list, next_ip: int):
+        if op == 'PUSH':
+            self.push(self.constant(args[0]))
+        elif op == 'POP':
+            expr, deps = self.pop()
+            self.settle()
+            self.emit(expr)
+        elif op == 'DUP':
+            expr, deps = self.pop()
+            self.settle()
+            temp = self.temp()
+            self.emit('%s = %s' % (temp, expr))
+            self.push(temp)
+            self.push(temp)
+        elif op in _BINARY:
+            rh, rh_deps = self.pop()
+            lh, lh_deps = self.pop()
+            self.push('(%s %s %s)' % (lh, _BINARY[op], rh), lh_deps | rh_deps)
+        elif op in _LOGICAL:
+            rh, rh_deps = self.pop()
+            lh, lh_deps = self.pop()
+            self.settle()
+            operands = []
+            for expr in (lh, rh):
+                temp = self.temp()
+                self.emit('%s = %s' % (temp, expr))
+                operands.append(temp)
+            self.push('(%s %s %s)' % (operands[0], _LOGICAL[op], operands[1]))
+        elif op == 'NOT':
+            expr, deps = self.pop()
+            self.push('(not %s)' % expr, deps)
+        elif op in ('LOAD', 'LOAD_FAST', 'LOAD2', 'LOAD2_FAST'):
+            for arg in args:
+                local = self.slot(arg) if op.endswith('_FAST') else self.variable(arg)
+                self.push(local, {local})
+        elif op in ('STORE', 'STORE_FAST'):
+            local = self.slot(args[0]) if op == 'STORE_FAST' else self.variable(args[0])
+            expr, deps = self.pop()
+            self.settle()
+            self.emit('%s = %s' % (local, expr))
+        elif op in ('INC', 'INC_FAST'):
+            local = self.slot(args[0]) if op == 'INC_FAST' else self.variable(args[0])
+            self.settle()
+            self.emit('%s = %s + %s' % (local, local, self.constant(args[1])))
+        elif op in _BINARY_FAST:
+            lh, rh = self.slot(args[0]), self.slot(args[1])
+            self.push('(%s %s %s)' % (lh, _BINARY_FAST[op], rh), {lh, rh})
+        elif op == 'FUNC':
+            # Arguments are evaluated in push order and passed top first, as
+            # the machine pops them
+            self.settle()
+            params = [self.pop()[0] for i in range(args[1])]
+            func = self.constant_object(self.builtins.bind(args[0], args[1]))
+            temp = self.temp()
+            self.emit('%s = %s(%s)' % (temp, func, ', '.join(params)))
+            self.push(temp)
+        elif op in _CALLS:
+            self.flush()
+            self.emit('call(%d, %d)' % (args[0], args[1] if op == 'CALL_FAST' else 0))
+        elif op in _TAIL_CALLS:
+            # Only a tail call of the function itself runs in constant Python
+            # stack: it restarts the loop with its locals unbound
+            if args[0] != self.entry:
+                raise Unsupported('tail call of another function')
+            self.flush()
+            self.resets.append(len(self.out))
+            self.out.append(None)
+            self.branch(self.entry)
+        elif op == 'RET':
+            self.flush()
+            self.emit('return')
+        elif op == 'JUMP':
+            self.flush()
+            self.branch(args[0])
+        elif op in ('JUMP_IF', 'JUMP_IF_NOT'):
+            expr, deps = self.pop()
+            self.flush()
+            self.emit('if %s%s:' % ('' if op == 'JUMP_IF' else 'not ', expr))
+            self.emit('    pc = %d' % args[0])
+            self.emit('    continue')
+        elif op in _UNLESS or op in _IF:
+            rh, rh_deps = self.pop()
+            lh, lh_deps = self.pop()
+            self.flush()
+            if op in _UNLESS:
+                self.emit('if not (%s %s %s):' % (lh, _UNLESS[op], rh))
+            else:
+                self.emit('if %s %s %s:' % (lh, _IF[op], rh))
+            self.emit('    pc = %d' % args[0])
+            self.emit('    continue')
+        elif op in _UNLESS_FAST or op in _IF_FAST:
+            self.flush()
+            lh, rh = self.slot(args[0]), self.slot(args[1])
+            if op in _UNLESS_FAST:
+                self.emit('if not (%s %s %s):' % (lh, _UNLESS_FAST[op], rh))
+            else:
+                self.emit('if %s %s %s:' % (lh, _IF_FAST[op], rh))
+            self.emit('    pc = %d' % args[2])
+            self.emit('    continue')
+        elif op in ('FOR_RANGE', 'FOR_RANGE_FAST'):
+            local = self.slot if op == 'FOR_RANGE_FAST' else self.variable
+            counter, stop, step, var = (local(arg) for arg in args[:4])
+            self.flush()
+            self.emit('if (%s < %s if %s > 0 else %s > %s if %s < 0 else %s()):' % (
+                counter, stop, step, counter, stop, step, self.constant_object(_zero_step)))
+            self.emit('    %s = %s' % (var, counter))
+            self.emit('    %s = %s + %s' % (counter, counter, step))
+            self.emit('    pc = %d' % args[4])
+            self.emit('    continue')
+        else:
+            raise Unsupported('instruction %s' % op)
+
+
+class Jit:
+    """Compiles functions reached through CALL once they become hot.
+
+    Every CALL/CALL_FAST record counts invocations of its target. When a
+    target reaches ``threshold`` its code is translated to a Python function
+    that later calls run instead. Functions that can not be translated stay
+    interpreted; the reason is kept in ``failed``. Compiled functions nest on
+    the Python stack, so beyond ``max_depth`` nested calls are interpreted.
+    A tail call of the function itself becomes a jump to its entry; other
+    tail calls keep the function interpreted, where they reuse the frame.
+    """
+
+    def __init__(self, machine, threshold: int, cache: JitCache = None, max_depth: int = 100):
+        self.machine = machine
+        self.threshold = threshold
+        self.cache = cache if cache is not None else default_cache
+        self.max_depth = max_depth
+        self.depth = 0
+        self.counts = {}
+        self.compiled = {}
+        self.sources = {}
+        self.failed = {}
+        self.sites = {}
+
+    def wrap(self, ip: int, record):
+        """Return the record to install for the instruction decoded at ``ip``."""
+        if self.machine.program[ip] not in _CALLS:
+            return record
+        target = record[1][0]
+        self.sites.setdefault(target, []).append((ip, record))
+        return self._call_site(record), record[1], record[2]
+
+    def _call_site(self, record):
+        generic = record[0]
+        target = record[1][0]
+        compiled = self.compiled
+
+        def handler(args):
+            if (target in compiled or self.tick(target)) and self.depth < self.max_depth:
+                self.depth += 1
+                try:
+                    compiled[target](args)
+                finally:
+                    self.depth -= 1
+            else:
+                generic(args)
+        return handler
+
+    def tick(self, target: int) -> bool:
+        """Count a call of ``target``; True when a compiled version is available."""
+        if target in self.compiled:
+            return True
+        count = self.counts[target] = self.counts.get(target, 0) + 1
+        if count < self.threshold or target in self.failed:
+            return False
+        return self.compile(target)
+
+    def compile(self, target: int) -> bool:
+        machine = self.machine
+        translator = _Translator(machine.program, machine.instruction_table, target, machine.builtins)
+        name = 'jit_%d' % target
+        try:
+            source = translator.translate(name)
+        except Unsupported as e:
+            self.failed[target] = str(e)
+            # Stop counting at the call sites of this function
+            for ip, record in self.sites.get(target, ()):
+                machine.code[ip] = record
+            return False
+        namespace = dict(translator.constants)
+        namespace['pop'] = machine.operand_stack.pop
+        namespace['push'] = machine.push_operand
+        namespace['call'] = self.call
+        exec(self.cache.compile(source), namespace)
+        self.compiled[target] = namespace[name]
+        self.sources[target] = source
+        return True
+
+    def call(self, target: int, frame_size: int):
+        # CALL from compiled code
+        if self.tick(target) and self.depth < self.max_depth:
+            self.depth += 1
+            try:
+                self.compiled[target](None)
+            finally:
+                self.depth -= 1
+        else:
+            self.machine.invoke(target, frame_size)
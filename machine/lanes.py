@@ -0,0 +1,270 @@
+"""Data-parallel execution of one program over many input rows.
+
+Each row is a lane and every operand is a NumPy vector across the lanes of
+a group (or a scalar shared by all of them, such as a pushed constant).
+Arithmetic, comparison and logic opcodes become array operations. A
+JUMP_IF whose condition differs between lanes splits the group in two.
+Groups waiting at the lowest instruction pointer always run first, so lanes
+that left a loop or skipped a branch early wait at the join point until the
+others catch up, and are merged there.
+
+    result = run_lanes(program, {'income': incomes, 'age': ages}, 'score')
+
+Inputs are columns of equal length (scalars are broadcast). The output is
+the value of the ``result`` variable of each row when the program halts.
+NumPy arithmetic differs from Python's where Python has no fixed width:
+integer results wrap around at 64 bits instead of growing. Division by
+zero in any lane fails the whole run with LanesError, where the machine
+raises ZeroDivisionError, rather than giving that lane inf or nan.
+
+Only the base instruction set is supported, not the slot (``*_FAST``) or
+fused instructions. FUNC calls are limited to the builtins in
+``VECTOR_FUNCS``.
+"""
+import numpy as np
+
+from .machine import Machine
+
+
+class LanesError(Exception):
+    pass
+
+
+def _truncate(value):
+    return np.trunc(value).astype(np.int64)
+
+
+# Builtins FUNC can call, as functions of whole vectors
+VECTOR_FUNCS = {
+    'abs': np.abs,
+    'min': np.minimum,
+    'max': np.maximum,
+    'float': lambda value: np.asarray(value, dtype=np.float64),
+    'int': _truncate,
+    'round': np.round,
+}
+
+
+def _take(value, mask):
+    return value[mask] if isinstance(value, np.ndarray) else value
+
+
+def _merge(values: list, sizes: list):
+    first = values[0]
+    if all(value is first for value in values):
+        return first
+    return np.concatenate([np.broadcast_to(value, (size,)) for value, size in zip(values, sizes)])
+
+
+class _Group:
+    """Lanes at the same instruction with the same call stack."""
+    __slots__ = ('ip', 'rows', 'stack', 'frames')
+
+    def __init__(self, ip: int, rows, stack: list, frames: list):
+        self.ip = ip
+        self.rows = rows
+        self.stack = stack
+        # [return address, variables] per active call, the program first
+        self.frames = frames
+
+    def subset(self, mask, ip: int) -> '_Group':
+        return _Group(ip, self.rows[mask], [_take(value, mask) for value in self.stack],
+                      [[ret, {name: _take(value, mask) for name, value in variables.items()}]
+                       for ret, variables in self.frames])
+
+    def shape(self):
+        return (len(self.stack), tuple((ret, tuple(sorted(variables))) for ret, variables in self.frames))
+
+    @staticmethod
+    def merge(groups: list) -> '_Group':
+        if len(groups) == 1:
+            return groups[0]
+        sizes = [len(group.rows) for group in groups]
+        first = groups[0]
+        stack = [_merge([group.stack[i] for group in groups], sizes) for i in range(len(first.stack))]
+        frames = [[ret, {name: _merge([group.frames[depth][1][name] for group in groups], sizes)
+                         for name in variables}]
+                  for depth, (ret, variables) in enumerate(first.frames)]
+        return _Group(first.ip, np.concatenate([group.rows for group in groups]), stack, frames)
+
+
+class LaneMachine:
+    def __init__(self, program: list, instruction_table=None):
+        self.program = program
+        self.instruction_table = instruction_table or Machine.get_instruction_table()
+        self.code = {}
+        self._decode()
+
+    def _decode(self):
+        ip = 0
+        table = self.instruction_table.table
+        while ip < len(self.program):
+            instruction = table.get(self.program[ip])
+            if instruction is None:
+                raise LanesError('Instruction %s does not supported' % self.program[ip])
+            next_ip = ip + 1 + instruction.arity
+            self.code[ip] = (instruction.name, tuple(self.program[ip + 1:next_ip]), next_ip)
+            ip = next_ip
+
+    def run(self, columns: dict, result: str, size: int = None) -> np.ndarray:
+        """The value of ``result`` for every row of ``columns`` once the program halts."""
+        if size is None:
+            lengths = {len(column) for column in columns.values() if np.ndim(column)}
+            if len(lengths) != 1:
+                raise LanesError('Columns must have one common length, got %s' % sorted(lengths))
+            size = lengths.pop()
+        variables = {name: np.asarray(column) if np.ndim(column) else column
+                     for name, column in columns.items()}
+        pending = [_Group(0, np.arange(size), [], [[-1, variables]])]
+        out = None
+        while pending:
+            ip = min(group.ip for group in pending)
+            ready = [group for group in pending if group.ip == ip]
+            shape = ready[0].shape()
+            ready = [group for group in ready if group.shape() == shape]
+            pending = [group for group in pending if not any(group is other for other in ready)]
+            group = _Group.merge(ready)
+            # Groups left waiting here have other variables and can not merge
+            limit = min((other.ip for other in pending if other.ip > ip), default=None)
+            group = self._run_group(group, limit, pending)
+            if group is None:
+                continue
+            # Halted
+            value = group.frames[0][1].get(result)
+            if value is None:
+                raise LanesError('The program did not set %r' % result)
+            value = np.broadcast_to(value, group.rows.shape)
+            if out is None:
+                out = np.empty(size, dtype=value.dtype)
+            elif np.result_type(out.dtype, value.dtype) != out.dtype:
+                out = out.astype(np.result_type(out.dtype, value.dtype))
+            out[group.rows] = value
+        return out
+
+    def _run_group(self, group: _Group, limit, pending: list):
+        """Run ``group`` until it halts (returned) or reaches ``limit`` (queued, None returned)."""
+        code = self.code
+        stack = group.stack
+        push, pop = stack.append, stack.pop
+        ip = group.ip
+        while True:
+            if limit is not None and ip >= limit:
+                group.ip = ip
+                pending.append(group)
+                return None
+            op, args, next_ip = code[ip]
+            ip = next_ip
+            if op == 'PUSH':
+                push(args[0])
+            elif op == 'LOAD':
+                try:
+                    push(group.frames[-1][1][args[0]])
+                except KeyError:
+                    raise LanesError('Variable %r is not defined' % args[0]) from None
+            elif op == 'STORE':
+                group.frames[-1][1][args[0]] = pop()
+            elif op in _BINARY:
+                rh = pop()
+                lh = pop()
+                push(_BINARY[op](lh, rh))
+            elif op == 'NOT':
+                push(np.logical_not(pop()))
+            elif op == 'JUMP_IF' or op == 'JUMP_IF_NOT':
+                condition = pop()
+                taken = np.asarray(condition).astype(bool)
+                if op == 'JUMP_IF_NOT':
+                    taken = ~taken
+                if taken.ndim == 0:
+                    if taken:
+                        ip = args[0]
+                    continue
+                if taken.all():
+                    ip = args[0]
+                    continue
+                if not taken.any():
+                    continue
+                # Divergent lanes: the ones jumping wait in their own group
+                jumping = group.subset(taken, args[0])
+                staying = group.subset(~taken, ip)
+                pending.append(jumping)
+                group, stack = staying, staying.stack
+                push, pop = stack.append, stack.pop
+                limit = args[0] if limit is None else min(limit, args[0])
+            elif op == 'FOR_RANGE':
+                variables = group.frames[-1][1]
+                value, stop, step = variables[args[0]], variables[args[1]], variables[args[2]]
+                if np.any(np.equal(step, 0)):
+                    raise LanesError('range() arg 3 must not be zero')
+                more = np.where(np.greater(step, 0), np.less(value, stop), np.greater(value, stop))
+                if not more.any():
+                    continue
+                if not more.all():
+                    # Lanes whose range is exhausted wait after the loop
+                    pending.append(group.subset(~more, ip))
+                    group = group.subset(more, ip)
+                    stack = group.stack
+                    push, pop = stack.append, stack.pop
+                    limit = ip if limit is None else min(limit, ip)
+                    variables = group.frames[-1][1]
+                    value, step = variables[args[0]], variables[args[2]]
+                variables[args[3]] = value
+                variables[args[0]] = value + step
+                ip = args[4]
+            elif op == 'JUMP':
+                ip = args[0]
+            elif op == 'POP':
+                pop()
+            elif op == 'DUP':
+                push(stack[-1])
+            elif op == 'FUNC':
+                name, argc = args
+                func = VECTOR_FUNCS.get(name)
+                if func is None:
+                    raise LanesError('Builtin %r can not run on lanes' % name)
+                params = [pop() for i in range(argc)]
+                push(func(*params))
+            elif op == 'CALL':
+                group.frames.append([ip, {}])
+                ip = args[0]
+            elif op == 'TAIL_CALL':
+                group.frames[-1][1] = {}
+                ip = args[0]
+            elif op == 'RET':
+                ip = group.frames.pop()[0]
+            elif op == 'HALT':
+                group.ip = ip
+                return group
+            else:
+                raise LanesError('Instruction %s can not run on lanes' % op)
+
+
+def _and(lh, rh):
+    # Python's 'and' and 'or' return one of their operands
+    return np.where(lh, rh, lh)
+
+
+def _or(lh, rh):
+    return np.where(lh, lh, rh)
+
+
+def _divide(lh, rh):
+    if np.any(np.equal(rh, 0)):
+        raise LanesError('division by zero')
+    return np.true_divide(lh, rh)
+
+
+_BINARY = {
+    'ADD': np.add,
+    'SUB': np.subtract,
+    'MUL': np.multiply,
+    'DIV': _divide,
+    'ISEQ': np.equal,
+    'ISGT': np.greater,
+    'ISGE': np.greater_equal,
+    'AND': _and,
+    'OR': _or,
+}
+
+
+def run_lanes(program: list, columns: dict, result: str, instruction_table=None) -> np.ndarray:
+    return LaneMachine(program, instruction_table).run(columns, result)
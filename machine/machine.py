@@ -1,43 +1,212 @@
 from .instructionTable import InstructionTable
 from .instruction import Instruction
-from .context import Context
-import builtins
+from .context import Context, _UNSET, unset_slot
+from .registry import BuiltinRegistry, default_registry
+
+
+class _Halt(Exception):
+    pass
+
+
+class StackOverflowError(Exception):
+    pass
+
+
+class Suspend(Exception):
+    """Raised by a handler to pause the machine after the current instruction.
+
+    ``run_for`` returns and leaves ``request`` in ``Machine.suspended`` for
+    whoever drives the machine.
+    """
+
+    def __init__(self, request):
+        super().__init__(request)
+        self.request = request
 
 
 class Machine:
+    # Contexts kept for reuse after RET
+    frame_pool_size = 256
 
-    def __init__(self, program: list, instruction_table: InstructionTable):
+    def __init__(self, program: list, instruction_table: InstructionTable,
+                 operand_capacity: int = None, context_capacity: int = None,
+                 quicken_threshold: int = None, jit_threshold: int = None, jit_cache: 'JitCache' = None,
+                 builtins: BuiltinRegistry = None):
         self.program = program
         self.instruction_table = instruction_table
         self.instruction_pointer = 0
+        # Both stacks keep their top at the end of the list
         self.operand_stack = []
+        self.operand_capacity = operand_capacity
+        if operand_capacity is None:
+            self.push_operand = self.operand_stack.append
+            self.pop_operand = self.operand_stack.pop
         self.context_stack = []
+        self.context_capacity = context_capacity
         self.current_context = Context(-1)
         self.context_stack.append(self.current_context)
+        self.frame_pool = []
+        self.frames_allocated = 1
         self._is_halted = False
-
+        self.suspended = None
+        self.code = []
+        # With a threshold, arithmetic and compare sites specialize themselves
+        self.quicken_threshold = quicken_threshold
+        self.quickening = None
+        # With a threshold, functions called that often are compiled to Python
+        self.jit_threshold = jit_threshold
+        self.jit_cache = jit_cache
+        self.jit = None
+        # Functions FUNC calls, bound per site when it is decoded
+        self.builtins = builtins if builtins is not None else default_registry()
+        self.decode_program()
+
+    # Without a capacity these are shadowed by the list's own append/pop
     def push_operand(self, operand):
-        self.operand_stack.insert(0, operand)
+        if len(self.operand_stack) >= self.operand_capacity:
+            raise StackOverflowError('Operand stack overflow (capacity %d)' % self.operand_capacity)
+        self.operand_stack.append(operand)
 
     def pop_operand(self):
-        return self.operand_stack.pop(0)
-
-    def push_context(self, return_address):
-        self.current_context = Context(return_address)
-        self.context_stack.insert(0, self.current_context)
+        return self.operand_stack.pop()
+
+    def push_context(self, return_address, frame_size=0):
+        if self.context_capacity is not None and len(self.context_stack) >= self.context_capacity:
+            raise StackOverflowError('Context stack overflow (capacity %d)' % self.context_capacity)
+        if self.frame_pool:
+            context = self.frame_pool.pop()
+            context.reset(return_address, frame_size)
+        else:
+            context = Context(return_address, frame_size)
+            self.frames_allocated += 1
+        self.current_context = context
+        self.context_stack.append(context)
 
     def pop_context(self):
-        self.context_stack.pop(0)
-        self.current_context = self.context_stack[0]
+        context = self.context_stack.pop()
+        if len(self.frame_pool) < self.frame_pool_size:
+            self.frame_pool.append(context)
+        self.current_context = self.context_stack[-1]
+
+    @property
+    def is_halted(self):
+        return self._is_halted
 
     def get_next_code(self):
         code = self.program[self.instruction_pointer]
         self.instruction_pointer += 1
         return code
 
+    def decode_program(self):
+        """Pre-decode the flat program into (handler, args, next_ip) records.
+
+        Records are stored at the offset of their opcode, so JUMP and CALL
+        targets and return addresses keep their flat-list meaning. Offsets
+        that are not reached by the linear sweep hold a pending record, whose
+        handler decodes the instruction there the first time control is
+        transferred to it and then runs it. Programs that are not lists
+        (e.g. mapped bytecode) are decoded entirely on demand.
+        """
+        size = len(self.program)
+        pending = self._decode_pending
+        self.code = [(pending, ip, ip) for ip in range(size)]
+        # Quickening and the JIT are only imported by machines that use them
+        if self.quicken_threshold is not None:
+            from .quickening import Quickening
+            self.quickening = Quickening(self, self.quicken_threshold)
+        if self.jit_threshold is not None:
+            from .jit import Jit
+            self.jit = Jit(self, self.jit_threshold, self.jit_cache)
+        if not isinstance(self.program, list):
+            return
+        ip = 0
+        while ip < size and self.program[ip] in self.instruction_table.table:
+            record = self.code[ip] = self._decode(ip)
+            ip = record[2]
+
+    def _decode(self, ip):
+        op_name = self.program[ip]
+        instruction = self.instruction_table.table.get(op_name)
+        if instruction is None:
+            raise Exception('Instruction ' + str(op_name) + ' does not supported')
+        next_ip = ip + 1 + instruction.arity
+        args = tuple(self.program[ip + 1:next_ip])
+        if instruction.bind is not None:
+            record = instruction.bind(self, args), args, next_ip
+        else:
+            record = instruction.func.__get__(self), args, next_ip
+        if self.quickening is not None:
+            record = self.quickening.wrap(ip, record)
+        if self.jit is not None:
+            record = self.jit.wrap(ip, record)
+        return record
+
+    def _decode_pending(self, ip):
+        # The pending record left instruction_pointer at ip; the dispatch it
+        # counted for runs the decoded instruction
+        handler, args, self.instruction_pointer = self.code[ip] = self._decode(ip)
+        handler(args)
+
     def run(self):
-        while not self._is_halted:
-            self.step()
+        if self._is_halted:
+            return
+        code = self.code
+        try:
+            while True:
+                handler, args, self.instruction_pointer = code[self.instruction_pointer]
+                handler(args)
+        except _Halt:
+            return
+
+    def run_counted(self) -> int:
+        """Like run, and return the number of instructions dispatched.
+
+        Calls into JIT-compiled functions count as one instruction.
+        """
+        if self._is_halted:
+            return 0
+        code = self.code
+        count = 0
+        try:
+            while True:
+                handler, args, self.instruction_pointer = code[self.instruction_pointer]
+                count += 1
+                handler(args)
+        except _Halt:
+            return count
+
+    def run_for(self, budget: int) -> int:
+        """Run at most ``budget`` instructions and return how many were dispatched.
+
+        The machine stops early at HALT or when an instruction suspends it,
+        and can be resumed by calling run_for again. Calls into JIT-compiled
+        functions count as one instruction and are not preempted.
+        """
+        if self._is_halted:
+            return 0
+        code = self.code
+        remaining = budget
+        try:
+            while remaining:
+                handler, args, self.instruction_pointer = code[self.instruction_pointer]
+                remaining -= 1
+                handler(args)
+            return budget
+        except _Halt:
+            return budget - remaining
+        except Suspend as e:
+            self.suspended = e.request
+            return budget - remaining
+
+    def invoke(self, target, frame_size=0):
+        """Interpret the function at ``target`` until it returns to the caller."""
+        depth = len(self.context_stack)
+        self.push_context(self.instruction_pointer, frame_size)
+        self.instruction_pointer = target
+        code = self.code
+        while len(self.context_stack) > depth:
+            handler, args, self.instruction_pointer = code[self.instruction_pointer]
+            handler(args)
 
     def step(self):
         op_name = self.get_next_code()
@@ -48,7 +217,10 @@ class Machine:
         args = []
         for i in range(instruction.arity):
             args.append(self.get_next_code())
-        instruction.func(self, args)
+        try:
+            instruction.func(self, args)
+        except _Halt:
+            pass
 
     @classmethod
     def get_instruction_table(cls) -> InstructionTable:
@@ -57,27 +229,60 @@ class Machine:
         instruction_table.insert(Instruction('PUSH', 1, cls.push))
         instruction_table.insert(Instruction('POP', 0, cls.pop))
         instruction_table.insert(Instruction('DUP', 0, cls.dup))
-        instruction_table.insert(Instruction('ADD', 0, cls.add))
-        instruction_table.insert(Instruction('SUB', 0, cls.sub))
-        instruction_table.insert(Instruction('MUL', 0, cls.mul))
-        instruction_table.insert(Instruction('DIV', 0, cls.div))
+        instruction_table.insert(Instruction('ADD', 0, cls.add, bind=cls.bind_add))
+        instruction_table.insert(Instruction('SUB', 0, cls.sub, bind=cls.bind_sub))
+        instruction_table.insert(Instruction('MUL', 0, cls.mul, bind=cls.bind_mul))
+        instruction_table.insert(Instruction('DIV', 0, cls.div, bind=cls.bind_div))
         instruction_table.insert(Instruction('AND', 0, cls.and_op))
         instruction_table.insert(Instruction('OR', 0, cls.or_op))
         instruction_table.insert(Instruction('NOT', 0, cls.not_op))
-        instruction_table.insert(Instruction('ISEQ', 0, cls.is_equal))
-        instruction_table.insert(Instruction('ISGT', 0, cls.is_greater))
-        instruction_table.insert(Instruction('ISGE', 0, cls.is_greater_equal))
-        instruction_table.insert(Instruction('JUMP', 1, cls.jump))
-        instruction_table.insert(Instruction('JUMP_IF', 1, cls.jump_if))
+        instruction_table.insert(Instruction('ISEQ', 0, cls.is_equal, bind=cls.bind_is_equal))
+        instruction_table.insert(Instruction('ISGT', 0, cls.is_greater, bind=cls.bind_is_greater))
+        instruction_table.insert(Instruction('ISGE', 0, cls.is_greater_equal, bind=cls.bind_is_greater_equal))
+        instruction_table.insert(Instruction('JUMP', 1, cls.jump, targets=(0,)))
+        instruction_table.insert(Instruction('JUMP_IF', 1, cls.jump_if, targets=(0,)))
         instruction_table.insert(Instruction('LOAD', 1, cls.load))
         instruction_table.insert(Instruction('STORE', 1, cls.store))
-        instruction_table.insert(Instruction('FUNC', 2, cls.call_builtin_func))
-        instruction_table.insert(Instruction('CALL', 1, cls.call))
+        instruction_table.insert(Instruction('LOAD_FAST', 1, cls.load_fast))
+        instruction_table.insert(Instruction('STORE_FAST', 1, cls.store_fast))
+        instruction_table.insert(Instruction('ENTER', 1, cls.enter))
+        instruction_table.insert(Instruction('FUNC', 2, cls.call_builtin_func, bind=cls.bind_builtin_func))
+        instruction_table.insert(Instruction('CALL', 1, cls.call, targets=(0,)))
+        instruction_table.insert(Instruction('CALL_FAST', 2, cls.call_fast, targets=(0,)))
         instruction_table.insert(Instruction('RET', 0, cls.ret))
+        instruction_table.insert(Instruction('TAIL_CALL', 1, cls.tail_call, targets=(0,)))
+        instruction_table.insert(Instruction('TAIL_CALL_FAST', 2, cls.tail_call_fast, targets=(0,)))
+        # Superinstructions produced by compiler.peephole
+        instruction_table.insert(Instruction('JUMP_IF_NOT', 1, cls.jump_if_not, targets=(0,)))
+        instruction_table.insert(Instruction('JUMP_UNLESS_EQ', 1, cls.jump_unless_equal, targets=(0,)))
+        instruction_table.insert(Instruction('JUMP_UNLESS_GT', 1, cls.jump_unless_greater, targets=(0,)))
+        instruction_table.insert(Instruction('JUMP_UNLESS_GE', 1, cls.jump_unless_greater_equal, targets=(0,)))
+        instruction_table.insert(Instruction('JUMP_UNLESS_EQ_FAST', 3, cls.jump_unless_equal_fast, targets=(2,)))
+        instruction_table.insert(Instruction('JUMP_UNLESS_GT_FAST', 3, cls.jump_unless_greater_fast, targets=(2,)))
+        instruction_table.insert(Instruction('JUMP_UNLESS_GE_FAST', 3,
+                                             cls.jump_unless_greater_equal_fast, targets=(2,)))
+        instruction_table.insert(Instruction('JUMP_IF_EQ', 1, cls.jump_if_equal, targets=(0,)))
+        instruction_table.insert(Instruction('JUMP_IF_GT', 1, cls.jump_if_greater, targets=(0,)))
+        instruction_table.insert(Instruction('JUMP_IF_GE', 1, cls.jump_if_greater_equal, targets=(0,)))
+        instruction_table.insert(Instruction('JUMP_IF_EQ_FAST', 3, cls.jump_if_equal_fast, targets=(2,)))
+        instruction_table.insert(Instruction('JUMP_IF_GT_FAST', 3, cls.jump_if_greater_fast, targets=(2,)))
+        instruction_table.insert(Instruction('JUMP_IF_GE_FAST', 3, cls.jump_if_greater_equal_fast, targets=(2,)))
+        instruction_table.insert(Instruction('LOAD2', 2, cls.load2))
+        instruction_table.insert(Instruction('LOAD2_FAST', 2, cls.load2_fast))
+        instruction_table.insert(Instruction('ADD_FAST', 2, cls.add_fast))
+        instruction_table.insert(Instruction('SUB_FAST', 2, cls.sub_fast))
+        instruction_table.insert(Instruction('MUL_FAST', 2, cls.mul_fast))
+        instruction_table.insert(Instruction('DIV_FAST', 2, cls.div_fast))
+        instruction_table.insert(Instruction('INC', 2, cls.inc))
+        instruction_table.insert(Instruction('INC_FAST', 2, cls.inc_fast))
+        # Counted loops: counter, stop, step, loop variable, body
+        instruction_table.insert(Instruction('FOR_RANGE', 5, cls.for_range, targets=(4,)))
+        instruction_table.insert(Instruction('FOR_RANGE_FAST', 5, cls.for_range_fast, targets=(4,)))
         return instruction_table
 
     def halt(self, args):
         self._is_halted = True
+        raise _Halt()
 
     def push(self, args):
         arg = args[0]
@@ -140,6 +345,72 @@ class Machine:
         lh = self.pop_operand()
         self.push_operand(lh >= rh)
 
+    # Arithmetic and compares as bound at decode time: they pop the right
+    # operand and overwrite the left one, so the stack never grows and needs
+    # no capacity check
+    def bind_add(self, args):
+        stack = self.operand_stack
+        pop = stack.pop
+
+        def handler(args):
+            rh = pop()
+            stack[-1] = stack[-1] + rh
+        return handler
+
+    def bind_sub(self, args):
+        stack = self.operand_stack
+        pop = stack.pop
+
+        def handler(args):
+            rh = pop()
+            stack[-1] = stack[-1] - rh
+        return handler
+
+    def bind_mul(self, args):
+        stack = self.operand_stack
+        pop = stack.pop
+
+        def handler(args):
+            rh = pop()
+            stack[-1] = stack[-1] * rh
+        return handler
+
+    def bind_div(self, args):
+        stack = self.operand_stack
+        pop = stack.pop
+
+        def handler(args):
+            rh = pop()
+            stack[-1] = stack[-1] / rh
+        return handler
+
+    def bind_is_equal(self, args):
+        stack = self.operand_stack
+        pop = stack.pop
+
+        def handler(args):
+            rh = pop()
+            stack[-1] = stack[-1] == rh
+        return handler
+
+    def bind_is_greater(self, args):
+        stack = self.operand_stack
+        pop = stack.pop
+
+        def handler(args):
+            rh = pop()
+            stack[-1] = stack[-1] > rh
+        return handler
+
+    def bind_is_greater_equal(self, args):
+        stack = self.operand_stack
+        pop = stack.pop
+
+        def handler(args):
+            rh = pop()
+            stack[-1] = stack[-1] >= rh
+        return handler
+
     def jump(self, args):
         new_ip = args[0]
         self.instruction_pointer = new_ip
@@ -163,21 +434,264 @@ class Machine:
         variable = self.pop_operand()
         self.current_context.set_variable(variable_name, variable)
 
+    def load_fast(self, args):
+        value = self.current_context.slots[args[0]]
+        if value is _UNSET:
+            raise unset_slot(args[0])
+        self.push_operand(value)
+
+    def store_fast(self, args):
+        self.current_context.slots[args[0]] = self.pop_operand()
+
+    def unset_slots(self, indexes):
+        # Raised for the first unset slot, the one a plain LOAD_FAST would read first
+        slots = self.current_context.slots
+        for index in indexes:
+            if slots[index] is _UNSET:
+                raise unset_slot(index)
+
+    def enter(self, args):
+        frame_size = args[0]
+        self.current_context.slots = [_UNSET] * frame_size
+
     def call_builtin_func(self, args):
         func_name = args[0]
         argv = args[1]
         params = []
         for i in range(argv):
             params.append(self.pop_operand())
-        func = getattr(builtins, func_name)
+        func = self.builtins.bind(func_name, argv)
         self.push_operand(func(*params))
 
+    def bind_builtin_func(self, args):
+        # The function is looked up and its arity checked once, here; the
+        # handler pops the arguments top first, like call_builtin_func
+        func = self.builtins.bind(args[0], args[1])
+        argv = args[1]
+        push, pop = self.push_operand, self.pop_operand
+        if argv == 0:
+            def handler(args):
+                push(func())
+        elif argv == 1:
+            def handler(args):
+                push(func(pop()))
+        elif argv == 2:
+            def handler(args):
+                first = pop()
+                push(func(first, pop()))
+        else:
+            def handler(args):
+                push(func(*[pop() for i in range(argv)]))
+        return handler
+
     def call(self, args):
         new_ip = args[0]
         self.push_context(self.instruction_pointer)
         self.instruction_pointer = new_ip
 
+    def call_fast(self, args):
+        new_ip = args[0]
+        frame_size = args[1]
+        self.push_context(self.instruction_pointer, frame_size)
+        self.instruction_pointer = new_ip
+
+    def tail_call(self, args):
+        # The callee takes over the current frame and returns to our caller
+        self.current_context.reset(self.current_context.return_address)
+        self.instruction_pointer = args[0]
+
+    def tail_call_fast(self, args):
+        self.current_context.reset(self.current_context.return_address, args[1])
+        self.instruction_pointer = args[0]
+
     def ret(self, args):
         new_ip = self.current_context.get_return_address()
         self.pop_context()
         self.instruction_pointer = new_ip
+
+    def jump_if_not(self, args):
+        if not self.pop_operand():
+            self.instruction_pointer = args[0]
+
+    def jump_unless_equal(self, args):
+        rh = self.pop_operand()
+        lh = self.pop_operand()
+        if not lh == rh:
+            self.instruction_pointer = args[0]
+
+    def jump_unless_greater(self, args):
+        rh = self.pop_operand()
+        lh = self.pop_operand()
+        if not lh > rh:
+            self.instruction_pointer = args[0]
+
+    def jump_unless_greater_equal(self, args):
+        rh = self.pop_operand()
+        lh = self.pop_operand()
+        if not lh >= rh:
+            self.instruction_pointer = args[0]
+
+    def jump_unless_equal_fast(self, args):
+        slots = self.current_context.slots
+        lh = slots[args[0]]
+        rh = slots[args[1]]
+        if lh is _UNSET or rh is _UNSET:
+            self.unset_slots(args[:2])
+        if not lh == rh:
+            self.instruction_pointer = args[2]
+
+    def jump_unless_greater_fast(self, args):
+        slots = self.current_context.slots
+        lh = slots[args[0]]
+        rh = slots[args[1]]
+        if lh is _UNSET or rh is _UNSET:
+            self.unset_slots(args[:2])
+        if not lh > rh:
+            self.instruction_pointer = args[2]
+
+    def jump_unless_greater_equal_fast(self, args):
+        slots = self.current_context.slots
+        lh = slots[args[0]]
+        rh = slots[args[1]]
+        if lh is _UNSET or rh is _UNSET:
+            self.unset_slots(args[:2])
+        if not lh >= rh:
+            self.instruction_pointer = args[2]
+
+    # Jumps taken when the comparison holds, for branches laid out with the
+    # false successor next (compiler.passes.layout_blocks)
+    def jump_if_equal(self, args):
+        rh = self.pop_operand()
+        lh = self.pop_operand()
+        if lh == rh:
+            self.instruction_pointer = args[0]
+
+    def jump_if_greater(self, args):
+        rh = self.pop_operand()
+        lh = self.pop_operand()
+        if lh > rh:
+            self.instruction_pointer = args[0]
+
+    def jump_if_greater_equal(self, args):
+        rh = self.pop_operand()
+        lh = self.pop_operand()
+        if lh >= rh:
+            self.instruction_pointer = args[0]
+
+    def jump_if_equal_fast(self, args):
+        slots = self.current_context.slots
+        lh = slots[args[0]]
+        rh = slots[args[1]]
+        if lh is _UNSET or rh is _UNSET:
+            self.unset_slots(args[:2])
+        if lh == rh:
+            self.instruction_pointer = args[2]
+
+    def jump_if_greater_fast(self, args):
+        slots = self.current_context.slots
+        lh = slots[args[0]]
+        rh = slots[args[1]]
+        if lh is _UNSET or rh is _UNSET:
+            self.unset_slots(args[:2])
+        if lh > rh:
+            self.instruction_pointer = args[2]
+
+    def jump_if_greater_equal_fast(self, args):
+        slots = self.current_context.slots
+        lh = slots[args[0]]
+        rh = slots[args[1]]
+        if lh is _UNSET or rh is _UNSET:
+            self.unset_slots(args[:2])
+        if lh >= rh:
+            self.instruction_pointer = args[2]
+
+    def load2(self, args):
+        self.push_operand(self.current_context.get_variable(args[0]))
+        self.push_operand(self.current_context.get_variable(args[1]))
+
+    def load2_fast(self, args):
+        slots = self.current_context.slots
+        lh = slots[args[0]]
+        rh = slots[args[1]]
+        if lh is _UNSET or rh is _UNSET:
+            self.unset_slots(args)
+        self.push_operand(lh)
+        self.push_operand(rh)
+
+    def add_fast(self, args):
+        slots = self.current_context.slots
+        lh = slots[args[0]]
+        rh = slots[args[1]]
+        if lh is _UNSET or rh is _UNSET:
+            self.unset_slots(args)
+        self.push_operand(lh + rh)
+
+    def sub_fast(self, args):
+        slots = self.current_context.slots
+        lh = slots[args[0]]
+        rh = slots[args[1]]
+        if lh is _UNSET or rh is _UNSET:
+            self.unset_slots(args)
+        self.push_operand(lh - rh)
+
+    def mul_fast(self, args):
+        slots = self.current_context.slots
+        lh = slots[args[0]]
+        rh = slots[args[1]]
+        if lh is _UNSET or rh is _UNSET:
+            self.unset_slots(args)
+        self.push_operand(lh * rh)
+
+    def div_fast(self, args):
+        slots = self.current_context.slots
+        lh = slots[args[0]]
+        rh = slots[args[1]]
+        if lh is _UNSET or rh is _UNSET:
+            self.unset_slots(args)
+        self.push_operand(lh / rh)
+
+    def inc(self, args):
+        variable_name = args[0]
+        variable = self.current_context.get_variable(variable_name)
+        self.current_context.set_variable(variable_name, variable + args[1])
+
+    def inc_fast(self, args):
+        slots = self.current_context.slots
+        value = slots[args[0]]
+        if value is _UNSET:
+            raise unset_slot(args[0])
+        slots[args[0]] = value + args[1]
+
+    def for_range(self, args):
+        # Enter the body with the next value of the counter, or fall through
+        variables = self.current_context.variables
+        value = variables[args[0]]
+        step = variables[args[2]]
+        if step > 0:
+            more = value < variables[args[1]]
+        elif step < 0:
+            more = value > variables[args[1]]
+        else:
+            raise ValueError('range() arg 3 must not be zero')
+        if more:
+            variables[args[3]] = value
+            variables[args[0]] = value + step
+            self.instruction_pointer = args[4]
+
+    def for_range_fast(self, args):
+        slots = self.current_context.slots
+        value = slots[args[0]]
+        stop = slots[args[1]]
+        step = slots[args[2]]
+        if value is _UNSET or stop is _UNSET or step is _UNSET:
+            self.unset_slots(args[:3])
+        if step > 0:
+            more = value < stop
+        elif step < 0:
+            more = value > stop
+        else:
+            raise ValueError('range() arg 3 must not be zero')
+        if more:
+            slots[args[3]] = value
+            slots[args[0]] = value + step
+            self.instruction_pointer = args[4]
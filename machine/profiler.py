@@ -0,0 +1,184 @@
+from .machine import _Halt
+
+MAIN = 0
+_TAIL_CALLS = {'TAIL_CALL', 'TAIL_CALL_FAST'}
+
+
+class Profiler:
+    """Opcode and hot-spot profile of a machine run.
+
+    ``run`` drives the machine with its own loop, so ``Machine.run`` has no
+    profiling checks. The exact mode counts every dispatched instruction by
+    opcode, by instruction pointer and by opcode pair, and follows calls
+    through the depth of the context stack: each instruction is charged to
+    the chain of function entry addresses active when it ran. With
+    ``sample_every`` only one instruction in that many is recorded, and its
+    call chain is recovered from the return addresses on the context stack;
+    opcode pairs are not recorded then, and a frame reused by a tail call
+    is charged to the function first called into it.
+
+    Calls into JIT-compiled functions run inside one instruction and are
+    charged to the caller.
+    """
+
+    def __init__(self, machine, sample_every: int = None, names: dict = None):
+        if sample_every is not None and sample_every < 1:
+            raise ValueError('sample_every must be at least 1')
+        self.machine = machine
+        self.sample_every = sample_every
+        self.names = dict(names or {})
+        self.ops = {}
+        self.sites = {}
+        self.pairs = {}
+        # Call chain (tuple of entry addresses) -> instructions run at its top
+        self.stacks = {}
+        self.calls = {}
+        self.total = 0
+
+    def run(self):
+        if self.machine.is_halted:
+            return self
+        if self.sample_every is None:
+            self._run_exact()
+        else:
+            self._run_sampled()
+        return self
+
+    def _run_exact(self):
+        machine = self.machine
+        program = machine.program
+        code = machine.code
+        contexts = machine.context_stack
+        ops, sites, pairs, stacks, calls = self.ops, self.sites, self.pairs, self.stacks, self.calls
+        path = (MAIN,) * len(contexts)
+        previous = None
+        try:
+            while True:
+                ip = machine.instruction_pointer
+                handler, args, machine.instruction_pointer = code[ip]
+                op = program[ip]
+                ops[op] = ops.get(op, 0) + 1
+                sites[ip] = sites.get(ip, 0) + 1
+                if previous is not None:
+                    pair = (previous, op)
+                    pairs[pair] = pairs.get(pair, 0) + 1
+                previous = op
+                stacks[path] = stacks.get(path, 0) + 1
+                self.total += 1
+                handler(args)
+                depth = len(contexts)
+                if depth > len(path):
+                    entry = machine.instruction_pointer
+                    calls[entry] = calls.get(entry, 0) + 1
+                    path += (entry,) * (depth - len(path))
+                elif depth < len(path):
+                    path = path[:depth]
+                elif op in _TAIL_CALLS:
+                    # The callee replaced the caller's frame
+                    entry = machine.instruction_pointer
+                    calls[entry] = calls.get(entry, 0) + 1
+                    path = path[:-1] + (entry,)
+        except _Halt:
+            pass
+
+    def _call_targets(self) -> dict:
+        """Entry address called by each return address, from the call sites in the program."""
+        machine = self.machine
+        table = machine.instruction_table
+        targets = {}
+        ip = 0
+        size = len(machine.program)
+        while ip < size:
+            instruction = table.table.get(machine.program[ip])
+            if instruction is None:
+                break
+            next_ip = ip + 1 + instruction.arity
+            if instruction.name.startswith('CALL') and instruction.targets:
+                targets[next_ip] = machine.program[ip + 1 + instruction.targets[0]]
+            ip = next_ip
+        return targets
+
+    def _run_sampled(self):
+        machine = self.machine
+        program = machine.program
+        code = machine.code
+        contexts = machine.context_stack
+        targets = self._call_targets()
+        ops, sites, stacks = self.ops, self.sites, self.stacks
+        every = self.sample_every
+        countdown = every
+        try:
+            while True:
+                ip = machine.instruction_pointer
+                countdown -= 1
+                if not countdown:
+                    countdown = every
+                    op = program[ip]
+                    ops[op] = ops.get(op, 0) + 1
+                    sites[ip] = sites.get(ip, 0) + 1
+                    path = (MAIN,) + tuple(
+                        targets.get(context.return_address, -1) for context in contexts[1:])
+                    stacks[path] = stacks.get(path, 0) + 1
+                    self.total += 1
+                handler, args, machine.instruction_pointer = code[ip]
+                handler(args)
+        except _Halt:
+            pass
+
+    # Results
+
+    def name(self, entry: int) -> str:
+        if entry in self.names:
+            return self.names[entry]
+        if entry == MAIN:
+            return 'main'
+        return '?' if entry < 0 else '@%d' % entry
+
+    def functions(self) -> dict:
+        """entry -> (calls, inclusive, exclusive) instruction counts."""
+        inclusive = {}
+        exclusive = {}
+        for path, count in self.stacks.items():
+            exclusive[path[-1]] = exclusive.get(path[-1], 0) + count
+            # Recursive entries are counted once per chain
+            for entry in set(path):
+                inclusive[entry] = inclusive.get(entry, 0) + count
+        return {entry: (self.calls.get(entry, 0), inclusive[entry], exclusive.get(entry, 0))
+                for entry in inclusive}
+
+    def collapsed(self) -> list:
+        """Lines of the collapsed-stack format read by flamegraph tools."""
+        return sorted('%s %d' % (';'.join(self.name(entry) for entry in path), count)
+                      for path, count in self.stacks.items())
+
+    def write_collapsed(self, file):
+        for line in self.collapsed():
+            file.write(line)
+            file.write('\n')
+
+    def report(self, limit: int = 10) -> str:
+        unit = 'instructions' if self.sample_every is None else 'samples (1 in %d)' % self.sample_every
+        total = self.total or 1
+        lines = ['%d %s' % (self.total, unit), '', 'Opcodes']
+        for op, count in _top(self.ops, limit):
+            lines.append('  %-24s %10d %6.1f%%' % (op, count, count * 100 / total))
+        lines += ['', 'Hot sites']
+        for ip, count in _top(self.sites, limit):
+            lines.append('  %6d %-17s %10d %6.1f%%' % (ip, self.machine.program[ip], count, count * 100 / total))
+        if self.pairs:
+            lines += ['', 'Opcode pairs']
+            for (first, second), count in _top(self.pairs, limit):
+                lines.append('  %-24s %10d' % ('%s %s' % (first, second), count))
+        lines += ['', 'Functions %21s %10s %10s' % ('calls', 'inclusive', 'exclusive')]
+        functions = self.functions()
+        for entry in sorted(functions, key=lambda entry: -functions[entry][1])[:limit]:
+            calls, inclusive, exclusive = functions[entry]
+            lines.append('  %-24s %6d %10d %10d' % (self.name(entry), calls, inclusive, exclusive))
+        return '\n'.join(lines)
+
+    def __str__(self):
+        return self.report()
+
+
+def _top(counts: dict, limit: int) -> list:
+    return sorted(counts.items(), key=lambda item: -item[1])[:limit]
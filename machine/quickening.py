@@ -0,0 +1,213 @@
+import operator
+
+BINARY_OPS = {'ADD': operator.add, 'SUB': operator.sub, 'MUL': operator.mul}
+COMPARE_OPS = {'ISGT': operator.gt, 'ISGE': operator.ge, 'ISEQ': operator.eq}
+BINARY_FAST_OPS = {'ADD_FAST': operator.add, 'SUB_FAST': operator.sub, 'MUL_FAST': operator.mul}
+QUICKENED_OPS = set(BINARY_OPS) | set(COMPARE_OPS) | set(BINARY_FAST_OPS)
+
+# Operand types a site can be specialized for
+_TYPES = {int: 'INT', float: 'FLOAT'}
+_MAX_BACKOFF = 64
+
+
+class Site:
+    """Quickening state of one instruction site.
+
+    A site is an arithmetic or compare instruction together with the one
+    after it: the STORE of an arithmetic result, or the [NOT] JUMP_IF/
+    JUMP_IF_NOT on a compare. It starts adaptive: it runs the generic
+    handler and counts executions. Once the counter reaches the threshold
+    it looks at its operand types and, if both are int or both are float,
+    installs a specialized record in ``Machine.code`` that also does the
+    work of the following instruction, so that one is not dispatched. A
+    type miss in the specialized record deoptimizes the site back to
+    adaptive.
+    """
+
+    def __init__(self, machine, ip: int, op: str, threshold: int, record, follower):
+        self.machine = machine
+        self.ip = ip
+        self.op = op
+        self.threshold = threshold
+        self.follower = follower
+        self.backoff = 1
+        self.counter = 0
+        self.executions = 0
+        self.specialized = None
+        self.specializations = 0
+        self.deopts = 0
+        self.generic, self.args, self.next_ip = record
+        self.adaptive_record = (self.adaptive, self.args, self.next_ip)
+
+    def __str__(self):
+        return '%5d %-20s %-24s exec=%d spec=%d deopt=%d' % (
+            self.ip, self.op, self.specialized or '-', self.executions, self.specializations, self.deopts)
+
+    def adaptive(self, args):
+        self.executions += 1
+        self.counter += 1
+        if self.counter >= self.threshold * self.backoff:
+            self.counter = 0
+            if not self.specialize():
+                self.backoff = min(self.backoff * 2, _MAX_BACKOFF)
+        self.generic(args)
+
+    def deoptimize(self, args):
+        """Run the generic handler after a type miss; the following instruction runs on its own."""
+        self.deopts += 1
+        self.specialized = None
+        self.counter = 0
+        self.machine.code[self.ip] = self.adaptive_record
+        self.machine.instruction_pointer = self.next_ip
+        self.generic(args)
+
+    def _operands(self):
+        if self.op in BINARY_FAST_OPS:
+            slots = self.machine.current_context.slots
+            return slots[self.args[0]], slots[self.args[1]]
+        stack = self.machine.operand_stack
+        if len(stack) < 2:
+            return None, None
+        return stack[-2], stack[-1]
+
+    def specialize(self) -> bool:
+        lh, rh = self._operands()
+        if type(lh) is not type(rh) or type(lh) not in _TYPES:
+            return False
+        guard = type(lh)
+        name = self.op + '_' + _TYPES[guard]
+        if self.op in COMPARE_OPS:
+            jump_when, target, next_ip = self.follower
+            name += '_BRANCH'
+            handler = _compare_and_branch(self, COMPARE_OPS[self.op], guard, jump_when, target)
+        else:
+            store, next_ip = self.follower
+            name += '_' + store
+            if self.op in BINARY_OPS:
+                handler = _binary_and_store(self, BINARY_OPS[self.op], guard, store)
+            else:
+                handler = _binary_fast_and_store(self, BINARY_FAST_OPS[self.op], guard)
+        self.specialized = name
+        self.specializations += 1
+        self.backoff = 1
+        self.machine.code[self.ip] = (handler, self.args, next_ip)
+        return True
+
+
+def _following_branch(program, ip: int):
+    # A JUMP_IF/JUMP_IF_NOT (optionally after NOT) following a compare can be
+    # taken by the compare itself: (jump when the compare gives, target,
+    # address after the jump)
+    jump_when = True
+    if ip < len(program) and program[ip] == 'NOT':
+        ip += 1
+        jump_when = False
+    if ip + 1 >= len(program) or program[ip] not in ('JUMP_IF', 'JUMP_IF_NOT'):
+        return None
+    if program[ip] == 'JUMP_IF_NOT':
+        jump_when = not jump_when
+    return jump_when, program[ip + 1], ip + 2
+
+
+def _following_store(program, ip: int, fast: bool):
+    # A STORE of the result: (its name, address after it); the _FAST forms
+    # store to a slot and only pair with STORE_FAST
+    stores = ('STORE_FAST',) if fast else ('STORE', 'STORE_FAST')
+    if ip + 1 >= len(program) or program[ip] not in stores:
+        return None
+    return program[ip], ip + 2
+
+
+def _compare_and_branch(site, op, guard, jump_when, target):
+    machine = site.machine
+    stack = machine.operand_stack
+    pop = stack.pop
+
+    def handler(args):
+        rh = pop()
+        lh = stack[-1]
+        if type(lh) is guard and type(rh) is guard:
+            pop()
+            if op(lh, rh) == jump_when:
+                machine.instruction_pointer = target
+        else:
+            stack.append(rh)
+            site.deoptimize(args)
+    return handler
+
+
+def _binary_and_store(site, op, guard, store):
+    machine = site.machine
+    stack = machine.operand_stack
+    pop = stack.pop
+    # The STORE's operand: a slot for STORE_FAST, else a variable name
+    target = machine.program[site.next_ip + 1]
+
+    if store == 'STORE_FAST':
+        def handler(args):
+            rh = pop()
+            lh = stack[-1]
+            if type(lh) is guard and type(rh) is guard:
+                pop()
+                machine.current_context.slots[target] = op(lh, rh)
+            else:
+                stack.append(rh)
+                site.deoptimize(args)
+    else:
+        def handler(args):
+            rh = pop()
+            lh = stack[-1]
+            if type(lh) is guard and type(rh) is guard:
+                pop()
+                machine.current_context.variables[target] = op(lh, rh)
+            else:
+                stack.append(rh)
+                site.deoptimize(args)
+    return handler
+
+
+def _binary_fast_and_store(site, op, guard):
+    machine = site.machine
+    i, j = site.args
+    target = machine.program[site.next_ip + 1]
+
+    def handler(args):
+        slots = machine.current_context.slots
+        lh = slots[i]
+        rh = slots[j]
+        if type(lh) is guard and type(rh) is guard:
+            slots[target] = op(lh, rh)
+        else:
+            site.deoptimize(args)
+    return handler
+
+
+class Quickening:
+    """Adaptive sites of a machine, keyed by instruction pointer."""
+
+    def __init__(self, machine, threshold: int):
+        self.machine = machine
+        self.threshold = threshold
+        self.sites = {}
+
+    def wrap(self, ip: int, record):
+        """Return the record to install for the instruction decoded at ``ip``.
+
+        Only instructions followed by one a specialization can take over get
+        a site; the rest keep their generic record and cost nothing.
+        """
+        program = self.machine.program
+        op = program[ip]
+        if op not in QUICKENED_OPS:
+            return record
+        if op in COMPARE_OPS:
+            follower = _following_branch(program, record[2])
+        else:
+            follower = _following_store(program, record[2], op in BINARY_FAST_OPS)
+        if follower is None:
+            return record
+        site = self.sites[ip] = Site(self.machine, ip, op, self.threshold, record, follower)
+        return site.adaptive_record
+
+    def report(self) -> str:
+        return '\n'.join(str(site) for site in sorted(self.sites.values(), key=lambda site: site.ip))
@@ -0,0 +1,136 @@
+"""Functions a program can call with FUNC.
+
+A name resolves to a function registered by the host first, then to one of
+compiler.custom_builtins, then to a Python builtin. Resolution and the
+argument count check happen once, when a FUNC site is decoded, so the
+instruction calls the function directly. Natives written in C or backed by
+NumPy are registered like any other function; give their ``arity`` when it
+can not be read from Python code objects.
+"""
+import builtins as python_builtins
+
+CUSTOM_BUILTINS = 'compiler.custom_builtins'
+_VARARGS = 0x04
+
+
+class BuiltinError(Exception):
+    pass
+
+
+def _arity(func):
+    """(least, most) positional arguments of a Python function, None for unknown."""
+    code = getattr(func, '__code__', None)
+    if code is None:
+        return None
+    most = code.co_argcount
+    least = most - len(getattr(func, '__defaults__', None) or ())
+    if getattr(func, '__self__', None) is not None:
+        least, most = max(least - 1, 0), most - 1
+    return least, None if code.co_flags & _VARARGS else most
+
+
+class Builtin:
+    __slots__ = ('name', 'func', 'arity')
+
+    def __init__(self, name: str, func, arity=None):
+        self.name = name
+        self.func = func
+        if isinstance(arity, int):
+            arity = (arity, arity)
+        self.arity = arity if arity is not None else _arity(func)
+
+    def accepts(self, argc: int) -> bool:
+        if self.arity is None:
+            return True
+        least, most = self.arity
+        return least <= argc and (most is None or argc <= most)
+
+
+class BuiltinRegistry:
+    def __init__(self, python: bool = True, custom: bool = True):
+        self.python = python
+        self.custom = custom
+        self._host = {}
+        # Resolved custom and Python builtins
+        self._resolved = {}
+        self._custom_functions = None
+
+    def register(self, name: str, func=None, arity=None):
+        """Make ``func`` callable as ``name``; without ``func``, a decorator."""
+        if func is None:
+            def decorator(func):
+                self.register(name, func, arity)
+                return func
+            return decorator
+        if not callable(func):
+            raise BuiltinError('Builtin %r is not callable' % name)
+        self._host[name] = Builtin(name, func, arity)
+        self._resolved.pop(name, None)
+        return func
+
+    def unregister(self, name: str):
+        self._host.pop(name, None)
+
+    def _custom(self) -> dict:
+        if self._custom_functions is None:
+            functions = {}
+            if self.custom:
+                import importlib
+                try:
+                    module = importlib.import_module(CUSTOM_BUILTINS)
+                except ImportError:
+                    module = None
+                for name, value in vars(module).items() if module is not None else ():
+                    if not name.startswith('_') and callable(value) \
+                            and getattr(value, '__module__', None) == module.__name__:
+                        functions[name] = value
+            self._custom_functions = functions
+        return self._custom_functions
+
+    def lookup(self, name: str) -> Builtin:
+        builtin = self._host.get(name) or self._resolved.get(name)
+        if builtin is not None:
+            return builtin
+        func = self._custom().get(name)
+        if func is None and self.python and not name.startswith('_'):
+            func = getattr(python_builtins, name, None)
+        if func is None or not callable(func):
+            raise BuiltinError('Unknown builtin %r' % name)
+        builtin = self._resolved[name] = Builtin(name, func)
+        return builtin
+
+    def bind(self, name: str, argc: int):
+        """The function to call for ``name`` with ``argc`` arguments."""
+        builtin = self.lookup(name)
+        if not builtin.accepts(argc):
+            least, most = builtin.arity
+            expected = str(least) if least == most else \
+                'at least %d' % least if most is None else '%d to %d' % (least, most)
+            raise BuiltinError('Builtin %r takes %s arguments, %d given' % (name, expected, argc))
+        return builtin.func
+
+    def names(self) -> list:
+        """Every name that resolves, sorted."""
+        names = set(self._host) | set(self._custom())
+        if self.python:
+            names.update(name for name, value in vars(python_builtins).items()
+                         if not name.startswith('_') and callable(value))
+        return sorted(names)
+
+    def __contains__(self, name: str) -> bool:
+        try:
+            self.lookup(name)
+        except BuiltinError:
+            return False
+        return True
+
+
+_default = None
+
+
+def default_registry() -> BuiltinRegistry:
+    """The registry machines use unless given another one."""
+    global _default
+    if _default is None:
+        _default = BuiltinRegistry()
+    return _default
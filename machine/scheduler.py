@@ -0,0 +1,147 @@
+"""Cooperative scheduling of many machines on one asyncio event loop.
+
+Machines run round-robin in slices of at most ``budget`` instructions;
+every instruction boundary is a safe point, so a slice can end anywhere
+and the machine resumes where it stopped. Each task accounts for the
+instructions it ran, the CPU time of its slices and how many it had.
+
+FUNC calls to the scheduler's builtins (by default ``print`` and
+``input``) suspend the machine instead of blocking: the builtin is called
+as ``builtin(task, *args)``, the awaitable it returns runs on the event
+loop while other machines get their slices, and its result is pushed on
+the machine's operand stack when the task is queued again.
+
+    scheduler = Scheduler(budget=1000)
+    task = scheduler.spawn(program)
+    await scheduler.run()
+    print(task.output)
+"""
+import asyncio
+import time
+from collections import deque
+
+from .instruction import Instruction
+from .machine import Machine, Suspend
+
+
+async def _print(task, *params):
+    task.output.append(' '.join(str(param) for param in params))
+
+
+async def _input(task, prompt=''):
+    if prompt:
+        task.output.append(str(prompt))
+    return await task.input.get()
+
+
+DEFAULT_BUILTINS = {'print': _print, 'input': _input}
+
+
+def _func(machine, args):
+    """FUNC that suspends the machine for the scheduler's builtins."""
+    name, argc = args
+    if name not in machine.scheduled_builtins:
+        return Machine.call_builtin_func(machine, args)
+    params = [machine.pop_operand() for i in range(argc)]
+    raise Suspend((name, params))
+
+
+class ScriptTask:
+    def __init__(self, machine: Machine, name: str):
+        self.machine = machine
+        self.name = name
+        self.instructions = 0
+        self.cpu_time = 0.0
+        self.slices = 0
+        self.output = []
+        # Lines read by input()
+        self.input = asyncio.Queue()
+        self.error = None
+        self._finished = asyncio.Event()
+
+    @property
+    def done(self) -> bool:
+        return self._finished.is_set()
+
+    async def wait(self) -> Machine:
+        await self._finished.wait()
+        if self.error is not None:
+            raise self.error
+        return self.machine
+
+    def __str__(self):
+        state = 'running' if not self.done else 'failed' if self.error else 'done'
+        return '%s %s: %d instructions in %d slices, %.3f ms' % (
+            self.name, state, self.instructions, self.slices, self.cpu_time * 1e3)
+
+
+class Scheduler:
+    def __init__(self, budget: int = 1000, builtins: dict = None):
+        if budget < 1:
+            raise ValueError('budget must be at least 1')
+        self.budget = budget
+        self.builtins = dict(DEFAULT_BUILTINS if builtins is None else builtins)
+        self.instruction_table = Machine.get_instruction_table()
+        self.instruction_table.insert(Instruction('FUNC', 2, _func))
+        self.tasks = []
+        self._ready = deque()
+        self._waiting = 0
+        self._wakeup = asyncio.Event()
+
+    def spawn(self, program: list, name: str = None, **machine_options) -> ScriptTask:
+        machine = Machine(program, self.instruction_table, **machine_options)
+        machine.scheduled_builtins = frozenset(self.builtins)
+        task = ScriptTask(machine, name or 'script%d' % len(self.tasks))
+        self.tasks.append(task)
+        self._ready.append(task)
+        self._wakeup.set()
+        return task
+
+    async def run(self):
+        """Run until every spawned task has finished."""
+        ready = self._ready
+        while ready or self._waiting:
+            if not ready:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            self._run_slice(ready.popleft())
+            # Let builtins and other coroutines of the loop make progress
+            await asyncio.sleep(0)
+
+    def _run_slice(self, task: ScriptTask):
+        machine = task.machine
+        start = time.perf_counter()
+        try:
+            task.instructions += machine.run_for(self.budget)
+        except Exception as e:
+            self._finish(task, e)
+            return
+        finally:
+            task.cpu_time += time.perf_counter() - start
+            task.slices += 1
+        if machine.is_halted:
+            self._finish(task)
+        elif machine.suspended is not None:
+            name, params = machine.suspended
+            machine.suspended = None
+            self._waiting += 1
+            asyncio.ensure_future(self._resume(task, self.builtins[name](task, *params)))
+        else:
+            self._ready.append(task)
+
+    async def _resume(self, task: ScriptTask, awaitable):
+        try:
+            value = await awaitable
+        except Exception as e:
+            self._finish(task, e)
+        else:
+            task.machine.push_operand(value)
+            self._ready.append(task)
+        finally:
+            self._waiting -= 1
+            self._wakeup.set()
+
+    def _finish(self, task: ScriptTask, error: Exception = None):
+        task.error = error
+        task._finished.set()